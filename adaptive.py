@@ -0,0 +1,164 @@
+import argparse
+import time
+
+import numpy as np
+
+# Steps of the R2 low-discrepancy sequence. Extra sample n of a pixel sits at
+# frac(shift + n * R2) - 0.5 pixels from its center, with a random shift per
+# pixel: however many samples a pixel has so far, they cover it evenly.
+R2 = np.array([1 / 1.324717957244746, 1 / 1.324717957244746 ** 2])
+
+def find_edges(ids, depth, depth_threshold=0.05):
+    """Pixels whose object id differs from a 4-neighbour's, or whose depth
+    differs from a neighbour on the same object by more than depth_threshold
+    (relative). ids is 0 (or False) where the ray missed everything.
+    """
+    edges = np.zeros(ids.shape, dtype=bool)
+    for axis in (0, 1):
+        head = (slice(None),) * axis + (slice(None, -1),)
+        tail = (slice(None),) * axis + (slice(1, None),)
+        near, far = depth[head], depth[tail]
+        differ = ids[head] != ids[tail]
+        differ |= (ids[head] != 0) & (np.abs(near - far) > depth_threshold * np.minimum(near, far))
+        edges[head] |= differ
+        edges[tail] |= differ
+    return edges
+
+class AdaptiveSampler:
+    """Supersample only the pixels on silhouettes and depth edges.
+
+    render(trace, state) takes trace(dirs), which shades any (..., 3) array
+    of ray directions for the current frame and returns (colors, ids,
+    depth). Every frame traces one ray per pixel through the pixel centers
+    of ray_dirs, finds the edges in the ids and depth it returns and adds
+    jittered samples (`samples` in all) to the edge pixels only. While the
+    scene state passed to render() stays the same, each further frame keeps
+    refining the same accumulation buffer instead: one more sample for
+    every pixel, `samples` more for edge pixels, until pixels reach
+    max_samples and the frame costs nothing.
+
+    Rays start at the origin (the engine's camera); jittered rays go
+    through the plane z = -1 that the grid's rays cross at pixel centers.
+    """
+
+    def __init__(self, ray_dirs, samples=4, max_samples=16, depth_threshold=0.05, seed=0):
+        self.ray_dirs = ray_dirs
+        self.samples = samples
+        self.max_samples = max_samples
+        self.depth_threshold = depth_threshold
+        self.plane = ray_dirs / np.abs(ray_dirs[..., 2:])
+        rows, cols = ray_dirs.shape[:2]
+        self.step_x = (self.plane[0, -1] - self.plane[0, 0]) / (cols - 1)
+        self.step_y = (self.plane[-1, 0] - self.plane[0, 0]) / (rows - 1)
+        self.shift = np.random.default_rng(seed).random((rows, cols, 2))
+        # zeros_like keeps the grid's memory order, see present.surface_order().
+        self.color = np.zeros_like(ray_dirs)
+        self.image = np.zeros_like(ray_dirs)
+        self.count = np.zeros((rows, cols), dtype=np.int32)
+        self.edges = np.zeros((rows, cols), dtype=bool)
+        self.state = None
+        self.traced = 0
+
+    def render(self, trace, state=()):
+        """The accumulated image; `state` (e.g. object and light positions)
+        decides whether the last frame's samples are still valid."""
+        state = [np.array(value, dtype=float) for value in state]
+        static = self.state is not None and len(state) == len(self.state) and all(
+            np.array_equal(a, b) for a, b in zip(state, self.state))
+        self.state = state
+        self.traced = 0
+        if not static:
+            self.trace_centers(trace)
+            self.add_samples(trace, self.edges, self.samples - 1, self.max_samples)
+        else:
+            open_ = self.count < self.max_samples
+            self.add_samples(trace, open_ & self.edges, self.samples, self.max_samples)
+            self.add_samples(trace, open_ & ~self.edges, 1, self.max_samples)
+        return np.divide(self.color, self.count[..., np.newaxis], out=self.image)
+
+    def supersample(self, trace, samples):
+        """Plain supersampling: `samples` rays in every pixel, for comparison."""
+        self.state = None
+        self.traced = 0
+        self.trace_centers(trace)
+        self.add_samples(trace, np.ones_like(self.edges), samples - 1)
+        return np.divide(self.color, self.count[..., np.newaxis], out=self.image)
+
+    def trace_centers(self, trace):
+        color, ids, depth = trace(self.ray_dirs)
+        np.copyto(self.color, color)
+        self.count.fill(1)
+        self.edges = find_edges(np.asarray(ids), depth, self.depth_threshold)
+        self.traced += self.count.size
+
+    def add_samples(self, trace, mask, samples, limit=None):
+        """Add `samples` jittered samples to the pixels in mask, none past `limit` per pixel."""
+        rows, cols = np.nonzero(mask)
+        if samples <= 0 or not len(rows):
+            return
+        # (samples, pixels, 2) offsets from the pixel centers.
+        index = self.count[rows, cols] + np.arange(samples)[:, np.newaxis]
+        offset = (self.shift[rows, cols] + index[..., np.newaxis] * R2) % 1.0 - 0.5
+        points = self.plane[rows, cols] + offset[..., :1] * self.step_x + offset[..., 1:] * self.step_y
+        points /= np.linalg.norm(points, axis=-1, keepdims=True)
+        if limit is None or index[-1].max() < limit:
+            colors = trace(points)[0]
+            taken = np.full(len(rows), samples)
+        else:
+            take = index < limit
+            colors = np.zeros(points.shape, dtype=self.color.dtype)
+            colors[take] = trace(points[take])[0]
+            taken = take.sum(axis=0)
+        self.color[rows, cols] += colors.sum(axis=0)
+        self.count[rows, cols] += taken
+        self.traced += int(taken.sum())
+
+    def heatmap(self):
+        """Samples per pixel as a blue (1) to red (max_samples) image."""
+        level = np.log2(self.count) / np.log2(self.max_samples)
+        np.clip(level, 0.0, 1.0, out=level)
+        return np.stack([level, np.zeros_like(level), 1.0 - level], axis=-1)
+
+def main():
+    from bench import parse_resolution
+    from engines import load_engine
+
+    parser = argparse.ArgumentParser(description="Adaptive vs uniform supersampling on the deepseek scene.")
+    parser.add_argument("--size", type=parse_resolution, default=(320, 320), metavar="WxH")
+    parser.add_argument("--time", type=float, default=0.5)
+    parser.add_argument("--reference", type=int, default=64, help="samples per pixel of the reference image")
+    parser.add_argument("--static-frames", type=int, default=15)
+    args = parser.parse_args()
+
+    deepseek = load_engine("deepseek")
+    width, height = args.size
+    ray_dirs = deepseek.make_ray_dirs(width, height)
+    trace = lambda dirs: deepseek.trace_frame(args.time, dirs, aspect_ratio=width / height)
+    state = deepseek.scene_state(args.time)
+
+    reference = AdaptiveSampler(ray_dirs).supersample(trace, args.reference).copy()
+    edges = find_edges(*trace(ray_dirs)[1:])
+
+    def run(name, render, frames=1):
+        start = time.perf_counter()
+        traced = 0
+        for _ in range(frames):
+            image = render()
+            traced += sampler.traced
+        elapsed = (time.perf_counter() - start) / frames
+        error = np.abs(image - reference).mean(axis=-1)
+        print("%-22s %9.2f ms %9d rays %12.5f %12.5f" % (
+            name, elapsed * 1000, traced // frames, error.mean(), error[edges].mean()))
+
+    print("%d edge pixels of %d; mean abs error against %d spp" % (edges.sum(), edges.size, args.reference))
+    print("%-22s %12s %14s %12s %12s" % ("", "time/frame", "rays/frame", "all pixels", "edge pixels"))
+    with np.errstate(all="ignore"):
+        sampler = AdaptiveSampler(ray_dirs)
+        run("1 spp", lambda: sampler.supersample(trace, 1))
+        run("4x SSAA", lambda: sampler.supersample(trace, 4))
+        sampler = AdaptiveSampler(ray_dirs, samples=4)
+        run("adaptive", lambda: sampler.render(trace, state))
+        run("adaptive, +%d static" % args.static_frames, lambda: sampler.render(trace, state), args.static_frames)
+
+if __name__ == "__main__":
+    main()
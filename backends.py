@@ -0,0 +1,262 @@
+import argparse
+import logging
+import math
+
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+else:
+    # With TBB the process can hang at exit once kernels have run on a
+    # thread other than the main one (pipeline.py's render worker).
+    numba.config.THREADING_LAYER_PRIORITY = ["omp", "workqueue", "tbb"]
+
+log = logging.getLogger(__name__)
+
+# A backend renders whole frames of an engine module: gpt_frame(module, t,
+# ray_dir) returns test-gpt.py's uint8 image, deepseek_frame(module, t,
+# ray_dirs, aspect_ratio) test-deepseek.py's float image. Scene constants are
+# read from the module, so every backend draws the same scene.
+
+class NumpyBackend:
+    """The engines' own NumPy kernels."""
+
+    name = "numpy"
+
+    def gpt_frame(self, module, time_elapsed, ray_dir):
+        return module.trace_rays(time_elapsed, ray_dir)
+
+    def deepseek_frame(self, module, time, ray_dirs, aspect_ratio=None):
+        return module.render_frame(time, ray_dirs, aspect_ratio)
+
+class NumbaBackend:
+    """Fused per-pixel kernels compiled with Numba, parallel over rows.
+
+    Each pixel runs intersection, shadow ray and shading in one pass with
+    no intermediate arrays. The kernels are compiled on first use (and
+    cached on disk), and drop the GIL while they run.
+    """
+
+    name = "numba"
+
+    def __init__(self):
+        if numba is None:
+            raise ImportError("numba is not installed")
+        self.kernels = None
+
+    def compile(self):
+        if self.kernels is None:
+            self.kernels = _compile_kernels()
+        return self.kernels
+
+    def gpt_frame(self, module, time_elapsed, ray_dir):
+        sphere_center, light_pos = module.scene_at(time_elapsed)
+        ray_dir, swapped = _row_major(ray_dir)
+        out = np.empty(ray_dir.shape[:2] + (3,), dtype=np.uint8)
+        self.compile()["gpt"](
+            ray_dir, module.CAMERA, sphere_center,
+            float(module.SPHERE_RADIUS), module.PLANE_POINT, module.PLANE_NORMAL, light_pos,
+            module.MATERIALS.rows[1], module.MATERIALS.rows[2],
+            module.BACKGROUND_COLOR, out)
+        return out.swapaxes(0, 1) if swapped else out
+
+    def deepseek_frame(self, module, time, ray_dirs, aspect_ratio=None):
+        sphere_center, light_pos = module.scene_state(time)
+        if aspect_ratio is None:
+            aspect_ratio = ray_dirs.shape[1] / ray_dirs.shape[0]
+        ray_dirs, swapped = _row_major(ray_dirs)
+        out = np.empty(ray_dirs.shape[:2] + (3,))
+        self.compile()["deepseek"](
+            ray_dirs, sphere_center,
+            float(module.sphere_radius), light_pos, np.asarray(module.sphere_color, dtype=float),
+            np.asarray(module.sphere_specular, dtype=float), float(module.shininess),
+            np.asarray(module.light_color, dtype=float), float(module.ambient_intensity),
+            np.asarray(module.background, dtype=float), float(aspect_ratio), out)
+        return out.swapaxes(0, 1) if swapped else out
+
+def _row_major(grid):
+    """A float64 (rows, cols, 3) grid the kernels can walk in memory order.
+
+    Grids stored column by column, such as present.surface_order() ones, come
+    back as their transposed view and swapped=True rather than as a copy; a
+    kernel shades pixels independently, so the caller only swaps the
+    frame's axes back.
+    """
+    swapped = grid.strides[0] < grid.strides[1]
+    if swapped:
+        grid = grid.swapaxes(0, 1)
+    return np.ascontiguousarray(grid, dtype=np.float64), swapped
+
+BACKENDS = {"numpy": NumpyBackend, "numba": NumbaBackend}
+
+def get_backend(name="auto"):
+    """Backend by name; "auto" (or an unavailable "numba") falls back to NumPy."""
+    if name in ("auto", "numba"):
+        try:
+            return NumbaBackend()
+        except ImportError as error:
+            if name == "numba":
+                log.warning("%s; falling back to the NumPy backend", error)
+    return NumpyBackend()
+
+def _compile_kernels():
+    jit = numba.njit(cache=True, nogil=True)
+
+    @jit
+    def normalize(x, y, z):
+        # Same epsilon as test-gpt.py's normalize().
+        norm = math.sqrt(x * x + y * y + z * z) + 1e-8
+        return x / norm, y / norm, z / norm
+
+    @jit
+    def sphere_t(ox, oy, oz, dx, dy, dz, cx, cy, cz, radius):
+        ocx, ocy, ocz = ox - cx, oy - cy, oz - cz
+        b = 2.0 * (dx * ocx + dy * ocy + dz * ocz)
+        c = ocx * ocx + ocy * ocy + ocz * ocz - radius * radius
+        discriminant = b * b - 4 * c
+        if discriminant < 0:
+            return np.inf
+        sqrt_disc = math.sqrt(discriminant)
+        t0 = (-b - sqrt_disc) / 2.0
+        t1 = (-b + sqrt_disc) / 2.0
+        t = t0 if t0 > 1e-3 else np.inf
+        if t1 > 1e-3 and t1 < t:
+            t = t1
+        return t
+
+    @jit
+    def plane_t(ox, oy, oz, dx, dy, dz, point, normal):
+        denom = dx * normal[0] + dy * normal[1] + dz * normal[2]
+        if abs(denom) <= 1e-6:
+            return np.inf
+        t = ((point[0] - ox) * normal[0] + (point[1] - oy) * normal[1]
+             + (point[2] - oz) * normal[2]) / denom
+        return t if t > 1e-3 else np.inf
+
+    @numba.njit(cache=True, nogil=True, parallel=True)
+    def gpt(ray_dir, origin, center, radius, plane_point, plane_normal, light,
+            sphere_material, plane_material, background, out):
+        height, width = ray_dir.shape[:2]
+        ox, oy, oz = origin[0], origin[1], origin[2]
+        cx, cy, cz = center[0], center[1], center[2]
+        for j in numba.prange(height):
+            for i in range(width):
+                dx, dy, dz = ray_dir[j, i, 0], ray_dir[j, i, 1], ray_dir[j, i, 2]
+                t_sphere = sphere_t(ox, oy, oz, dx, dy, dz, cx, cy, cz, radius)
+                t_plane = plane_t(ox, oy, oz, dx, dy, dz, plane_point, plane_normal)
+                if t_sphere == t_plane:
+                    for k in range(3):
+                        out[j, i, k] = np.uint8(min(max(background[k], 0.0), 1.0) * 255)
+                    continue
+                t = min(t_sphere, t_plane)
+                px, py, pz = ox + dx * t, oy + dy * t, oz + dz * t
+                if t_sphere < t_plane:
+                    material = sphere_material
+                    nx, ny, nz = normalize(px - cx, py - cy, pz - cz)
+                else:
+                    material = plane_material
+                    nx, ny, nz = plane_normal[0], plane_normal[1], plane_normal[2]
+                vx, vy, vz = normalize(ox - px, oy - py, oz - pz)
+                lx, ly, lz = light[0] - px, light[1] - py, light[2] - pz
+                dist_to_light = math.sqrt(lx * lx + ly * ly + lz * lz)
+                lx, ly, lz = normalize(lx, ly, lz)
+                sx, sy, sz = px + nx * 1e-3, py + ny * 1e-3, pz + nz * 1e-3
+                t_shadow = min(sphere_t(sx, sy, sz, lx, ly, lz, cx, cy, cz, radius),
+                               plane_t(sx, sy, sz, lx, ly, lz, plane_point, plane_normal))
+                dot_nl = nx * lx + ny * ly + nz * lz
+                rx, ry, rz = normalize(2 * dot_nl * nx - lx, 2 * dot_nl * ny - ly, 2 * dot_nl * nz - lz)
+                dot_nl = max(dot_nl, 0.0)
+                dot_rv = max(rx * vx + ry * vy + rz * vz, 0.0)
+                lit = t_shadow >= dist_to_light
+                specular = material[5] * dot_rv ** material[6] if lit else 0.0
+                for k in range(3):
+                    shade = material[3] * material[k]
+                    if lit:
+                        shade += material[4] * material[k] * dot_nl + specular
+                    out[j, i, k] = np.uint8(min(max(shade, 0.0), 1.0) * 255)
+
+    @numba.njit(cache=True, nogil=True, parallel=True)
+    def deepseek(ray_dirs, center, radius, light, sphere_color, sphere_specular, shininess,
+                 light_color, ambient, background, aspect_ratio, out):
+        height, width = ray_dirs.shape[:2]
+        cx, cy, cz = center[0], center[1], center[2]
+        for j in numba.prange(height):
+            for i in range(width):
+                dx, dy, dz = ray_dirs[j, i, 0], ray_dirs[j, i, 1], ray_dirs[j, i, 2]
+                pixel = (0.0, 0.0, 0.0)
+                b = -2 * (dx * cx + dy * cy + dz * cz)
+                c = cx * cx + cy * cy + cz * cz - radius * radius
+                discriminant = b * b - 4 * c
+                if discriminant >= 0:
+                    sqrt_disc = math.sqrt(discriminant)
+                    t0 = (-b - sqrt_disc) / 2
+                    t1 = (-b + sqrt_disc) / 2
+                    if t0 > 0 and t1 > 0:
+                        t = min(t0, t1)
+                    else:
+                        t = t0 if t0 > 0 else t1
+                    if t > 0:
+                        px, py, pz = t * dx, t * dy, t * dz
+                        nx, ny, nz = (px - cx) / radius, (py - cy) / radius, (pz - cz) / radius
+                        lx, ly, lz = light[0] - px, light[1] - py, light[2] - pz
+                        l_len = math.sqrt(lx * lx + ly * ly + lz * lz)
+                        lx, ly, lz = lx / l_len, ly / l_len, lz / l_len
+                        n_dot_l = max(nx * lx + ny * ly + nz * lz, 0.0)
+                        rx, ry, rz = 2 * n_dot_l * nx - lx, 2 * n_dot_l * ny - ly, 2 * n_dot_l * nz - lz
+                        p_len = math.sqrt(px * px + py * py + pz * pz)
+                        r_dot_v = max(-(rx * px + ry * py + rz * pz) / p_len, 0.0)
+                        specular = r_dot_v ** shininess
+                        pixel = (
+                            min(max(ambient * sphere_color[0] + n_dot_l * light_color[0] * sphere_color[0]
+                                    + specular * light_color[0] * sphere_specular[0], 0.0), 1.0),
+                            min(max(ambient * sphere_color[1] + n_dot_l * light_color[1] * sphere_color[1]
+                                    + specular * light_color[1] * sphere_specular[1], 0.0), 1.0),
+                            min(max(ambient * sphere_color[2] + n_dot_l * light_color[2] * sphere_color[2]
+                                    + specular * light_color[2] * sphere_specular[2], 0.0), 1.0),
+                        )
+                distance = math.sqrt(dx * dx + (dy * aspect_ratio) ** 2 + dz * dz)
+                soft = min(max(1.0 - (distance - radius) * 0.5, 0.0), 1.0)
+                for k in range(3):
+                    out[j, i, k] = background[k] * (1 - soft) + pixel[k] * soft
+
+    return {"gpt": gpt, "deepseek": deepseek}
+
+def main():
+    from bench import format_table, measure, parse_resolution
+    from engines import load_engine
+
+    parser = argparse.ArgumentParser(description="Compare compute backends on the same scenes.")
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument("--resolutions", nargs="+", type=parse_resolution,
+                        default=[(320, 320), (1280, 720), (1920, 1080)], metavar="WxH")
+    parser.add_argument("--frames", type=int, default=20)
+    args = parser.parse_args()
+
+    backends = []
+    for name in args.backends:
+        try:
+            backends.append(BACKENDS[name]())
+        except ImportError as error:
+            print("skipping %s backend: %s" % (name, error))
+    gpt = load_engine("gpt")
+    deepseek = load_engine("deepseek")
+    results = []
+    with np.errstate(all="ignore"):
+        for width, height in args.resolutions:
+            gpt_rays = gpt.camera_rays(width, height)
+            deepseek_rays = deepseek.make_ray_dirs(width, height)
+            for backend in backends:
+                frames = {
+                    "gpt": lambda i: backend.gpt_frame(gpt, i / 60.0, gpt_rays),
+                    "deepseek": lambda i: backend.deepseek_frame(deepseek, i * 0.02, deepseek_rays),
+                }
+                for engine, frame in frames.items():
+                    result = {"engine": "%s/%s" % (engine, backend.name), "width": width, "height": height}
+                    result.update(measure(frame, args.frames))
+                    results.append(result)
+    print(format_table(results))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+import argparse
+import json
+import time
+import tracemalloc
+
+import numpy as np
+
+from engines import ENGINES, headless_display, headless_gl, load_engine
+
+RESOLUTIONS = ((320, 320), (640, 480), (1280, 720), (1920, 1080))
+
+# Each setup function prepares an engine for one resolution and returns a
+# callable that renders frame number i without touching a real display.
+
+def setup_gpt(module, width, height):
+    return lambda i: module.render_scene(i / 60.0, width, height)
+
+def setup_gpt_renderer(module, width, height):
+    renderer = module.Renderer(width, height)
+    return lambda i: renderer.render(i / 60.0)
+
+def setup_deepseek(module, width, height):
+    ray_dirs = module.make_ray_dirs(width, height)
+    return lambda i: module.render_frame(i * 0.02, ray_dirs)
+
+def setup_gemini(module, width, height):
+    headless_gl(module)
+    module.width, module.height = width, height
+    return lambda i: module.render_frame(0.8 * np.sin(i * 0.0125))
+
+def setup_grok(module, width, height):
+    headless_gl(module)
+    module.WIDTH, module.HEIGHT = width, height
+    return lambda i: module.display()
+
+def setup_llama(module, width, height):
+    import pygame
+    screen = pygame.Surface((width, height))
+    sphere = module.Sphere(np.array([0.0, 0.0, -5.0]), 1.0)
+    return lambda i: module.render(sphere, screen)
+
+def setup_mistral(module, width, height):
+    headless_gl(module)
+    module.WIDTH, module.HEIGHT = width, height
+    return lambda i: module.display()
+
+def setup_phi4(module, width, height):
+    headless_gl(module)
+    headless_display(width, height)
+
+    def frame(i):
+        module.update_sphere_position()
+        module.render_scene()
+    return frame
+
+# Benchmark case -> (engine script, setup function).
+SETUPS = {name: (name, globals()["setup_" + name]) for name in ENGINES}
+SETUPS["gpt-renderer"] = ("gpt", setup_gpt_renderer)
+
+def measure(frame, frames, max_seconds=float("inf")):
+    """Time frame(i) for up to `frames` frames and return fps/p50/p99/peak memory."""
+    frame(0)  # warm-up: first-call caches, lazy imports
+
+    times = []
+    start = time.perf_counter()
+    for i in range(1, frames + 1):
+        t0 = time.perf_counter()
+        frame(i)
+        times.append(time.perf_counter() - t0)
+        if time.perf_counter() - start > max_seconds:
+            break
+    total = time.perf_counter() - start
+
+    # Peak memory is measured on a separate frame so tracemalloc's own
+    # overhead does not leak into the timings above.
+    tracemalloc.start()
+    frame(len(times) + 1)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    times_ms = np.array(times) * 1000.0
+    return {
+        "frames": len(times),
+        "fps": len(times) / total,
+        "p50_ms": float(np.percentile(times_ms, 50)),
+        "p99_ms": float(np.percentile(times_ms, 99)),
+        "peak_mb": peak / 2**20,
+    }
+
+def run_case(engine, width, height, frames, max_seconds):
+    script, setup = SETUPS[engine]
+    frame = setup(load_engine(script), width, height)
+    result = {"engine": engine, "width": width, "height": height}
+    result.update(measure(frame, frames, max_seconds))
+    return result
+
+def run_sphere_case(count, width, height, frames, max_seconds):
+    module = load_engine("gpt")
+    scene = module.random_sphere_scene(count)
+    frame = lambda i: module.render_sphere_scene(scene, i / 60.0, width, height)
+    result = {"engine": "gpt-bvh/%d" % count, "spheres": count, "width": width, "height": height}
+    result.update(measure(frame, frames, max_seconds))
+    return result
+
+def run_batch_case(max_mb, width, height, frames, max_seconds):
+    module = load_engine("gpt")
+    times = np.arange(frames) / 60.0
+    for _ in module.render_scenes(times[:1], width, height):  # warm-up
+        pass
+
+    chunks = module.render_scenes(times, width, height, max_mb * 2**20)
+    per_frame = []
+    start = time.perf_counter()
+    while time.perf_counter() - start <= max_seconds:
+        t0 = time.perf_counter()
+        chunk = next(chunks, None)
+        if chunk is None:
+            break
+        per_frame += [(time.perf_counter() - t0) / len(chunk)] * len(chunk)
+    total = time.perf_counter() - start
+
+    tracemalloc.start()
+    for _ in module.render_scenes(times, width, height, max_mb * 2**20):
+        break
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    times_ms = np.array(per_frame) * 1000.0
+    return {"engine": "gpt-batch/%dMB" % max_mb, "width": width, "height": height,
+            "frames": len(per_frame), "fps": len(per_frame) / total,
+            "p50_ms": float(np.percentile(times_ms, 50)), "p99_ms": float(np.percentile(times_ms, 99)),
+            "peak_mb": peak / 2**20}
+
+def format_table(results):
+    header = "%-14s %11s %7s %9s %10s %10s %9s" % (
+        "engine", "resolution", "frames", "fps", "p50 ms", "p99 ms", "peak MB")
+    lines = [header, "-" * len(header)]
+    for r in results:
+        lines.append("%-14s %11s %7d %9.2f %10.2f %10.2f %9.1f" % (
+            r["engine"], "%dx%d" % (r["width"], r["height"]), r["frames"],
+            r["fps"], r["p50_ms"], r["p99_ms"], r["peak_mb"]))
+    return "\n".join(lines)
+
+def parse_resolution(text):
+    width, height = text.lower().split("x")
+    return int(width), int(height)
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless benchmark of the test-*.py ray tracers.")
+    parser.add_argument("--engines", nargs="+", choices=SETUPS, default=list(SETUPS))
+    parser.add_argument("--resolutions", nargs="+", type=parse_resolution,
+                        default=list(RESOLUTIONS), metavar="WxH")
+    parser.add_argument("--frames", nargs="+", type=int, default=[30])
+    parser.add_argument("--max-seconds", type=float, default=30.0,
+                        help="stop a case early once it has run this long")
+    parser.add_argument("--spheres", nargs="+", type=int, metavar="N",
+                        help="instead of --engines, sweep the BVH sphere scene of test-gpt.py "
+                             "over these sphere counts")
+    parser.add_argument("--batch", nargs="+", type=int, metavar="MB",
+                        help="instead of --engines, render test-gpt.py's frames with render_scenes() "
+                             "in chunks of at most this many MB; p50/p99 are per frame of a chunk")
+    parser.add_argument("--json", metavar="PATH", help="also write the results as JSON")
+    args = parser.parse_args()
+
+    if args.spheres:
+        cases = [(run_sphere_case, count) for count in args.spheres]
+    elif args.batch:
+        cases = [(run_batch_case, max_mb) for max_mb in args.batch]
+    else:
+        cases = [(run_case, engine) for engine in args.engines]
+    results = []
+    for run, case in cases:
+        for width, height in args.resolutions:
+            for frames in args.frames:
+                results.append(run(case, width, height, frames, args.max_seconds))
+                print(format_table(results[-1:]).splitlines()[-1], flush=True)
+
+    print()
+    print(format_table(results))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+import numpy as np
+
+LEAF_SIZE = 4
+
+def sphere_hits(origins, ray_dirs, centers, radii):
+    """Nearest t > 1e-3 of each ray against its paired sphere (inf on a miss).
+
+    Same quadratic as intersect_sphere in test-gpt.py; directions are
+    assumed normalized.
+    """
+    oc = origins - centers
+    b = 2.0 * np.sum(ray_dirs * oc, axis=-1)
+    c = np.sum(oc * oc, axis=-1) - radii * radii
+    discriminant = b * b - 4 * c
+    sqrt_disc = np.sqrt(np.maximum(discriminant, 0.0))
+    t0 = (-b - sqrt_disc) / 2.0
+    t1 = (-b + sqrt_disc) / 2.0
+    t = np.where(t0 > 1e-3, t0, np.inf)
+    t = np.where((t1 > 1e-3) & (t1 < t), t1, t)
+    return np.where(discriminant >= 0, t, np.inf)
+
+class SphereBVH:
+    """Bounding volume hierarchy over spheres held as (N, 3)/(N,) arrays.
+
+    Nodes are stored as flat arrays in depth-first order, so a parent always
+    precedes its children. Leaves own a contiguous range of `order` (the
+    sphere indices sorted by the build). refit() recomputes the boxes for
+    moved spheres without changing the topology; build() re-splits.
+    """
+
+    def __init__(self, centers, radii, leaf_size=LEAF_SIZE):
+        self.leaf_size = leaf_size
+        self.build(centers, radii)
+
+    def build(self, centers, radii):
+        centers = np.asarray(centers, dtype=float)
+        radii = np.asarray(radii, dtype=float)
+        self.order = np.arange(len(centers))
+        left, right, start, count, depth = [], [], [], [], []
+        stack = [(0, len(centers), -1, 0, 0)]
+        while stack:
+            lo, hi, parent, side, level = stack.pop()
+            node = len(left)
+            left.append(-1)
+            right.append(-1)
+            start.append(lo)
+            count.append(0)
+            depth.append(level)
+            if parent >= 0:
+                (left if side == 0 else right)[parent] = node
+            if hi - lo <= self.leaf_size:
+                count[node] = hi - lo
+                continue
+            # Median split along the axis with the widest spread of centers.
+            idx = self.order[lo:hi]
+            axis = np.argmax(np.ptp(centers[idx], axis=0))
+            mid = (hi - lo) // 2
+            self.order[lo:hi] = idx[np.argpartition(centers[idx, axis], mid)]
+            stack.append((lo + mid, hi, node, 1, level + 1))
+            stack.append((lo, lo + mid, node, 0, level + 1))
+        self.left = np.array(left)
+        self.right = np.array(right)
+        self.start = np.array(start)
+        self.count = np.array(count)
+        self.depth = np.array(depth)
+        self.leaves = np.flatnonzero(self.count > 0)
+        self.levels = [np.flatnonzero((self.depth == d) & (self.count == 0))
+                       for d in range(self.depth.max(initial=0), -1, -1)]
+        self.refit(centers, radii)
+
+    def refit(self, centers, radii):
+        self.centers = np.asarray(centers, dtype=float)
+        self.radii = np.asarray(radii, dtype=float)
+        n_nodes = len(self.left)
+        self.box_min = np.empty((n_nodes, 3))
+        self.box_max = np.empty((n_nodes, 3))
+        if not len(self.centers):
+            self.box_min.fill(np.inf)
+            self.box_max.fill(-np.inf)
+            return
+        sorted_centers = self.centers[self.order]
+        sorted_radii = self.radii[self.order, np.newaxis]
+        starts = self.start[self.leaves]
+        self.box_min[self.leaves] = np.minimum.reduceat(sorted_centers - sorted_radii, starts)
+        self.box_max[self.leaves] = np.maximum.reduceat(sorted_centers + sorted_radii, starts)
+        # Internal nodes bottom-up, one vectorized pass per tree level.
+        for nodes in self.levels:
+            l, r = self.left[nodes], self.right[nodes]
+            self.box_min[nodes] = np.minimum(self.box_min[l], self.box_min[r])
+            self.box_max[nodes] = np.maximum(self.box_max[l], self.box_max[r])
+
+    def intersect(self, origins, ray_dirs, t_max=None, any_hit=False):
+        """Trace a batch of rays through the hierarchy.
+
+        origins is (3,) or (R, 3), ray_dirs is (R, 3). Returns (t, index):
+        the nearest hit distance per ray (inf on a miss) and the sphere
+        index (-1 on a miss). Hits at or beyond t_max are ignored. With
+        any_hit=True a ray stops at its first hit, which is all shadow
+        rays need.
+        """
+        ray_dirs = np.asarray(ray_dirs, dtype=float)
+        n_rays = len(ray_dirs)
+        origins = np.broadcast_to(origins, ray_dirs.shape)
+        t_best = np.full(n_rays, np.inf) if t_max is None else np.array(t_max, dtype=float)
+        index = np.full(n_rays, -1)
+        if n_rays == 0 or not len(self.order):
+            return np.full(n_rays, np.inf), index
+        with np.errstate(divide="ignore", invalid="ignore"):
+            inv_dirs = 1.0 / ray_dirs
+
+        # Breadth-first over (ray, node) pairs: every level of the tree is
+        # one batch of slab tests for all rays still alive in it.
+        rays = np.arange(n_rays)
+        nodes = np.zeros(n_rays, dtype=np.intp)
+        while len(rays):
+            o, inv = origins[rays], inv_dirs[rays]
+            with np.errstate(invalid="ignore"):
+                t1 = (self.box_min[nodes] - o) * inv
+                t2 = (self.box_max[nodes] - o) * inv
+            lo, hi = np.fmin(t1, t2), np.fmax(t1, t2)
+            t_near = np.fmax(np.fmax(lo[:, 0], lo[:, 1]), lo[:, 2])
+            t_far = np.fmin(np.fmin(hi[:, 0], hi[:, 1]), hi[:, 2])
+            keep = (t_near <= t_far) & (t_far > 1e-3) & (t_near < t_best[rays])
+            if any_hit:
+                keep &= index[rays] < 0
+            rays, nodes = rays[keep], nodes[keep]
+
+            leaf = self.count[nodes] > 0
+            leaf_rays, leaf_nodes = rays[leaf], nodes[leaf]
+            if len(leaf_rays):
+                counts = self.count[leaf_nodes]
+                pair_rays = np.repeat(leaf_rays, counts)
+                offsets = np.arange(len(pair_rays)) - np.repeat(np.cumsum(counts) - counts, counts)
+                spheres = self.order[np.repeat(self.start[leaf_nodes], counts) + offsets]
+                t = sphere_hits(origins[pair_rays], ray_dirs[pair_rays],
+                                self.centers[spheres], self.radii[spheres])
+                closer = t < t_best[pair_rays]
+                pair_rays, spheres, t = pair_rays[closer], spheres[closer], t[closer]
+                np.minimum.at(t_best, pair_rays, t)
+                winner = t == t_best[pair_rays]
+                index[pair_rays[winner]] = spheres[winner]
+
+            inner = ~leaf
+            rays = np.concatenate((rays[inner], rays[inner]))
+            nodes = np.concatenate((self.left[nodes[inner]], self.right[nodes[inner]]))
+        return np.where(index >= 0, t_best, np.inf), index
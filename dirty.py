@@ -0,0 +1,84 @@
+import numpy as np
+
+FULL_FRAME = "full"
+
+def tangent_slopes(lateral, depth, radius):
+    """Slopes lateral/depth of the two camera planes tangent to a sphere.
+
+    Returns (low, high), None when the sphere is entirely behind the
+    camera, or FULL_FRAME when it straddles the camera plane and cannot be
+    bounded this way.
+    """
+    if depth < -radius:
+        return None
+    denom = depth * depth - radius * radius
+    if depth <= 0 or denom <= 0:
+        return FULL_FRAME
+    root = radius * np.sqrt(lateral * lateral + denom)
+    return (lateral * depth - root) / denom, (lateral * depth + root) / denom
+
+class DirtyRegionTracker:
+    """Work out which part of a frame a moving sphere can have changed.
+
+    Built from the engine's ray grid: rays start at the origin, the first
+    grid axis varies with ray component axes[0], the second with axes[1],
+    and the camera looks along `forward` (+1 or -1) on z. For every frame
+    dirty_region() returns the grid rectangle (a0, a1, b0, b1) covering the
+    sphere now and in the previous frame, None when nothing needs
+    re-tracing, or the whole grid on the first frame and whenever
+    `static_state` (light, camera, ...) differs from the last frame.
+    """
+
+    def __init__(self, ray_grid, axes=(1, 0), forward=-1):
+        depth0 = forward * ray_grid[:, 0, 2]
+        depth1 = forward * ray_grid[0, :, 2]
+        self.slopes = (ray_grid[:, 0, axes[0]] / depth0, ray_grid[0, :, axes[1]] / depth1)
+        self.axes = axes
+        self.forward = forward
+        self.shape = ray_grid.shape[:2]
+        self.previous = None
+        self.static_state = None
+        self.traced = 0
+        self.total = 0
+
+    @property
+    def skipped_fraction(self):
+        return 1.0 - self.traced / self.total if self.total else 0.0
+
+    def sphere_bounds(self, center, radius):
+        bounds = []
+        for slopes, axis in zip(self.slopes, self.axes):
+            interval = tangent_slopes(center[axis], self.forward * center[2], radius)
+            if interval is None or interval is FULL_FRAME:
+                return interval
+            # One extra ray on each side absorbs rounding at the silhouette.
+            inside = np.flatnonzero((slopes >= interval[0]) & (slopes <= interval[1]))
+            if not len(inside):
+                return None
+            bounds += [max(inside[0] - 1, 0), min(inside[-1] + 2, len(slopes))]
+        return tuple(bounds)
+
+    def dirty_region(self, center, radius, static_state=()):
+        full = (0, self.shape[0], 0, self.shape[1])
+        static_state = [np.array(value, dtype=float) for value in static_state]
+        changed = self.static_state is None or any(
+            not np.array_equal(a, b) for a, b in zip(static_state, self.static_state))
+        self.static_state = static_state
+
+        current = self.sphere_bounds(center, radius)
+        region = full
+        if current is FULL_FRAME:
+            current = full
+        elif not changed:
+            previous = self.previous
+            if current is None or previous is None:
+                region = current or previous
+            else:
+                region = (min(current[0], previous[0]), max(current[1], previous[1]),
+                          min(current[2], previous[2]), max(current[3], previous[3]))
+        self.previous = current
+
+        self.total += self.shape[0] * self.shape[1]
+        if region is not None:
+            self.traced += (region[1] - region[0]) * (region[3] - region[2])
+        return region
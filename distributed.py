@@ -0,0 +1,332 @@
+import argparse
+import collections
+import json
+import queue
+import socket
+import struct
+import subprocess
+import sys
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from export import EXPORTS
+
+# Coordinator/worker rendering of an animation over TCP. Every message is a
+# JSON header plus an optional binary payload, each preceded by its length:
+#
+#   worker                          coordinator
+#   hello                     ->
+#                             <-    job (engine, size, times, zlib level)
+#   ready                     ->
+#                             <-    range (start, end) | wait | done
+#   frame (index) + zlib data ->
+#                             <-    ack (end of the worker's range)
+#
+# A worker renders its range frame by frame and asks for more once it
+# reaches `end`. The ack carries the current end, which shrinks when an idle
+# worker has stolen the rest of the range.
+
+def send_message(sock, header, payload=b""):
+    data = json.dumps(header).encode()
+    sock.sendall(struct.pack(">II", len(data), len(payload)) + data + payload)
+
+def _recv_exact(sock, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(min(size - len(data), 1 << 20))
+        if not chunk:
+            raise ConnectionError("connection closed")
+        data += chunk
+    return bytes(data)
+
+def recv_message(sock):
+    header_size, payload_size = struct.unpack(">II", _recv_exact(sock, 8))
+    header = json.loads(_recv_exact(sock, header_size))
+    return header, _recv_exact(sock, payload_size)
+
+class Coordinator:
+    """Hand out frame ranges of an offline render to workers over TCP.
+
+    Pending frames are split into ranges of `chunk` frames and given to
+    workers as they ask for work. Once none are left, an idle worker steals
+    the second half of the largest range still being rendered. When a worker
+    disconnects or goes `timeout` seconds without a frame, the frames it had
+    not returned go back to the front of the queue; a frame whose workers
+    failed max_attempts times fails the render. No work is handed out before
+    min_workers workers are ready.
+
+    frames() yields the (height, width, 3) uint8 frames in order, in the
+    orientation export.py writes them.
+    """
+
+    def __init__(self, engine, times, width, height, host="127.0.0.1", port=0, chunk=4,
+                 min_workers=1, timeout=60.0, max_attempts=3, level=1):
+        self.job = {"type": "job", "engine": engine, "width": width, "height": height,
+                    "times": [float(t) for t in times], "level": level}
+        self.count = len(self.job["times"])
+        self.pending = collections.deque((start, min(start + chunk, self.count))
+                                         for start in range(0, self.count, chunk))
+        # worker -> [next frame it will return, end of its range]
+        self.assigned = {}
+        self.done = set()
+        self.attempts = collections.Counter()
+        self.min_workers = min_workers
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.lock = threading.Lock()
+        self.go = threading.Event()
+        self.results = queue.Queue()
+        self.connected = 0
+        self.stats = {"workers": 0, "ready": 0, "failed": 0, "retried": 0, "stolen": 0,
+                      "frames": collections.Counter(), "bytes": 0, "compressed_bytes": 0}
+        self.started = None
+        self.server = socket.create_server((host, port))
+        self.address = self.server.getsockname()[:2]
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self.server.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn):
+        conn.settimeout(self.timeout)
+        with self.lock:
+            self.connected += 1
+            self.stats["workers"] += 1
+            worker = "worker-%d" % self.stats["workers"]
+        try:
+            recv_message(conn)  # hello
+            send_message(conn, self.job)
+            counted = False
+            while True:
+                header, payload = recv_message(conn)
+                if header["type"] == "ready":
+                    if not counted:
+                        counted = True
+                        self._ready()
+                    self.go.wait()
+                    work = self._next_range(worker)
+                    send_message(conn, work)
+                    if work["type"] == "done":
+                        return
+                elif header["type"] == "frame":
+                    frame = np.frombuffer(zlib.decompress(payload), dtype=np.uint8)
+                    send_message(conn, {"type": "ack", "end": self._store(
+                        worker, header["index"], frame.reshape(header["shape"]), len(payload))})
+        except (OSError, ValueError, KeyError, zlib.error):
+            self._fail(worker)
+        finally:
+            conn.close()
+            with self.lock:
+                self.connected -= 1
+
+    def _ready(self):
+        with self.lock:
+            self.stats["ready"] += 1
+            if self.stats["ready"] >= self.min_workers and not self.go.is_set():
+                self.started = time.perf_counter()
+                self.go.set()
+
+    def _next_range(self, worker):
+        with self.lock:
+            if len(self.done) == self.count:
+                return {"type": "done"}
+            if self.pending:
+                start, end = self.pending.popleft()
+            else:
+                victim = max(self.assigned.values(), key=lambda r: r[1] - r[0], default=None)
+                if victim is None or victim[1] - victim[0] < 2:
+                    # The last frames are in flight; they may still fail.
+                    return {"type": "wait", "seconds": 0.05}
+                # The victim keeps the frame it is rendering and the first half.
+                start, end = victim[0] + (victim[1] - victim[0] + 1) // 2, victim[1]
+                victim[1] = start
+                self.stats["stolen"] += 1
+            self.assigned[worker] = [start, end]
+            return {"type": "range", "start": start, "end": end}
+
+    def _store(self, worker, index, frame, compressed):
+        with self.lock:
+            if index not in self.done:
+                self.done.add(index)
+                self.results.put((index, frame))
+                self.stats["frames"][worker] += 1
+                self.stats["bytes"] += frame.nbytes
+                self.stats["compressed_bytes"] += compressed
+            work = self.assigned.get(worker)
+            if work is None:
+                return index + 1
+            work[0] = index + 1
+            if work[0] >= work[1]:
+                del self.assigned[worker]
+            return work[1]
+
+    def _fail(self, worker):
+        with self.lock:
+            self.stats["failed"] += 1
+            work = self.assigned.pop(worker, None)
+            if work is None or work[0] >= work[1]:
+                return
+            for index in range(*work):
+                self.attempts[index] += 1
+                if self.attempts[index] >= self.max_attempts:
+                    self.results.put(RuntimeError("frame %d failed %d times" % (index, self.max_attempts)))
+                    return
+            self.pending.appendleft(tuple(work))
+            self.stats["retried"] += work[1] - work[0]
+
+    def frames(self):
+        """Yield the frames in order as the workers stream them back.
+
+        Raises RuntimeError once every worker has gone with frames left.
+        """
+        waiting = {}
+        for index in range(self.count):
+            while index not in waiting:
+                try:
+                    item = self.results.get(timeout=0.5)
+                except queue.Empty:
+                    with self.lock:
+                        if self.go.is_set() and not self.connected:
+                            raise RuntimeError("no workers left with %d frames to render"
+                                               % (self.count - len(self.done)))
+                    continue
+                if isinstance(item, Exception):
+                    raise item
+                waiting[item[0]] = item[1]
+            yield waiting.pop(index)
+
+    def close(self):
+        self.server.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def run_worker(address, connect_timeout=10.0):
+    """Render ranges for the coordinator at (host, port) until it is done."""
+    from engines import load_engine
+
+    deadline = time.monotonic() + connect_timeout
+    while True:
+        try:
+            sock = socket.create_connection(address)
+            break
+        except ConnectionRefusedError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.1)
+    with sock:
+        send_message(sock, {"type": "hello"})
+        job = recv_message(sock)[0]
+        render = EXPORTS[job["engine"]](load_engine(job["engine"]), job["width"], job["height"])
+        times = job["times"]
+        rendered = 0
+        with np.errstate(all="ignore"):
+            while True:
+                send_message(sock, {"type": "ready"})
+                work = recv_message(sock)[0]
+                if work["type"] == "done":
+                    return rendered
+                if work["type"] == "wait":
+                    time.sleep(work["seconds"])
+                    continue
+                index, end = work["start"], work["end"]
+                while index < end:
+                    frame = np.ascontiguousarray(render(times[index]))
+                    send_message(sock, {"type": "frame", "index": index, "shape": frame.shape},
+                                 zlib.compress(frame.tobytes(), job["level"]))
+                    end = recv_message(sock)[0]["end"]
+                    index += 1
+                    rendered += 1
+
+def parse_address(text):
+    host, port = text.rsplit(":", 1)
+    return host, int(port)
+
+def spawn_workers(address, count):
+    """Start `count` local worker processes for the coordinator at address."""
+    return [subprocess.Popen([sys.executable, __file__, "worker", "%s:%d" % tuple(address)],
+                             stdout=subprocess.DEVNULL)
+            for _ in range(count)]
+
+def main():
+    from bench import parse_resolution
+    from export import FORMATS, AsyncFrameWriter
+
+    parser = argparse.ArgumentParser(description="Render an animation on workers over TCP.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    worker = commands.add_parser("worker", help="render frames for a coordinator")
+    worker.add_argument("address", type=parse_address, metavar="HOST:PORT")
+    coordinator = commands.add_parser("coordinator", help="hand out frames and write them to disk")
+    coordinator.add_argument("engine", choices=EXPORTS)
+    coordinator.add_argument("path", help="directory for png, file for raw and y4m")
+    coordinator.add_argument("--format", choices=FORMATS, default="png")
+    coordinator.add_argument("--listen", type=parse_address, default=("0.0.0.0", 5123), metavar="HOST:PORT")
+    coordinator.add_argument("--local-workers", type=int, default=0,
+                             help="also start this many workers on this machine")
+    scaling = commands.add_parser("bench", help="frames/sec with 1..N local workers")
+    scaling.add_argument("--engine", choices=EXPORTS, default="gpt")
+    scaling.add_argument("--workers", nargs="+", type=int, default=[1, 2, 4])
+    scaling.add_argument("--kill", action="store_true",
+                         help="kill one worker halfway through each run, and start a replacement, "
+                              "to exercise the retries")
+    for command in (coordinator, scaling):
+        command.add_argument("--start", type=float, default=0.0)
+        command.add_argument("--end", type=float, default=4.0)
+        command.add_argument("--fps", type=float, default=30)
+        command.add_argument("--size", type=parse_resolution, default=(320, 240), metavar="WxH")
+        command.add_argument("--chunk", type=int, default=4, help="frames per range handed out")
+    args = parser.parse_args()
+
+    if args.command == "worker":
+        print("%d frames rendered" % run_worker(args.address))
+        return
+
+    times = args.start + np.arange(int(round((args.end - args.start) * args.fps))) / args.fps
+    if args.command == "coordinator":
+        with Coordinator(args.engine, times, *args.size, *args.listen, chunk=args.chunk) as server:
+            print("listening on %s:%d" % server.address, flush=True)
+            processes = spawn_workers(server.address, args.local_workers)
+            with AsyncFrameWriter(FORMATS[args.format](args.path, args.fps)) as writer:
+                for frame in server.frames():
+                    writer.write(frame)
+        for process in processes:
+            process.wait()
+        print("%d frames in %.2f s, %s" % (len(times), time.perf_counter() - server.started,
+                                            dict(server.stats["frames"])))
+        return
+
+    print("%8s %9s %9s %8s %8s %8s %11s" % (
+        "workers", "fps", "speedup", "failed", "retried", "stolen", "compressed"))
+    base = None
+    for count in args.workers:
+        with Coordinator(args.engine, times, *args.size, chunk=args.chunk, min_workers=count) as server:
+            processes = spawn_workers(server.address, count)
+            for index, _ in enumerate(server.frames()):
+                if args.kill and index == len(times) // 2 and processes[0].poll() is None:
+                    # A replacement keeps the worker count, and with a single
+                    # worker someone left to take the requeued frames.
+                    processes[0].kill()
+                    processes += spawn_workers(server.address, 1)
+            elapsed = time.perf_counter() - server.started
+        for process in processes:
+            process.wait()
+        fps = len(times) / elapsed
+        base = base or fps
+        stats = server.stats
+        print("%8d %9.2f %8.2fx %8d %8d %8d %10.1f%%" % (
+            count, fps, fps / base, stats["failed"], stats["retried"], stats["stolen"],
+            100.0 * stats["compressed_bytes"] / stats["bytes"]))
+
+if __name__ == "__main__":
+    main()
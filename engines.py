@@ -0,0 +1,56 @@
+import importlib.util
+import os
+import sys
+
+# The SDL dummy driver lets pygame create surfaces and displays on a box
+# without a screen; it has to be selected before pygame is imported.
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+ENGINES = ("gpt", "deepseek", "gemini", "grok", "llama", "mistral", "phi4")
+
+def load_engine(name):
+    """Import test-<name>.py as a module without running its main loop."""
+    module_name = "engine_" + name
+    if module_name in sys.modules:
+        return sys.modules[module_name]
+    path = os.path.join(ROOT, "test-%s.py" % name)
+    spec = importlib.util.spec_from_file_location(module_name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+class NullGL:
+    """Stand-in for the GL/GLU/GLUT entry points of an engine module.
+
+    Every call is a no-op except glDrawPixels, whose pixel buffer is kept
+    as the offscreen frame so callers can inspect what would be uploaded.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.frame = None
+
+    def call(self, *args):
+        self.calls += 1
+
+    def draw_pixels(self, width, height, fmt, type_, data):
+        self.calls += 1
+        self.frame = data
+
+def headless_gl(module):
+    """Redirect every gl*/glu*/glut* function used by an engine to a NullGL."""
+    null = NullGL()
+    for name in dir(module):
+        if name.startswith("gl") and callable(getattr(module, name)):
+            setattr(module, name, null.call)
+    module.glDrawPixels = null.draw_pixels
+    return null
+
+def headless_display(width, height):
+    """Open a window on the dummy SDL driver and return its surface."""
+    import pygame
+    pygame.display.init()
+    return pygame.display.set_mode((width, height))
@@ -0,0 +1,203 @@
+import argparse
+import os
+import queue
+import resource
+import struct
+import threading
+import time
+import zlib
+
+import numpy as np
+
+# Offline export: render a time range at a fixed timestep without a window
+# and stream the frames to disk. Frames are (height, width, 3) uint8 arrays
+# in display order (top row first), oriented as the engine's window shows them.
+
+def png_bytes(frame, level=6):
+    """Encode an RGB uint8 frame as PNG with the standard library only."""
+    height, width = frame.shape[:2]
+    raw = np.zeros((height, width * 3 + 1), dtype=np.uint8)  # filter byte 0 per row
+    raw[:, 1:] = frame.reshape(height, -1)
+
+    def chunk(tag, data):
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data))
+
+    return (b"\x89PNG\r\n\x1a\n"
+            + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(raw.tobytes(), level))
+            + chunk(b"IEND", b""))
+
+def open_output(path):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    return open(path, "wb")
+
+class PngSequenceWriter:
+    def __init__(self, directory, pattern="frame_%05d.png"):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, pattern)
+        self.count = 0
+
+    def write(self, frame):
+        with open(self.path % self.count, "wb") as f:
+            f.write(png_bytes(frame))
+        self.count += 1
+
+    def close(self):
+        pass
+
+class RawWriter:
+    """Headerless rgb24 frames back to back, e.g. for ffmpeg -f rawvideo."""
+
+    def __init__(self, path):
+        self.file = open_output(path)
+
+    def write(self, frame):
+        self.file.write(np.ascontiguousarray(frame).data)
+
+    def close(self):
+        self.file.close()
+
+class Y4MWriter:
+    """YUV4MPEG2 stream, 4:4:4 BT.601 studio range."""
+
+    def __init__(self, path, fps):
+        self.file = open_output(path)
+        self.fps = fps
+        self.header_written = False
+
+    def write(self, frame):
+        height, width = frame.shape[:2]
+        if not self.header_written:
+            rate = "%d:1" % self.fps if float(self.fps).is_integer() else "%d:1000" % round(self.fps * 1000)
+            self.file.write(b"YUV4MPEG2 W%d H%d F%s Ip A1:1 C444\n" % (width, height, rate.encode()))
+            self.header_written = True
+        rgb = frame.astype(np.float32)
+        r, g, b = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+        y = 16 + (65.738 * r + 129.057 * g + 25.064 * b) / 256
+        u = 128 + (-37.945 * r - 74.494 * g + 112.439 * b) / 256
+        v = 128 + (112.439 * r - 94.154 * g - 18.285 * b) / 256
+        self.file.write(b"FRAME\n")
+        for plane in (y, u, v):
+            self.file.write(np.clip(np.rint(plane), 0, 255).astype(np.uint8).data)
+
+    def close(self):
+        self.file.close()
+
+FORMATS = {
+    "png": lambda path, fps: PngSequenceWriter(path),
+    "raw": lambda path, fps: RawWriter(path),
+    "y4m": Y4MWriter,
+}
+
+class AsyncFrameWriter:
+    """Run a writer's encoding and file I/O on a background thread.
+
+    write() copies the frame into a bounded queue and returns, so the
+    caller can render the next frame while this one is written; when the
+    queue is full it blocks, which keeps memory flat however long the
+    export runs. Errors raised by the writer resurface on the next
+    write() or on close().
+    """
+
+    def __init__(self, writer, queue_size=4):
+        self.writer = writer
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.error = None
+        self.blocked = 0.0
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while True:
+            frame = self.queue.get()
+            if frame is None:
+                break
+            if self.error is None:
+                try:
+                    self.writer.write(frame)
+                except Exception as error:
+                    self.error = error
+
+    def write(self, frame):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+        start = time.perf_counter()
+        self.queue.put(np.array(frame, dtype=np.uint8, order="C"))
+        self.blocked += time.perf_counter() - start
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+        self.writer.close()
+        if self.error is not None:
+            raise self.error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+# engine -> setup(module, width, height) returning frame(t) in display order.
+
+def setup_gpt(module, width, height):
+    renderer = module.Renderer(width, height)
+    # The window shows flipud(transpose(image)) through surfarray, i.e. each
+    # row mirrored left to right.
+    return lambda t: renderer.render(t)[:, ::-1]
+
+def setup_deepseek(module, width, height):
+    # The window passes the (rows, columns) image to surfarray as (x, y),
+    # so ray_dirs is built transposed to get a width x height frame.
+    ray_dirs = module.make_ray_dirs(height, width)
+    return lambda t: (module.render_frame(t, ray_dirs) * 255).astype(np.uint8).transpose(1, 0, 2)
+
+EXPORTS = {"gpt": setup_gpt, "deepseek": setup_deepseek}
+
+def export(engine, path, fmt="png", start=0.0, end=5.0, fps=30, width=320, height=320, queue_size=4):
+    """Render [start, end) at 1/fps steps to `path`; returns timing stats."""
+    from engines import load_engine
+
+    frame = EXPORTS[engine](load_engine(engine), width, height)
+    count = int(round((end - start) * fps))
+    render_time = 0.0
+    begin = time.perf_counter()
+    with AsyncFrameWriter(FORMATS[fmt](path, fps), queue_size) as writer:
+        with np.errstate(all="ignore"):
+            for i in range(count):
+                t0 = time.perf_counter()
+                image = frame(start + i / fps)
+                render_time += time.perf_counter() - t0
+                writer.write(image)
+    return {
+        "frames": count,
+        "seconds": time.perf_counter() - begin,
+        "render_seconds": render_time,
+        "blocked_seconds": writer.blocked,
+    }
+
+def main():
+    from bench import parse_resolution
+
+    parser = argparse.ArgumentParser(description="Render an engine's animation offline to disk.")
+    parser.add_argument("engine", choices=EXPORTS)
+    parser.add_argument("path", help="directory for png, file for raw and y4m")
+    parser.add_argument("--format", choices=FORMATS, default="png")
+    parser.add_argument("--start", type=float, default=0.0)
+    parser.add_argument("--end", type=float, default=5.0)
+    parser.add_argument("--fps", type=float, default=30)
+    parser.add_argument("--size", type=parse_resolution, default=(320, 320), metavar="WxH")
+    parser.add_argument("--queue-size", type=int, default=4)
+    args = parser.parse_args()
+
+    stats = export(args.engine, args.path, args.format, args.start, args.end, args.fps,
+                   *args.size, queue_size=args.queue_size)
+    print("%d frames in %.2f s (render %.2f s, waiting on writer %.2f s), max RSS %.1f MB" % (
+        stats["frames"], stats["seconds"], stats["render_seconds"], stats["blocked_seconds"],
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+import argparse
+import hashlib
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+def quantize(image):
+    """A [0, 1] float image as uint8, rounded as GL converts floats for an 8-bit framebuffer."""
+    return (np.clip(image, 0, 1) * 255 + 0.5).astype(np.uint8)
+
+class SpillStore:
+    """Frames of one shape and dtype in the slots of a memory-mapped .npy file, least recently used out first."""
+
+    def __init__(self, path, shape, dtype, max_bytes):
+        slots = max(1, max_bytes // (int(np.prod(shape)) * np.dtype(dtype).itemsize))
+        self.frames = np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=(slots,) + tuple(shape))
+        self.slots = OrderedDict()
+        self.free = list(range(slots))
+
+    def fits(self, frame):
+        return frame.shape == self.frames.shape[1:] and frame.dtype == self.frames.dtype
+
+    def put(self, key, frame):
+        """Store frame; returns True if the oldest frame had to make room for it."""
+        dropped = not self.free
+        if dropped:
+            self.free.append(self.slots.popitem(last=False)[1])
+        slot = self.free.pop()
+        self.frames[slot] = frame
+        self.slots[key] = slot
+        return dropped
+
+    def pop(self, key):
+        slot = self.slots.pop(key, None)
+        if slot is None:
+            return None
+        self.free.append(slot)
+        return np.array(self.frames[slot])
+
+class FrameCache:
+    """Finished frames keyed by the quantized scene state they show.
+
+    A state is a sequence of arrays (object and light positions, the
+    resolution, ...). key() rounds each to a multiple of its quantum (one
+    for all, or one per entry) and hashes the result, so states closer than
+    a quantum share a frame: pick quanta below a pixel's worth of motion.
+    Frames are kept as read-only copies, least recently used evicted first
+    once they take more than max_bytes. With `spill`, a path, evicted frames
+    go to a memory-mapped file of up to spill_bytes instead, and a later hit
+    brings them back into memory.
+    """
+
+    def __init__(self, max_bytes=256 * 2**20, quantum=1e-3, spill=None, spill_bytes=2**30):
+        self.max_bytes = max_bytes
+        self.quantum = quantum
+        self.spill_path = spill
+        self.spill_bytes = spill_bytes
+        self.spill = None
+        self.frames = OrderedDict()
+        self.bytes = 0
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "spilled": 0, "disk_hits": 0}
+
+    def key(self, state):
+        digest = hashlib.blake2b(digest_size=16)
+        for value, quantum in zip(state, np.broadcast_to(self.quantum, len(state))):
+            value = np.asarray(value, dtype=float)
+            digest.update(repr(value.shape).encode())
+            digest.update(np.round(value / quantum).astype(np.int64).tobytes())
+        return digest.digest()
+
+    def get(self, state, render):
+        """The frame for `state`: cached, or render() and cache it."""
+        key = self.key(state)
+        frame = self.lookup(key)
+        if frame is None:
+            frame = self.store(key, render())
+        return frame
+
+    def lookup(self, key):
+        frame = self.frames.get(key)
+        if frame is not None:
+            self.frames.move_to_end(key)
+            self.stats["hits"] += 1
+            return frame
+        if self.spill is not None:
+            frame = self.spill.pop(key)
+            if frame is not None:
+                self.stats["hits"] += 1
+                self.stats["disk_hits"] += 1
+                return self.store(key, frame)
+        self.stats["misses"] += 1
+        return None
+
+    def store(self, key, frame):
+        frame = np.array(frame)
+        frame.flags.writeable = False
+        if frame.nbytes > self.max_bytes:
+            return frame
+        self.frames[key] = frame
+        self.bytes += frame.nbytes
+        while self.bytes > self.max_bytes:
+            old_key, old = self.frames.popitem(last=False)
+            self.bytes -= old.nbytes
+            self._evict(old_key, old)
+        return frame
+
+    def _evict(self, key, frame):
+        if self.spill is None and self.spill_path is not None:
+            self.spill = SpillStore(self.spill_path, frame.shape, frame.dtype, self.spill_bytes)
+        if self.spill is not None and self.spill.fits(frame):
+            self.stats["spilled"] += 1
+            if self.spill.put(key, frame):
+                self.stats["evictions"] += 1
+        else:
+            self.stats["evictions"] += 1
+
+    @property
+    def hit_rate(self):
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return self.stats["hits"] / lookups if lookups else 0.0
+
+    def report(self):
+        stats = self.stats
+        text = "frame cache: %.1f%% hits (%d hits, %d misses), %d frames / %.1f MB in memory, %d evictions" % (
+            100 * self.hit_rate, stats["hits"], stats["misses"], len(self.frames), self.bytes / 2**20,
+            stats["evictions"])
+        if self.spill is not None:
+            text += ", %d spilled to disk, %d hits from disk" % (stats["spilled"], stats["disk_hits"])
+        return text
+
+def main():
+    from bench import parse_resolution
+    from engines import load_engine
+
+    parser = argparse.ArgumentParser(description="Frame cache hit rate over the deepseek animation.")
+    parser.add_argument("--size", type=parse_resolution, default=(320, 320), metavar="WxH")
+    parser.add_argument("--cycles", type=int, default=4)
+    parser.add_argument("--cycle", type=int, default=3142,
+                        help="frames per cycle; the scene repeats every 20*pi seconds, 3142 frames")
+    parser.add_argument("--max-mb", type=float, default=256)
+    parser.add_argument("--quantum", type=float, default=0.02, metavar="SECONDS", help="of animation phase")
+    parser.add_argument("--spill", metavar="PATH.npy", help="spill evicted frames to this memory-mapped file")
+    args = parser.parse_args()
+    width, height = args.size
+
+    deepseek = load_engine("deepseek")
+    ray_dirs = deepseek.make_ray_dirs(width, height)
+    cache = FrameCache(int(args.max_mb * 2**20), quantum=(args.quantum, 1), spill=args.spill)
+    print("%6s %10s %12s %12s" % ("cycle", "hit rate", "ms/frame", "cached MB"))
+    frame = 0
+    for cycle in range(args.cycles):
+        hits = cache.stats["hits"]
+        start = time.perf_counter()
+        for _ in range(args.cycle):
+            # The window's time step.
+            t = frame * 0.02
+            cache.get((t % deepseek.PERIOD, args.size),
+                      lambda: quantize(deepseek.render_frame(t, ray_dirs)))
+            frame += 1
+        elapsed = (time.perf_counter() - start) / args.cycle
+        print("%6d %9.1f%% %12.2f %12.1f" % (
+            cycle + 1, 100 * (cache.stats["hits"] - hits) / args.cycle, elapsed * 1000, cache.bytes / 2**20))
+    print(cache.report())
+
+if __name__ == "__main__":
+    main()
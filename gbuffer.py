@@ -0,0 +1,121 @@
+import numpy as np
+
+from dirty import FULL_FRAME
+
+def union(a, b):
+    """Smallest rectangle (y0, y1, x0, x1) covering a and b, either of which may be None."""
+    if a is None or b is None:
+        return a or b
+    return min(a[0], b[0]), max(a[1], b[1]), min(a[2], b[2]), max(a[3], b[3])
+
+def window(rect):
+    return slice(rect[0], rect[1]), slice(rect[2], rect[3])
+
+class GBuffer:
+    """Per-pixel results of the primary rays, kept between frames for deferred shading.
+
+    depth, object_id (0 for nothing, i + 1 for object i) and material_id
+    are (H, W); position and normal are (H, W, 3). Every object also has
+    its own (H, W) layer of hit distances, tagged with the state (position,
+    size, ...) it was intersected in and the rectangle it covered.
+
+    stale() tells an engine which rectangle of rays an object must be
+    re-intersected over: none while its state is unchanged, otherwise where
+    it was and where it is now. The engine writes that part of the object's
+    layer, resolve() redoes the depth test between the layers there, and
+    the engine refreshes position, normal and material_id inside the
+    rectangle it returns. A frame in which only lights move runs no primary
+    intersection at all and shades straight from the buffer.
+    """
+
+    def __init__(self, shape, objects):
+        self.shape = tuple(shape)
+        self.layers = np.full((objects,) + self.shape, np.inf)
+        self.depth = np.full(self.shape, np.inf)
+        self.object_id = np.zeros(self.shape, dtype=np.int32)
+        self.material_id = np.zeros(self.shape, dtype=np.intp)
+        self.position = np.zeros(self.shape + (3,))
+        self.normal = np.zeros(self.shape + (3,))
+        self.states = [None] * objects
+        self.regions = [None] * objects
+        self.intersected = 0
+
+    @property
+    def full(self):
+        return (0, self.shape[0], 0, self.shape[1])
+
+    def stale(self, index, state, region=FULL_FRAME):
+        """Rectangle of rays to re-intersect object `index` over, or None.
+
+        `region` is the rectangle the object covers in `state`, None when
+        it is off screen or FULL_FRAME, as DirtyRegionTracker.sphere_bounds()
+        returns them. The returned rectangle of the object's layer is
+        cleared, ready for the new hit distances.
+        """
+        state = [np.array(value, dtype=float) for value in state]
+        previous = self.states[index]
+        if previous is not None and all(np.array_equal(a, b) for a, b in zip(state, previous)):
+            return None
+        if region is FULL_FRAME:
+            region = self.full
+        rect = self.full if previous is None else union(self.regions[index], region)
+        self.states[index] = state
+        self.regions[index] = region
+        if rect is not None:
+            self.layers[index][window(rect)] = np.inf
+            self.intersected += (rect[1] - rect[0]) * (rect[3] - rect[2])
+        return rect
+
+    def resolve(self, rect):
+        """Nearest object per pixel inside rect; returns the rectangle's slices."""
+        area = window(rect)
+        layers = self.layers[(slice(None),) + area]
+        nearest = np.argmin(layers, axis=0)
+        depth = np.take_along_axis(layers, nearest[np.newaxis], axis=0)[0]
+        self.depth[area] = depth
+        self.object_id[area] = np.where(depth < np.inf, nearest + 1, 0)
+        return area
+
+def main():
+    import argparse
+    import time
+
+    from bench import parse_resolution
+    from engines import load_engine
+
+    parser = argparse.ArgumentParser(description="Full frames vs deferred frames from a G-buffer.")
+    parser.add_argument("--size", type=parse_resolution, default=(640, 480), metavar="WxH")
+    parser.add_argument("--frames", type=int, default=30)
+    args = parser.parse_args()
+    width, height = args.size
+
+    gpt = load_engine("gpt")
+    deepseek = load_engine("deepseek")
+    gpt_rays = gpt.camera_rays(width, height)
+    deepseek_rays = deepseek.make_ray_dirs(width, height)
+    cases = (
+        ("gpt", gpt.DeferredRenderer(width, height), gpt.scene_at,
+         lambda t: gpt.trace_rays(t, gpt_rays)),
+        ("deepseek", deepseek.DeferredRenderer(deepseek_rays), deepseek.scene_state,
+         lambda t: deepseek.render_frame(t, deepseek_rays)),
+    )
+
+    def timed(frame):
+        frame(0)
+        start = time.perf_counter()
+        for i in range(1, args.frames + 1):
+            frame(i)
+        return (time.perf_counter() - start) / args.frames * 1000
+
+    print("%-10s %12s %12s %12s" % ("engine", "full", "deferred", "light only"))
+    with np.errstate(all="ignore"):
+        for name, renderer, state, full in cases:
+            still = state(0.0)[0]
+            print("%-10s %9.2f ms %9.2f ms %9.2f ms" % (
+                name,
+                timed(lambda i: full(i / 30)),
+                timed(lambda i: renderer.render(i / 30)),
+                timed(lambda i: renderer.render_state(still, state(i / 30)[1]))))
+
+if __name__ == "__main__":
+    main()
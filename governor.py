@@ -0,0 +1,65 @@
+import logging
+from collections import deque
+
+import pygame
+
+log = logging.getLogger(__name__)
+
+# Render scales relative to the window. Values above 1 supersample: the
+# frame is rendered larger and smoothscaled down to the window.
+SCALES = (0.25, 0.375, 0.5, 0.625, 0.75, 0.875, 1.0, 1.5, 2.0)
+
+class ResolutionGovernor:
+    """Pick the internal render resolution that keeps frames inside a budget.
+
+    Feed it the duration of every frame with record(); it averages the last
+    `window` frames and moves one step through SCALES when the budget is
+    missed, or when the next step up is predicted to fit (frame cost is
+    taken to grow with the pixel count). After every change it waits for a
+    full window of new samples before deciding again.
+    """
+
+    def __init__(self, window_size, target_fps=60, scale=1.0, scales=SCALES,
+                 window=20, headroom=0.9):
+        self.window_size = window_size
+        self.budget = 1.0 / target_fps
+        self.scales = sorted(scales)
+        self.level = min(range(len(self.scales)), key=lambda i: abs(self.scales[i] - scale))
+        self.headroom = headroom
+        self.times = deque(maxlen=window)
+        self.changes = 0
+
+    @property
+    def scale(self):
+        return self.scales[self.level]
+
+    @property
+    def render_size(self):
+        width, height = self.window_size
+        return max(1, round(width * self.scale)), max(1, round(height * self.scale))
+
+    def record(self, seconds):
+        self.times.append(seconds)
+        if len(self.times) < self.times.maxlen:
+            return
+        average = sum(self.times) / len(self.times)
+        level = self.level
+        if average > self.budget and level > 0:
+            level -= 1
+        elif level + 1 < len(self.scales):
+            growth = (self.scales[level + 1] / self.scales[level]) ** 2
+            if average * growth < self.budget * self.headroom:
+                level += 1
+        if level != self.level:
+            old_scale, self.level = self.scale, level
+            self.changes += 1
+            self.times.clear()
+            log.info("avg frame %.1f ms vs %.1f ms budget: scale %.3f -> %.3f (%dx%d)",
+                     average * 1000, self.budget * 1000, old_scale, self.scale, *self.render_size)
+
+    def present(self, surface, screen):
+        """Blit a frame rendered at render_size onto the window, rescaling it if needed."""
+        if surface.get_size() != self.window_size:
+            pygame.transform.smoothscale(surface, self.window_size, screen)
+        else:
+            screen.blit(surface, (0, 0))
@@ -0,0 +1,139 @@
+import argparse
+import time
+
+import numpy as np
+
+TILE = 16
+# Angular slack added to every cone test so rounding can only keep a tile.
+EPSILON = 1e-6
+
+class RayPackets:
+    """Camera rays regrouped into square tiles with a bounding cone per tile.
+
+    live_tiles() and shadow_live_tiles() return the tiles whose rays could
+    reach a sphere; gather() packs those tiles into an (k * tile, tile, ...)
+    grid the existing per-pixel functions accept unchanged, and scatter()
+    puts their results back into frame layout, filling culled tiles with
+    the function's miss value. Because every pixel is still computed by the
+    same function, the output is bit-identical to tracing the whole frame.
+    """
+
+    def __init__(self, ray_dirs, origin=(0.0, 0.0, 0.0), tile=TILE):
+        self.shape = ray_dirs.shape[:2]
+        self.tile = tile
+        self.origin = np.asarray(origin, dtype=float)
+        self.tiles = self.to_tiles(ray_dirs)
+        axis = self.tiles.sum(axis=(1, 2))
+        axis /= np.linalg.norm(axis, axis=-1, keepdims=True)
+        cos_half = np.min(np.einsum("nijk,nk->nij", self.tiles, axis), axis=(1, 2))
+        self.axis = axis
+        self.half_angle = np.arccos(np.clip(cos_half, -1.0, 1.0)) + EPSILON
+        self.rays_tested = 0
+        self.rays_culled = 0
+
+    def to_tiles(self, array):
+        """(H, W, ...) -> (tiles, tile, tile, ...), padding edges by replication."""
+        height, width = self.shape
+        tile = self.tile
+        pad_y, pad_x = -height % tile, -width % tile
+        pad = [(0, pad_y), (0, pad_x)] + [(0, 0)] * (array.ndim - 2)
+        array = np.pad(array, pad, mode="edge")
+        rows, cols = array.shape[0] // tile, array.shape[1] // tile
+        array = array.reshape((rows, tile, cols, tile) + array.shape[2:]).swapaxes(1, 2)
+        return np.ascontiguousarray(array).reshape((rows * cols, tile, tile) + array.shape[4:])
+
+    def count(self, live):
+        self.rays_tested += int(np.count_nonzero(live)) * self.tile ** 2
+        self.rays_culled += int(np.count_nonzero(~live)) * self.tile ** 2
+
+    def live_tiles(self, center, radius):
+        """Tiles whose bounding cone from the camera touches the sphere."""
+        v = np.asarray(center, dtype=float) - self.origin
+        distance = np.linalg.norm(v)
+        if distance <= radius:
+            live = np.ones(len(self.tiles), dtype=bool)
+        else:
+            phi = np.arccos(np.clip(self.axis @ v / distance, -1.0, 1.0))
+            live = phi <= self.half_angle + np.arcsin(radius / distance)
+        self.count(live)
+        return live
+
+    def shadow_live_tiles(self, origins, light_pos, center, radius):
+        """Tiles whose shadow rays toward light_pos could pass through the sphere.
+
+        Each tile's finite origins are bounded by a ball; its shadow rays up
+        to the light then lie within radius of the segment from the ball's
+        center to the light. Hits beyond the light never shadow anything,
+        so they are not looked for.
+        """
+        origins = self.to_tiles(origins)
+        valid = np.all(np.isfinite(origins), axis=-1)
+        count = valid.sum(axis=(1, 2))
+        safe = np.where(valid[..., np.newaxis], origins, 0.0)
+        center_o = safe.sum(axis=(1, 2)) / np.maximum(count, 1)[:, np.newaxis]
+        spread = np.where(valid, np.linalg.norm(safe - center_o[:, np.newaxis, np.newaxis], axis=-1), 0.0)
+        ball = spread.max(axis=(1, 2))
+
+        segment = light_pos - center_o
+        length2 = np.maximum(np.sum(segment * segment, axis=-1), 1e-12)
+        s = np.clip(np.sum((center - center_o) * segment, axis=-1) / length2, 0.0, 1.0)
+        closest = center_o + s[:, np.newaxis] * segment
+        gap = np.linalg.norm(center - closest, axis=-1)
+        live = (count > 0) & (gap <= radius + ball + EPSILON * (1.0 + np.sqrt(length2)))
+        self.count(live)
+        return live
+
+    def gather(self, live, array=None):
+        """Pack the live tiles of `array` (default: the camera rays) into a grid."""
+        tiles = self.tiles if array is None else self.to_tiles(array)
+        tiles = tiles[live]
+        return tiles.reshape((len(tiles) * self.tile, self.tile) + tiles.shape[3:])
+
+    def scatter(self, values, live, fill):
+        """Inverse of gather(): frame-shaped array with `fill` in culled tiles."""
+        height, width = self.shape
+        tile = self.tile
+        rows, cols = -(-height // tile), -(-width // tile)
+        extra = values.shape[2:]
+        out = np.full((rows * cols, tile, tile) + extra, fill, dtype=values.dtype)
+        out[live] = values.reshape((-1, tile, tile) + extra)
+        out = out.reshape((rows, cols, tile, tile) + extra).swapaxes(1, 2)
+        return out.reshape((rows * tile, cols * tile) + extra)[:height, :width]
+
+def main():
+    from engines import load_engine
+
+    parser = argparse.ArgumentParser(description="Packet culling micro-benchmark.")
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--height", type=int, default=480)
+    parser.add_argument("--frames", type=int, default=30)
+    parser.add_argument("--tile", type=int, default=TILE)
+    args = parser.parse_args()
+    width, height = args.width, args.height
+
+    gpt = load_engine("gpt")
+    deepseek = load_engine("deepseek")
+    gpt_rays = gpt.camera_rays(width, height)
+    deepseek_rays = deepseek.make_ray_dirs(width, height)
+    gpt_packets = RayPackets(gpt_rays, gpt.CAMERA, args.tile)
+    deepseek_packets = RayPackets(deepseek_rays, tile=args.tile)
+    cases = (
+        ("gpt", lambda t: gpt.trace_rays(t, gpt_rays),
+         lambda t: gpt.trace_rays(t, gpt_rays, packets=gpt_packets), gpt_packets),
+        ("deepseek", lambda t: deepseek.render_frame(t, deepseek_rays),
+         lambda t: deepseek.render_frame(t, deepseek_rays, packets=deepseek_packets), deepseek_packets),
+    )
+    print("%-10s %12s %12s %20s" % ("engine", "full ms", "packets ms", "avoided rays/frame"))
+    with np.errstate(all="ignore"):
+        for name, full, culled, packets in cases:
+            timings = []
+            for render in (full, culled):
+                start = time.perf_counter()
+                for i in range(args.frames):
+                    render(i / 60.0)
+                timings.append((time.perf_counter() - start) / args.frames * 1000)
+            print("%-10s %12.2f %12.2f %20d" % (name, timings[0], timings[1],
+                                                packets.rays_culled // args.frames))
+
+if __name__ == "__main__":
+    main()
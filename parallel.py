@@ -0,0 +1,116 @@
+import argparse
+import multiprocessing
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# Per-engine tile functions. Each renders rows y0:y1 and columns x0:x1 of a
+# width x height frame using the worker's cached full-frame ray grid.
+
+def render_gpt_tile(module, rays, time_value, y0, y1, x0, x1):
+    return module.trace_rays(time_value, rays[y0:y1, x0:x1])
+
+def render_deepseek_tile(module, rays, time_value, y0, y1, x0, x1):
+    height, width = rays.shape[:2]
+    return module.render_frame(time_value, rays[y0:y1, x0:x1], aspect_ratio=width / height)
+
+# engine -> (tile function, ray grid builder, framebuffer dtype)
+TILE_ENGINES = {
+    "gpt": (render_gpt_tile, lambda module, w, h: module.camera_rays(w, h), np.uint8),
+    "deepseek": (render_deepseek_tile, lambda module, w, h: module.make_ray_dirs(w, h), np.float64),
+}
+
+_worker = {}
+
+def _init_worker(engine, shm_name, shape, dtype):
+    # Imported here: engines selects the dummy SDL driver, which must not
+    # leak into a display loop that merely creates a TileRenderer.
+    from engines import load_engine
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    module = load_engine(engine)
+    render_tile, build_rays, _ = TILE_ENGINES[engine]
+    _worker.update(
+        shm=shm,
+        frame=np.ndarray(shape, dtype, buffer=shm.buf),
+        module=module,
+        render_tile=render_tile,
+        rays=build_rays(module, shape[1], shape[0]),
+    )
+
+def _render_tile(task):
+    time_value, (y0, y1, x0, x1) = task
+    _worker["frame"][y0:y1, x0:x1] = _worker["render_tile"](
+        _worker["module"], _worker["rays"], time_value, y0, y1, x0, x1)
+
+def split_tiles(width, height, tile_size):
+    return [(y, min(y + tile_size, height), x, min(x + tile_size, width))
+            for y in range(0, height, tile_size)
+            for x in range(0, width, tile_size)]
+
+class TileRenderer:
+    """Render an engine's frames tile by tile in a process pool.
+
+    Workers write their tiles straight into a multiprocessing.shared_memory
+    framebuffer, so only (time, tile bounds) tuples cross process
+    boundaries. render() returns the shared framebuffer itself; it is
+    overwritten by the next call.
+    """
+
+    def __init__(self, engine, width, height, workers=None, tile_size=64):
+        render_tile, build_rays, dtype = TILE_ENGINES[engine]
+        self.width, self.height = width, height
+        self.workers = workers or multiprocessing.cpu_count()
+        self.tiles = split_tiles(width, height, tile_size)
+        shape = (height, width, 3)
+        self.shm = shared_memory.SharedMemory(create=True, size=int(np.prod(shape)) * np.dtype(dtype).itemsize)
+        self.frame = np.ndarray(shape, dtype, buffer=self.shm.buf)
+        self.pool = multiprocessing.Pool(self.workers, initializer=_init_worker,
+                                         initargs=(engine, self.shm.name, shape, dtype))
+
+    def render(self, time_value):
+        tasks = [(time_value, tile) for tile in self.tiles]
+        for _ in self.pool.imap_unordered(_render_tile, tasks):
+            pass
+        return self.frame
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+        del self.frame
+        self.shm.close()
+        self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def main():
+    from bench import format_table, measure, parse_resolution
+
+    parser = argparse.ArgumentParser(description="Tile-parallel scaling benchmark.")
+    parser.add_argument("--engine", choices=TILE_ENGINES, default="gpt")
+    parser.add_argument("--workers", nargs="+", type=int,
+                        default=sorted({1, 2, 4, 8, 16, 32, multiprocessing.cpu_count()}))
+    parser.add_argument("--resolutions", nargs="+", type=parse_resolution,
+                        default=[(1920, 1080), (3840, 2160)], metavar="WxH")
+    parser.add_argument("--tile-size", type=int, default=64)
+    parser.add_argument("--frames", type=int, default=10)
+    args = parser.parse_args()
+
+    for width, height in args.resolutions:
+        results = []
+        for workers in args.workers:
+            with TileRenderer(args.engine, width, height, workers, args.tile_size) as renderer:
+                result = {"engine": "%s x%d" % (args.engine, workers), "width": width, "height": height}
+                result.update(measure(lambda i: renderer.render(i / 60.0), args.frames))
+            results.append(result)
+        print(format_table(results))
+        for result in results:
+            print("%-14s speedup %.2fx" % (result["engine"], result["fps"] / results[0]["fps"]))
+        print()
+
+if __name__ == "__main__":
+    main()
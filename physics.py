@@ -0,0 +1,133 @@
+import argparse
+import time
+
+import numpy as np
+
+class SphereSimulation:
+    """Many spheres falling under gravity and bouncing on a floor.
+
+    Positions, velocities and radii are arrays, and a step is a fixed
+    sequence of array operations over all spheres: semi-implicit Euler, then
+    the spheres that went through the floor (or the ceiling, if there is
+    one) are gathered and mirrored back inside with their vertical speed
+    scaled by `restitution`. State is kept as (3, N) planes, see soa.py, so
+    every pass runs over contiguous rows; `positions` and `velocities` are
+    (N, 3) views of them.
+
+    advance(elapsed) adds wall-clock time to an accumulator and runs as many
+    fixed `dt` steps as it holds, so the motion no longer depends on the
+    frame rate. interpolated() blends the last two states by the fraction
+    of a step left over, for display between steps.
+    """
+
+    def __init__(self, positions, velocities, radii, gravity=(0.0, -9.81, 0.0), floor=0.0,
+                 ceiling=None, restitution=0.9, dt=1 / 120, max_steps=8):
+        self.current = np.array(np.reshape(positions, (-1, 3)).T, dtype=float, order="C")
+        self.previous = self.current.copy()
+        self.velocity = np.array(np.reshape(velocities, (-1, 3)).T, dtype=float, order="C")
+        self.radii = np.array(np.broadcast_to(radii, len(self)), dtype=float)
+        self.gravity = np.array(gravity, dtype=float)
+        self.restitution = restitution
+        self.dt = dt
+        self.max_steps = max_steps
+        self.accumulator = 0.0
+        self.steps = 0
+        self.hit = np.empty(len(self), dtype=bool)
+        self.set_bounds(floor, ceiling)
+
+    def __len__(self):
+        return self.current.shape[1]
+
+    @property
+    def positions(self):
+        return self.current.T
+
+    @property
+    def velocities(self):
+        return self.velocity.T
+
+    def set_bounds(self, floor, ceiling=None):
+        """Heights of the floor and the optional ceiling the spheres bounce between."""
+        self.floor = floor
+        self.ceiling = ceiling
+        # Lowest and highest center height of each sphere.
+        self.lowest = self.radii + floor
+        self.highest = None if ceiling is None else ceiling - self.radii
+
+    def step(self):
+        """Advance every sphere by one dt."""
+        self.previous, self.current = self.current, self.previous
+        self.velocity += (self.gravity * self.dt)[:, np.newaxis]
+        np.multiply(self.velocity, self.dt, out=self.current)
+        self.current += self.previous
+        self._bounce(self.lowest, np.less, 1.0)
+        if self.highest is not None:
+            self._bounce(self.highest, np.greater, -1.0)
+        self.steps += 1
+
+    def _bounce(self, limit, beyond, direction):
+        y, vy = self.current[1], self.velocity[1]
+        beyond(y, limit, out=self.hit)
+        # Only a few spheres touch a bound in any one step.
+        hit = np.flatnonzero(self.hit)
+        if not len(hit):
+            return
+        limit = limit[hit]
+        # The penetration, mirrored and damped.
+        y[hit] = limit + self.restitution * (limit - y[hit])
+        vy[hit] = direction * self.restitution * np.abs(vy[hit])
+
+    def advance(self, elapsed):
+        """Run the fixed steps `elapsed` seconds of wall-clock time add up to.
+
+        At most max_steps run per call; a longer backlog (a stalled frame,
+        a breakpoint) is dropped instead of making the next frames slower.
+        Returns the number of steps taken.
+        """
+        self.accumulator += elapsed
+        steps = 0
+        while self.accumulator >= self.dt and steps < self.max_steps:
+            self.step()
+            self.accumulator -= self.dt
+            steps += 1
+        if self.accumulator >= self.dt:
+            self.accumulator %= self.dt
+        return steps
+
+    def interpolated(self, out=None):
+        """(N, 3) positions accumulator/dt of the way from the previous step to the last one."""
+        planes = np.empty_like(self.current) if out is None else out.T
+        np.subtract(self.current, self.previous, out=planes)
+        planes *= self.accumulator / self.dt
+        planes += self.previous
+        return planes.T
+
+def random_simulation(count, seed=0, **kwargs):
+    """`count` spheres dropped from random heights over a 20 x 20 floor at y=0."""
+    rng = np.random.default_rng(seed)
+    positions = np.column_stack([rng.uniform(-10.0, 10.0, count), rng.uniform(1.0, 10.0, count),
+                                 rng.uniform(-10.0, 10.0, count)])
+    velocities = rng.normal(0.0, 1.0, (count, 3))
+    radii = rng.uniform(0.05, 0.2, count)
+    return SphereSimulation(positions, velocities, radii, **kwargs)
+
+def main():
+    parser = argparse.ArgumentParser(description="Time fixed-timestep physics steps for many spheres.")
+    parser.add_argument("--spheres", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--steps", type=int, default=600)
+    parser.add_argument("--dt", type=float, default=1 / 120)
+    args = parser.parse_args()
+
+    print("%9s %12s %14s" % ("spheres", "ms/step", "steps/16.7 ms"))
+    for count in args.spheres:
+        simulation = random_simulation(count, dt=args.dt)
+        simulation.step()
+        start = time.perf_counter()
+        for _ in range(args.steps):
+            simulation.step()
+        elapsed = (time.perf_counter() - start) / args.steps
+        assert (simulation.positions[:, 1] >= simulation.lowest).all()
+        print("%9d %12.3f %14.1f" % (count, elapsed * 1000, (1 / 60) / elapsed))
+
+if __name__ == "__main__":
+    main()
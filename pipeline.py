@@ -0,0 +1,98 @@
+import threading
+import time
+
+import numpy as np
+
+class FramePipeline:
+    """Render frames on a worker thread while the main thread presents them.
+
+    The worker calls render_next() in a loop and copies each result into
+    one of three framebuffers: it fills the back buffer, then swaps it with
+    the ready one; latest() swaps the ready buffer to the front for the main
+    thread. Neither side ever waits for the other, and the long NumPy passes
+    in render_next() release the GIL, so tracing overlaps event handling,
+    surface creation and display flips.
+
+    A completed frame that is replaced before latest() picks it up counts as
+    dropped. Added latency is the time a completed frame waits before it is
+    presented; total latency runs from the start of its render.
+    """
+
+    def __init__(self, render_next):
+        self.render_next = render_next
+        self.lock = threading.Lock()
+        self.buffers = None
+        self.front = self.ready = None
+        self.back = 0
+        self.ready_info = None
+        self.front_info = None
+        self.error = None
+        self.rendered = 0
+        self.presented = 0
+        self.dropped = 0
+        self.added_latency = 0.0
+        self.total_latency = 0.0
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        try:
+            while self.running:
+                started = time.perf_counter()
+                image = self.render_next()
+                with self.lock:
+                    if self.buffers is None or self.buffers[0].shape != image.shape:
+                        self.buffers = [np.empty_like(image) for _ in range(3)]
+                        self.front = self.ready = None
+                        self.back = 0
+                back = self.buffers[self.back]
+                np.copyto(back, image)
+                with self.lock:
+                    if self.ready is None:
+                        free = ({0, 1, 2} - {self.front, self.back}).pop()
+                    else:
+                        free = self.ready
+                        self.dropped += 1
+                    self.ready, self.back = self.back, free
+                    self.ready_info = (started, time.perf_counter())
+                    self.rendered += 1
+        except Exception as error:
+            self.error = error
+
+    def latest(self):
+        """The newest completed frame, or None if nothing new has finished.
+
+        The returned buffer stays untouched until the next call.
+        """
+        if self.error is not None:
+            raise self.error
+        with self.lock:
+            if self.ready is None:
+                return None
+            self.front, self.ready = self.ready, None
+            started, finished = self.ready_info
+            frame = self.buffers[self.front]
+        now = time.perf_counter()
+        self.presented += 1
+        self.added_latency += now - finished
+        self.total_latency += now - started
+        return frame
+
+    def stats(self):
+        presented = max(self.presented, 1)
+        return {
+            "rendered": self.rendered,
+            "presented": self.presented,
+            "dropped": self.dropped,
+            "added_latency_ms": 1000 * self.added_latency / presented,
+            "total_latency_ms": 1000 * self.total_latency / presented,
+        }
+
+    def report(self):
+        return ("pipeline: %(rendered)d rendered, %(presented)d presented, %(dropped)d dropped; "
+                "latency %(total_latency_ms).1f ms (+%(added_latency_ms).1f ms waiting)" % self.stats())
+
+    def close(self):
+        self.running = False
+        self.thread.join()
@@ -0,0 +1,121 @@
+import argparse
+import time
+
+import numpy as np
+import pygame
+
+def write_pixels(target, pixels):
+    """Copy a uint8 (..., 3) image into a view of Surface pixels.
+
+    Channels are copied one at a time: the pixels3d view of a 32-bit
+    Surface has a 4-byte pixel stride, and a single copy would run its
+    inner loop over the 3 channels instead of along the row.
+    """
+    for k in range(3):
+        np.copyto(target[..., k], pixels[..., k])
+
+def surface_order(array):
+    """The same (x, y, ...) array, stored row by row like Surface pixels.
+
+    Element-wise NumPy passes keep their input's memory order, so a ray
+    grid laid out this way yields frames that write_pixels() copies along
+    contiguous rows.
+    """
+    return np.ascontiguousarray(array.swapaxes(0, 1)).swapaxes(0, 1)
+
+class SurfacePresenter:
+    """Present frames through one persistent Surface per resolution.
+
+    pixels() hands out the cached Surface for a size together with its
+    pixels3d view, indexed (x, y, channel); renderers quantize straight into
+    that view (or a transposed/flipped view of it) instead of building a new
+    Surface from a rearranged copy every frame. The view locks the Surface,
+    so drop it before present().
+    """
+
+    def __init__(self):
+        self.surfaces = {}
+        self.quantized = None
+        self.quantized_key = None
+
+    def surface(self, width, height):
+        surface = self.surfaces.get((width, height))
+        if surface is None:
+            surface = self.surfaces[(width, height)] = pygame.Surface((width, height), 0, 32)
+        return surface
+
+    def pixels(self, width, height):
+        surface = self.surface(width, height)
+        return surface, pygame.surfarray.pixels3d(surface)
+
+    def quantize(self, image, scale=255):
+        """image * scale as uint8, in a buffer reused while the layout stays the same.
+
+        The buffer keeps the image's memory order; casting straight into the
+        strided Surface view instead is about twice as slow.
+        """
+        if self.quantized_key != (image.shape, image.strides):
+            self.quantized = np.empty_like(image, dtype=np.uint8)
+            self.quantized_key = (image.shape, image.strides)
+        return np.multiply(image, scale, out=self.quantized, casting="unsafe")
+
+    def present(self, surface, screen):
+        """Blit onto the window, smoothscaling straight into it if the sizes differ."""
+        if surface.get_size() == screen.get_size():
+            screen.blit(surface, (0, 0))
+        else:
+            pygame.transform.smoothscale(surface, screen.get_size(), screen)
+
+def main():
+    from bench import parse_resolution
+    from engines import headless_display, load_engine
+
+    parser = argparse.ArgumentParser(description="Per-frame present cost, per-frame Surface vs persistent Surface.")
+    parser.add_argument("--resolutions", nargs="+", type=parse_resolution,
+                        default=[(320, 320), (1280, 720), (1920, 1080)], metavar="WxH")
+    parser.add_argument("--frames", type=int, default=100)
+    args = parser.parse_args()
+
+    gpt = load_engine("gpt")
+    deepseek = load_engine("deepseek")
+    presenter = SurfacePresenter()
+    print("%-10s %-11s %14s %14s" % ("engine", "resolution", "make_surface", "persistent"))
+    for width, height in args.resolutions:
+        screen = headless_display(width, height)
+        with np.errstate(all="ignore"):
+            gpt_image = gpt.Renderer(width, height).render(0.5).copy()
+            deepseek_image = deepseek.render_frame(0.5, surface_order(deepseek.make_ray_dirs(height, width)))
+
+        def gpt_before():
+            surface = pygame.surfarray.make_surface(np.flipud(np.transpose(gpt_image, (1, 0, 2))))
+            screen.blit(surface, (0, 0))
+
+        def gpt_after():
+            surface, pixels = presenter.pixels(width, height)
+            write_pixels(pixels[::-1].transpose(1, 0, 2), gpt_image)
+            del pixels
+            presenter.present(surface, screen)
+
+        def deepseek_before():
+            surface = pygame.surfarray.make_surface((deepseek_image * 255).astype(np.uint8))
+            screen.blit(pygame.transform.smoothscale(surface, (width, height)), (0, 0))
+
+        def deepseek_after():
+            surface, pixels = presenter.pixels(width, height)
+            write_pixels(pixels, presenter.quantize(deepseek_image))
+            del pixels
+            presenter.present(surface, screen)
+
+        for name, before, after in (("gpt", gpt_before, gpt_after),
+                                    ("deepseek", deepseek_before, deepseek_after)):
+            timings = []
+            for present in (before, after):
+                present()
+                start = time.perf_counter()
+                for _ in range(args.frames):
+                    present()
+                timings.append((time.perf_counter() - start) / args.frames * 1000)
+            print("%-10s %-11s %11.3f ms %11.3f ms" % (name, "%dx%d" % (width, height), *timings))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+import atexit
+import contextlib
+import json
+import os
+import threading
+import time
+import tracemalloc
+from collections import deque
+
+# Frame-stage instrumentation shared by all scripts. Code marks stages with
+#
+#     with profiler.stage("shadow"):
+#         ...
+#
+# and the main loop brackets each frame with begin_frame()/end_frame().
+# Until enable() is called these return a shared no-op context manager or
+# return at once, so instrumented code costs one function call per stage.
+
+_NULL = contextlib.nullcontext()
+_active = None
+
+class _Stage:
+    __slots__ = ("profiler", "name", "start")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.events.append((self.name, self.start, time.perf_counter(), threading.get_native_id()))
+
+class Profiler:
+    """Stage timings of the last `capacity` frames, kept in a ring buffer.
+
+    Every frame records its stages as (name, start, end, thread id) and,
+    with `memory`, the peak bytes allocated above what was live when the
+    frame began (tracemalloc, which NumPy reports its buffers to).
+    """
+
+    def __init__(self, capacity=300, memory=True):
+        self.frames = deque(maxlen=capacity)
+        self.events = []
+        self.frame_start = None
+        self.memory = memory
+        self.memory_start = 0
+        self.origin = time.perf_counter()
+        self.font = None
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def stage(self, name):
+        return _Stage(self, name)
+
+    def begin_frame(self):
+        self.events = []
+        if self.memory:
+            tracemalloc.reset_peak()
+            self.memory_start = tracemalloc.get_traced_memory()[0]
+        self.frame_start = time.perf_counter()
+
+    def end_frame(self):
+        if self.frame_start is None:
+            return
+        end = time.perf_counter()
+        allocated = tracemalloc.get_traced_memory()[1] - self.memory_start if self.memory else 0
+        self.frames.append((self.frame_start, end, self.events, allocated))
+        self.frame_start = None
+
+    def summary(self):
+        """Averages over the ring buffer: fps, frame and per-stage ms, allocated bytes."""
+        if not self.frames:
+            return {"frames": 0, "fps": 0.0, "frame_ms": 0.0, "allocated_bytes": 0, "stages": {}}
+        count = len(self.frames)
+        stages = {}
+        for _, _, events, _ in self.frames:
+            for name, start, end, _ in events:
+                stages[name] = stages.get(name, 0.0) + (end - start)
+        span = self.frames[-1][1] - self.frames[0][0]
+        return {
+            "frames": count,
+            "fps": count / span if span > 0 else 0.0,
+            "frame_ms": 1000 * sum(end - start for start, end, _, _ in self.frames) / count,
+            "allocated_bytes": sum(frame[3] for frame in self.frames) / count,
+            "stages": {name: 1000 * total / count for name, total in stages.items()},
+        }
+
+    def report(self):
+        summary = self.summary()
+        lines = ["%d frames: %.1f fps, %.2f ms/frame, %.2f MB allocated/frame" % (
+            summary["frames"], summary["fps"], summary["frame_ms"], summary["allocated_bytes"] / 2**20)]
+        lines += ["  %-14s %8.2f ms" % item for item in summary["stages"].items()]
+        return "\n".join(lines)
+
+    def draw_hud(self, surface):
+        """Overlay fps and the stage breakdown on a pygame surface."""
+        import pygame
+
+        if self.font is None:
+            pygame.font.init()
+            self.font = pygame.font.Font(None, 18)
+        y = 4
+        for line in self.report().splitlines():
+            text = self.font.render(line, True, (255, 255, 0), (0, 0, 0))
+            surface.blit(text, (4, y))
+            y += text.get_height()
+
+    def chrome_trace(self):
+        """The ring buffer as Chrome trace events (chrome://tracing, Perfetto)."""
+        pid = os.getpid()
+        main = threading.main_thread().native_id
+        us = lambda seconds: (seconds - self.origin) * 1e6
+        events = []
+        for start, end, stages, allocated in self.frames:
+            events.append({"name": "frame", "ph": "X", "pid": pid, "tid": main,
+                           "ts": us(start), "dur": (end - start) * 1e6})
+            events += [{"name": name, "ph": "X", "pid": pid, "tid": tid,
+                        "ts": us(stage_start), "dur": (stage_end - stage_start) * 1e6}
+                       for name, stage_start, stage_end, tid in stages]
+            if self.memory:
+                events.append({"name": "allocated", "ph": "C", "pid": pid, "tid": main,
+                               "ts": us(start), "args": {"bytes": allocated}})
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def export_chrome_trace(self, path):
+        with open(path, "w") as f:
+            json.dump(self.chrome_trace(), f)
+
+def enable(capacity=300, memory=True):
+    global _active
+    _active = Profiler(capacity, memory)
+    return _active
+
+def disable():
+    global _active
+    _active = None
+
+def active():
+    return _active
+
+def stage(name):
+    return _NULL if _active is None else _active.stage(name)
+
+def begin_frame():
+    if _active is not None:
+        _active.begin_frame()
+
+def end_frame():
+    if _active is not None:
+        _active.end_frame()
+
+def enable_from_env(variable="PROFILE_TRACE"):
+    """Enable profiling when $PROFILE_TRACE names a trace file; written at exit.
+
+    For the GLUT scripts, whose main loop never returns to main().
+    """
+    path = os.environ.get(variable)
+    if not path:
+        return None
+    profiler = enable()
+
+    def finish():
+        print(profiler.report())
+        profiler.export_chrome_trace(path)
+
+    atexit.register(finish)
+    return profiler
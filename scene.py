@@ -0,0 +1,137 @@
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+
+# Scene files are JSON:
+#
+#   {"materials": {"red": {"color": [1, 0, 0], "ambient": 0.1, "diffuse": 0.6,
+#                          "specular": 0.3, "shininess": 50, "reflectivity": 0.4}, ...},
+#    "spheres": [{"center": [0, 1, 5], "radius": 1, "material": "red", "phase": 0}, ...],
+#    "plane": {"point": [0, -1, 0], "normal": [0, 1, 0], "material": "floor"},
+#    "light": [5, 5, 5],
+#    "background": [0.2, 0.2, 0.2]}
+#
+# "light" is optional (the engine animates its own light when it is left out),
+# as are every material field but "color" and a sphere's "phase".
+
+# Columns of a MaterialTable row.
+COLOR = slice(0, 3)
+AMBIENT, DIFFUSE, SPECULAR, SHININESS, REFLECTIVITY = range(3, 8)
+DEFAULTS = {"ambient": 0.1, "diffuse": 0.6, "specular": 0.0, "shininess": 1, "reflectivity": 0.0}
+
+class MaterialTable:
+    """All materials of a scene packed into one (M, 8) float array.
+
+    Row i holds color r, g, b, ambient, diffuse, specular, shininess and
+    reflectivity of material i. Shading looks up every pixel's material
+    with a single gather() from a material-ID buffer, so its cost does not
+    depend on how many materials there are.
+    """
+
+    __slots__ = ("names", "rows")
+
+    def __init__(self, materials):
+        """materials: name -> dict with "color" and optional DEFAULTS keys."""
+        self.names = list(materials)
+        self.rows = np.array([
+            [*material["color"]] + [material.get(key, default) for key, default in DEFAULTS.items()]
+            for material in materials.values()
+        ], dtype=float).reshape(-1, 8)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def index(self, name):
+        return self.names.index(name)
+
+    def gather(self, material_id, out=None):
+        """(..., 8) material rows for an integer material-ID buffer."""
+        return np.take(self.rows, material_id, axis=0, out=out)
+
+class Scene:
+    """A loaded scene file: spheres as (N,)/(N, 3) arrays indexing a MaterialTable."""
+
+    __slots__ = ("materials", "centers", "radii", "material_ids", "phases",
+                 "plane_point", "plane_normal", "plane_material", "light", "background")
+
+    def __init__(self, materials, centers, radii, material_ids, phases,
+                 plane_point, plane_normal, plane_material, light=None, background=(0.2, 0.2, 0.2)):
+        self.materials = materials
+        self.centers = centers
+        self.radii = radii
+        self.material_ids = material_ids
+        self.phases = phases
+        self.plane_point = plane_point
+        self.plane_normal = plane_normal
+        self.plane_material = plane_material
+        self.light = light
+        self.background = background
+
+def scene_from_dict(data):
+    materials = MaterialTable(data["materials"])
+    ids = {name: i for i, name in enumerate(materials.names)}
+    spheres = data.get("spheres", [])
+    # One flat list per column, converted to arrays in a single call each.
+    centers = np.array([sphere["center"] for sphere in spheres], dtype=float).reshape(-1, 3)
+    radii = np.array([sphere["radius"] for sphere in spheres], dtype=float)
+    material_ids = np.array([ids[sphere["material"]] for sphere in spheres], dtype=np.intp)
+    phases = np.array([sphere.get("phase", 0.0) for sphere in spheres], dtype=float)
+    plane = data["plane"]
+    light = data.get("light")
+    return Scene(materials, centers, radii, material_ids, phases,
+                 np.array(plane.get("point", (0.0, -1.0, 0.0)), dtype=float),
+                 np.array(plane.get("normal", (0.0, 1.0, 0.0)), dtype=float),
+                 ids[plane["material"]],
+                 None if light is None else np.array(light, dtype=float),
+                 np.array(data.get("background", (0.2, 0.2, 0.2)), dtype=float))
+
+def load_scene(path):
+    with open(path) as f:
+        return scene_from_dict(json.load(f))
+
+def random_scene_dict(count, materials=16, seed=0):
+    """A scene with `count` random spheres over the plane, for benchmarks."""
+    rng = np.random.default_rng(seed)
+    radius = min(1.0, 2.5 / count ** (1 / 3))
+    return {
+        "materials": dict(
+            [("floor", {"color": [0.5, 0.5, 0.5], "diffuse": 0.9, "reflectivity": 0.25})]
+            + [("m%d" % i, {"color": rng.uniform(0.2, 1.0, 3).round(3).tolist(), "diffuse": 0.6,
+                            "specular": 0.3, "shininess": 50, "reflectivity": 0.4})
+               for i in range(materials)]),
+        "spheres": [
+            {"center": [round(x, 3), round(y, 3), round(z, 3)], "radius": round(r, 4),
+             "material": "m%d" % m, "phase": round(phase, 3)}
+            for x, y, z, r, m, phase in zip(
+                rng.uniform(-8.0, 8.0, count).tolist(), rng.uniform(0.0, 4.0, count).tolist(),
+                rng.uniform(6.0, 30.0, count).tolist(), (rng.uniform(0.5, 1.0, count) * radius).tolist(),
+                rng.integers(0, materials, count).tolist(), rng.uniform(0.0, 2 * np.pi, count).tolist())
+        ],
+        "plane": {"point": [0.0, -1.0, 0.0], "normal": [0.0, 1.0, 0.0], "material": "floor"},
+        "background": [0.2, 0.2, 0.2],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a random scene file and time loading it.")
+    parser.add_argument("--objects", type=int, default=10000)
+    parser.add_argument("--materials", type=int, default=16)
+    parser.add_argument("--output", help="keep the generated scene file here")
+    args = parser.parse_args()
+
+    path = args.output or os.path.join(tempfile.mkdtemp(), "scene.json")
+    with open(path, "w") as f:
+        json.dump(random_scene_dict(args.objects, args.materials), f)
+    start = time.perf_counter()
+    scene = load_scene(path)
+    elapsed = time.perf_counter() - start
+    print("%s: %d spheres, %d materials loaded in %.1f ms" % (
+        path, len(scene.radii), len(scene.materials), elapsed * 1000))
+    if not args.output:
+        os.remove(path)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+import argparse
+import asyncio
+import struct
+import time
+import zlib
+
+import numpy as np
+
+from export import EXPORTS
+
+# Every frame on the wire is a header and a zlib-compressed payload: the
+# (height, width, 3) uint8 frame itself (KEYFRAME), or its XOR with the
+# frame the client got just before (DELTA), which is mostly zeros.
+#   kind, frame number, time.time() the render started, width, height, payload size
+# Clients send back one ACK byte per frame they are done with; a client
+# never has more than `window` frames unacknowledged, so frames cannot pile
+# up in socket buffers either.
+HEADER = struct.Struct(">BIdHHI")
+KEYFRAME, DELTA = 0, 1
+ACK = b"\x01"
+
+class Frame:
+    """A rendered frame and its two encodings, each compressed at most once however many clients get it."""
+
+    def __init__(self, number, timestamp, image, previous, level=1):
+        self.number = number
+        self.timestamp = timestamp
+        self.image = image
+        self.previous = previous if previous is not None and previous.shape == image.shape else None
+        self.level = level
+        self.messages = {}
+
+    def message(self, kind):
+        if kind not in self.messages:
+            data = self.image if kind == KEYFRAME else np.bitwise_xor(self.image, self.previous)
+            payload = zlib.compress(data.tobytes(), self.level)
+            height, width = self.image.shape[:2]
+            self.messages[kind] = HEADER.pack(kind, self.number, self.timestamp, width, height,
+                                              len(payload)) + payload
+        return self.messages[kind]
+
+class Subscriber:
+    """One client's mailbox: only the newest frame waits to be sent."""
+
+    def __init__(self, writer, window):
+        self.writer = writer
+        self.credits = asyncio.Semaphore(window)
+        self.pending = None
+        self.ready = asyncio.Event()
+        self.last = None
+        self.sent = 0
+        self.dropped = 0
+
+    def offer(self, frame):
+        if self.pending is not None:
+            self.dropped += 1
+        self.pending = frame
+        self.ready.set()
+
+class FrameServer:
+    """Render frames once and stream them to every connected client over TCP.
+
+    render(t) returns a (height, width, 3) uint8 frame; it runs on a worker
+    thread at up to `fps` frames per second of animation time, and only
+    while someone is connected. Each new frame replaces whatever frame a
+    client had not been sent yet, so a client that has `window` frames
+    unacknowledged skips frames instead of queueing them. A client gets a
+    delta against the frame it received last when that is the frame
+    rendered just before, a keyframe otherwise.
+    """
+
+    def __init__(self, render, fps=30.0, window=2, level=1):
+        self.render = render
+        self.fps = fps
+        self.window = window
+        self.level = level
+        self.clients = set()
+        self.handlers = set()
+        self.connected = asyncio.Event()
+        self.rendered = 0
+        self.latest = None
+        self.server = None
+        self.task = None
+
+    async def start(self, host="127.0.0.1", port=0):
+        self.server = await asyncio.start_server(self._serve, host, port)
+        self.task = asyncio.create_task(self._render_loop())
+        return self.server.sockets[0].getsockname()[:2]
+
+    async def close(self):
+        self.task.cancel()
+        self.server.close()
+        # A handler may be waiting for acks that will never come.
+        for client in self.clients:
+            client.writer.close()
+        for handler in self.handlers:
+            handler.cancel()
+        await asyncio.gather(*self.handlers, return_exceptions=True)
+        await self.server.wait_closed()
+
+    async def _render_loop(self):
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        while True:
+            if not self.clients:
+                self.connected.clear()
+                await self.connected.wait()
+                start = time.perf_counter() - self.rendered / self.fps
+            timestamp = time.time()
+            image = await loop.run_in_executor(None, self.render, self.rendered / self.fps)
+            previous = None if self.latest is None else self.latest.image
+            self.latest = Frame(self.rendered, timestamp, image, previous, self.level)
+            for client in self.clients:
+                client.offer(self.latest)
+            self.rendered += 1
+            await asyncio.sleep(max(0.0, start + self.rendered / self.fps - time.perf_counter()))
+
+    async def _serve(self, reader, writer):
+        client = Subscriber(writer, self.window)
+        acks = asyncio.create_task(self._read_acks(reader, client))
+        self.handlers.add(asyncio.current_task())
+        self.clients.add(client)
+        self.connected.set()
+        try:
+            while True:
+                await client.credits.acquire()
+                await client.ready.wait()
+                client.ready.clear()
+                frame, client.pending = client.pending, None
+                if frame is None or acks.done():
+                    break
+                delta = frame.previous is not None and client.last == frame.number - 1
+                writer.write(frame.message(DELTA if delta else KEYFRAME))
+                await writer.drain()
+                client.last = frame.number
+                client.sent += 1
+        except (ConnectionError, asyncio.CancelledError):
+            # Cancelled by close(); asyncio.start_server would log it otherwise.
+            pass
+        finally:
+            self.clients.discard(client)
+            self.handlers.discard(asyncio.current_task())
+            acks.cancel()
+            writer.close()
+
+    @staticmethod
+    async def _read_acks(reader, client):
+        while True:
+            data = await reader.read(4096)
+            if not data:
+                # Disconnected: wake the sender so it notices.
+                client.credits.release()
+                client.ready.set()
+                return
+            for _ in range(data.count(ACK)):
+                client.credits.release()
+
+async def receive(host, port, frames=100, delay=0.0):
+    """Connect to a FrameServer, decode `frames` frames and return latency and throughput stats.
+
+    `delay` seconds of sleep after every frame make a slow viewer.
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    image = None
+    latencies = []
+    received = skipped = payload_bytes = 0
+    last = None
+    try:
+        start = time.perf_counter()
+        while received < frames:
+            kind, number, timestamp, width, height, size = HEADER.unpack(await reader.readexactly(HEADER.size))
+            data = np.frombuffer(zlib.decompress(await reader.readexactly(size)), dtype=np.uint8)
+            data = data.reshape(height, width, 3)
+            if kind == KEYFRAME:
+                image = data.copy()
+            else:
+                np.bitwise_xor(image, data, out=image)
+            latencies.append(time.time() - timestamp)
+            if last is not None:
+                skipped += number - last - 1
+            last = number
+            received += 1
+            payload_bytes += HEADER.size + size
+            if delay:
+                await asyncio.sleep(delay)
+            writer.write(ACK)
+        elapsed = time.perf_counter() - start
+    finally:
+        writer.close()
+    latencies = np.array(latencies) * 1000.0
+    return {
+        "frames": received,
+        "fps": received / elapsed,
+        "skipped": skipped,
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+        "mb_per_s": payload_bytes / elapsed / 2**20,
+        "bytes_per_frame": payload_bytes / received,
+        "last": last,
+        "image": image,
+    }
+
+def engine_frames(engine, width, height):
+    """render(t) for FrameServer: an engine's frames as export.py writes them."""
+    from engines import load_engine
+
+    frame = EXPORTS[engine](load_engine(engine), width, height)
+
+    def render(t):
+        # On the server's worker thread, outside the caller's errstate.
+        with np.errstate(all="ignore"):
+            return np.ascontiguousarray(frame(t))
+    return render
+
+async def bench(engine, width, height, fps, clients, slow, slow_delay, frames):
+    server = FrameServer(engine_frames(engine, width, height), fps)
+    host, port = await server.start()
+    delays = [0.0] * clients + [slow_delay] * slow
+    results = await asyncio.gather(*(receive(host, port, frames, delay) for delay in delays))
+    await server.close()
+
+    print("%-10s %7s %8s %8s %10s %10s %9s %12s" % (
+        "client", "frames", "fps", "skipped", "p50 ms", "p99 ms", "MB/s", "bytes/frame"))
+    for i, (delay, result) in enumerate(zip(delays, results)):
+        print("%-10s %7d %8.2f %8d %10.2f %10.2f %9.2f %12.0f" % (
+            ("slow %d" if delay else "client %d") % i, result["frames"], result["fps"], result["skipped"],
+            result["p50_ms"], result["p99_ms"], result["mb_per_s"], result["bytes_per_frame"]))
+    print("%d frames rendered for %d clients, raw frame %d bytes" % (
+        server.rendered, len(delays), width * height * 3))
+
+def main():
+    from bench import parse_resolution
+    from distributed import parse_address
+
+    parser = argparse.ArgumentParser(description="Stream an engine's frames to remote viewers.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve = commands.add_parser("serve", help="render and stream until interrupted")
+    serve.add_argument("--listen", type=parse_address, default=("0.0.0.0", 5124), metavar="HOST:PORT")
+    client = commands.add_parser("client", help="receive frames and print latency and throughput")
+    client.add_argument("address", type=parse_address, metavar="HOST:PORT")
+    client.add_argument("--frames", type=int, default=300)
+    client.add_argument("--delay", type=float, default=0.0, help="seconds to sleep after each frame")
+    local = commands.add_parser("bench", help="a server and several clients in this process")
+    local.add_argument("--clients", type=int, default=4)
+    local.add_argument("--slow", type=int, default=1, help="extra clients that sleep after each frame")
+    local.add_argument("--slow-delay", type=float, default=0.2)
+    local.add_argument("--frames", type=int, default=60, help="frames each client receives")
+    for command in (serve, local):
+        command.add_argument("--engine", choices=EXPORTS, default="gpt")
+        command.add_argument("--size", type=parse_resolution, default=(320, 240), metavar="WxH")
+        command.add_argument("--fps", type=float, default=30)
+    args = parser.parse_args()
+
+    if args.command == "bench":
+        asyncio.run(bench(args.engine, *args.size, args.fps, args.clients, args.slow,
+                          args.slow_delay, args.frames))
+    elif args.command == "client":
+        result = asyncio.run(receive(*args.address, args.frames, args.delay))
+        print("%d frames at %.2f fps, %d skipped, latency p50 %.2f ms p99 %.2f ms, %.2f MB/s" % (
+            result["frames"], result["fps"], result["skipped"], result["p50_ms"], result["p99_ms"],
+            result["mb_per_s"]))
+    else:
+        async def run():
+            server = FrameServer(engine_frames(args.engine, *args.size), args.fps)
+            print("streaming on %s:%d" % await server.start(*args.listen), flush=True)
+            await asyncio.Event().wait()
+
+        try:
+            asyncio.run(run())
+        except KeyboardInterrupt:
+            pass
+
+if __name__ == "__main__":
+    main()
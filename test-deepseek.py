@@ -1,29 +1,37 @@
 import pygame
 import numpy as np
+import argparse
 import math
+import sys
+from time import perf_counter
 from pygame.locals import *
 
-pygame.init()
-pygame.display.set_caption("Deepseek-R1")
+import profiler
+from backends import get_backend
+from dirty import DirtyRegionTracker
+from gbuffer import GBuffer, window
+from present import SurfacePresenter, surface_order, write_pixels
+
 orig_width, orig_height = 320, 320
 ss_factor = 1
 width, height = orig_width * ss_factor, orig_height * ss_factor
-screen = pygame.display.set_mode((orig_width, orig_height))
-aspect_ratio = width / height
-x = np.linspace(-1, 1, width)
-y = np.linspace(1, -1, height) * (1 / aspect_ratio)
-X, Y = np.meshgrid(x, y)
-Z = -np.ones_like(X)
-ray_dirs = np.stack((X, Y, Z), axis=-1)
-ray_dirs /= np.linalg.norm(ray_dirs, axis=-1, keepdims=True)
 sphere_radius = 1
 sphere_color = np.array([1.0, 0.2, 0.2])
 sphere_specular = np.array([1.0, 1.0, 1.0])
 shininess = 64
 light_color = np.array([1.0, 1.0, 1.0])
 ambient_intensity = 0.1
-time = 0.0
-clock = pygame.time.Clock()
+background = np.array([0.1, 0.2, 0.4])
+
+def make_ray_dirs(width, height):
+    aspect_ratio = width / height
+    x = np.linspace(-1, 1, width)
+    y = np.linspace(1, -1, height) * (1 / aspect_ratio)
+    X, Y = np.meshgrid(x, y)
+    Z = -np.ones_like(X)
+    ray_dirs = np.stack((X, Y, Z), axis=-1)
+    ray_dirs /= np.linalg.norm(ray_dirs, axis=-1, keepdims=True)
+    return ray_dirs
 
 def calculate_intersection(ray_dirs, sphere_center, radius):
     oc = -sphere_center
@@ -50,7 +58,7 @@ def calculate_intersection(ray_dirs, sphere_center, radius):
 
 def calculate_lighting(hit_mask, t, ray_dirs, sphere_center, radius, light_pos):
     hit_indices = np.where(hit_mask)
-    pixels = np.zeros((height, width, 3))
+    pixels = np.zeros(hit_mask.shape + (3,))
     
     if not np.any(hit_mask):
         return pixels
@@ -60,7 +68,13 @@ def calculate_lighting(hit_mask, t, ray_dirs, sphere_center, radius, light_pos):
     P = t_hit[:, np.newaxis] * D_hit
     
     normal = (P - sphere_center) / radius
+    pixels[hit_indices] = shade_points(P, normal, light_pos)
     
+    return pixels
+
+def shade_points(P, normal, light_pos):
+    # Phong color of (n, 3) sphere points, the part of calculate_lighting()
+    # that depends on the light.
     L = light_pos - P
     L_len = np.linalg.norm(L, axis=-1, keepdims=True)
     L_dir = L / L_len
@@ -76,36 +90,331 @@ def calculate_lighting(hit_mask, t, ray_dirs, sphere_center, radius, light_pos):
     specular = (R_dot_V ** shininess)[:, np.newaxis] * light_color * sphere_specular
     
     color = ambient_intensity * sphere_color + diffuse + specular
-    pixels[hit_indices] = np.clip(color, 0, 1)
-    
-    return pixels
+    return np.clip(color, 0, 1)
 
-running = True
-while running:
-    for event in pygame.event.get():
-        if event.type == QUIT:
-            running = False
-    
-    sphere_y = 2.0 * math.sin(time) 
+# scene_state(time) repeats every PERIOD: the sphere's period is 2*pi and
+# the light's 4*pi, 20*pi/7 and 20*pi/3.
+PERIOD = 20 * math.pi
+
+def scene_state(time):
+    sphere_y = 2.0 * math.sin(time)
     sphere_center = np.array([0.0, sphere_y, -4.0])
     light_pos = np.array([
         4.0 * math.cos(time*0.5),
         5.0 + 1.0 * math.sin(time*0.7),
         -3.0 + 2.0 * math.sin(time*0.3)
     ])
-    time += 0.02
-    
-    hit_mask, t = calculate_intersection(ray_dirs, sphere_center, sphere_radius)
-    pixels = calculate_lighting(hit_mask, t, ray_dirs, sphere_center, sphere_radius, light_pos)
-    oc = sphere_center
-    distance_to_center = np.linalg.norm(ray_dirs * np.array([1, aspect_ratio, 1]), axis=-1)
-    soft_mask = np.clip(1.0 - (distance_to_center - sphere_radius) * 0.5, 0.0, 1.0)[..., np.newaxis]
-    background = np.array([0.1, 0.2, 0.4])
-    final_pixels = background * (1 - soft_mask) + pixels * soft_mask
-    surf = pygame.surfarray.make_surface((final_pixels * 255).astype(np.uint8))
-    scaled_surf = pygame.transform.smoothscale(surf, (orig_width, orig_height))
-    screen.blit(scaled_surf, (0, 0))
-    pygame.display.flip()
-    clock.tick(60)
-
-pygame.quit()
\ No newline at end of file
+    return sphere_center, light_pos
+
+def render_frame(time, ray_dirs, aspect_ratio=None, packets=None):
+    # aspect_ratio defaults to the shape of ray_dirs; pass the full frame's
+    # ratio when ray_dirs is only a tile of it. packets (a RayPackets built
+    # from ray_dirs) skips the intersection for tiles that cannot hit.
+    return trace_frame(time, ray_dirs, aspect_ratio, packets)[0]
+
+def trace_frame(time, ray_dirs, aspect_ratio=None, packets=None):
+    # render_frame() that also returns the hit mask and hit distance t
+    # (-1 for misses), for adaptive.py's edge detection.
+    sphere_center, light_pos = scene_state(time)
+    with profiler.stage("intersection"):
+        if packets is None:
+            hit_mask, t = calculate_intersection(ray_dirs, sphere_center, sphere_radius)
+        else:
+            live = packets.live_tiles(sphere_center, sphere_radius)
+            hit_mask, t = calculate_intersection(packets.gather(live), sphere_center, sphere_radius)
+            hit_mask, t = packets.scatter(hit_mask, live, False), packets.scatter(t, live, -1.0)
+    with profiler.stage("lighting"):
+        pixels = calculate_lighting(hit_mask, t, ray_dirs, sphere_center, sphere_radius, light_pos)
+    with profiler.stage("composite"):
+        if aspect_ratio is None:
+            aspect_ratio = ray_dirs.shape[1] / ray_dirs.shape[0]
+        distance_to_center = np.linalg.norm(ray_dirs * np.array([1, aspect_ratio, 1]), axis=-1)
+        soft_mask = np.clip(1.0 - (distance_to_center - sphere_radius) * 0.5, 0.0, 1.0)[..., np.newaxis]
+        return background * (1 - soft_mask) + pixels * soft_mask, hit_mask, t
+
+def render_frame_soa(time, ray_dirs, aspect_ratio=None):
+    # render_frame() for float32 (3, h, w) ray planes from soa.from_aos();
+    # returns the same (h, w, 3) image in float32.
+    import soa
+
+    dtype = ray_dirs.dtype
+    sphere_center, light_pos = scene_state(time)
+    oc = -sphere_center
+    b = 2 * soa.dot(ray_dirs, oc.astype(dtype))
+    c = np.dot(oc, oc) - sphere_radius**2
+    discriminant = b * b - 4 * c
+    hit_mask = discriminant >= 0
+    sqrt_disc = np.sqrt(discriminant[hit_mask])
+    b_hit = b[hit_mask]
+    t0 = (-b_hit - sqrt_disc) / 2
+    t1 = (-b_hit + sqrt_disc) / 2
+    t = np.where((t0 > 0) & (t1 > 0), np.minimum(t0, t1), np.where(t0 > 0, t0, t1))
+    hit_mask[hit_mask] = t > 0
+    t = t[t > 0]
+
+    # Lighting on the compacted (3, n) hit planes.
+    P = ray_dirs[:, hit_mask] * t
+    normal = (P - soa.vec(sphere_center, 2, dtype)) / sphere_radius
+    L = soa.vec(light_pos, 2, dtype) - P
+    L_dir = L / np.sqrt(soa.dot(L, L))
+    N_dot_L = np.maximum(soa.dot(normal, L_dir), 0)
+    R = 2 * N_dot_L * normal - L_dir
+    V_dir = -P / np.sqrt(soa.dot(P, P))
+    R_dot_V = np.maximum(soa.dot(R, V_dir), 0)
+    color = (ambient_intensity * soa.vec(sphere_color, 2, dtype)
+             + N_dot_L * soa.vec(light_color * sphere_color, 2, dtype)
+             + R_dot_V ** shininess * soa.vec(light_color * sphere_specular, 2, dtype))
+    pixels = np.zeros(ray_dirs.shape, dtype)
+    pixels[:, hit_mask] = np.clip(color, 0, 1)
+
+    if aspect_ratio is None:
+        aspect_ratio = ray_dirs.shape[2] / ray_dirs.shape[1]
+    scaled = ray_dirs * soa.vec((1, aspect_ratio, 1), ray_dirs.ndim, dtype)
+    soft_mask = np.clip(1.0 - (np.sqrt(soa.dot(scaled, scaled)) - sphere_radius) * 0.5, 0.0, 1.0)
+    image = soa.vec(background, ray_dirs.ndim, dtype) * (1 - soft_mask) + pixels * soft_mask
+    return np.ascontiguousarray(soa.to_aos(image))
+
+class DeferredRenderer:
+    """render_frame() for a fixed ray grid, shaded from a G-buffer.
+
+    The sphere is re-intersected only inside the rectangle it covered
+    before and after it moved (see gbuffer.py), and the soft edge mask,
+    which depends on the ray directions alone, is computed once. A frame in
+    which only the light moves runs shade_points() on the cached hits and
+    nothing else. The image is the one render_frame() returns.
+    """
+
+    def __init__(self, ray_dirs, aspect_ratio=None):
+        if aspect_ratio is None:
+            aspect_ratio = ray_dirs.shape[1] / ray_dirs.shape[0]
+        self.ray_dirs = ray_dirs
+        self.gbuffer = GBuffer(ray_dirs.shape[:2], objects=1)
+        self.bounds = DirtyRegionTracker(ray_dirs)
+        distance_to_center = np.linalg.norm(ray_dirs * np.array([1, aspect_ratio, 1]), axis=-1)
+        self.soft_mask = np.clip(1.0 - (distance_to_center - sphere_radius) * 0.5, 0.0, 1.0)[..., np.newaxis]
+        # The whole frame where nothing is hit.
+        self.backdrop = background * (1 - self.soft_mask)
+        self.image = self.backdrop.copy()
+        self.hits = None
+
+    def render(self, time):
+        return self.render_state(*scene_state(time))
+
+    def render_state(self, sphere_center, light_pos):
+        gbuffer = self.gbuffer
+        with profiler.stage("intersection"):
+            rect = gbuffer.stale(0, [sphere_center], self.bounds.sphere_bounds(sphere_center, sphere_radius))
+            if rect is not None:
+                area = window(rect)
+                hit_mask, t = calculate_intersection(self.ray_dirs[area], sphere_center, sphere_radius)
+                gbuffer.layers[0][area] = np.where(hit_mask, t, np.inf)
+                gbuffer.resolve(rect)
+                P = t[hit_mask][:, np.newaxis] * self.ray_dirs[area][hit_mask]
+                gbuffer.position[area][hit_mask] = P
+                gbuffer.normal[area][hit_mask] = (P - sphere_center) / sphere_radius
+                self.image[area] = self.backdrop[area]
+                self.hits = np.nonzero(gbuffer.object_id == 1)
+        with profiler.stage("lighting"):
+            color = shade_points(self.gbuffer.position[self.hits], self.gbuffer.normal[self.hits], light_pos)
+        with profiler.stage("composite"):
+            self.image[self.hits] = self.backdrop[self.hits] + color * self.soft_mask[self.hits]
+        return self.image
+
+def main():
+    parser = argparse.ArgumentParser(description="Deepseek-R1 ray tracer")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="render tiles in this many processes into a shared framebuffer")
+    parser.add_argument("--tile-size", type=int, default=64)
+    parser.add_argument("--governor", action="store_true",
+                        help="adapt the render resolution and ss_factor to hold --target-fps")
+    parser.add_argument("--target-fps", type=float, default=60)
+    parser.add_argument("--incremental", action="store_true",
+                        help="re-trace only the region the moving sphere covers")
+    parser.add_argument("--backend", choices=("auto", "numpy", "numba"), default="auto",
+                        help="compute backend; auto uses numba when it is installed")
+    parser.add_argument("--pipelined", action="store_true",
+                        help="trace on a worker thread while the main loop presents the latest frame")
+    parser.add_argument("--adaptive", action="store_true",
+                        help="supersample only edge pixels; SPACE pauses so samples accumulate, H shows samples per pixel")
+    parser.add_argument("--samples", type=int, default=4,
+                        help="samples per edge pixel with --adaptive")
+    parser.add_argument("--deferred", action="store_true",
+                        help="shade from a G-buffer, re-intersecting only where the sphere moved")
+    parser.add_argument("--cache", type=float, metavar="MB",
+                        help="serve frames of states seen before from a frame cache of this many MB; "
+                             "a whole period is 3142 frames, about 920 MB at 320x320")
+    parser.add_argument("--cache-quantum", type=float, default=0.02, metavar="SECONDS",
+                        help="animation times closer than this within a period share a cached frame")
+    parser.add_argument("--cache-spill", metavar="PATH.npy",
+                        help="with --cache, spill evicted frames to this memory-mapped file")
+    parser.add_argument("--profile", metavar="TRACE.json",
+                        help="time each frame stage and write a Chrome trace here at exit")
+    parser.add_argument("--hud", action="store_true",
+                        help="overlay fps and the per-stage breakdown on the window")
+    args = parser.parse_args()
+    if args.governor and args.workers:
+        parser.error("--governor cannot be combined with --workers")
+    if args.incremental and (args.governor or args.workers):
+        parser.error("--incremental cannot be combined with --governor or --workers")
+    if args.pipelined and (args.governor or args.incremental):
+        parser.error("--pipelined cannot be combined with --governor or --incremental")
+    if args.adaptive and (args.governor or args.incremental or args.workers or args.pipelined):
+        parser.error("--adaptive cannot be combined with --governor, --incremental, --workers or --pipelined")
+    if args.deferred and (args.incremental or args.workers or args.adaptive):
+        parser.error("--deferred cannot be combined with --incremental, --workers or --adaptive")
+    if args.cache and args.adaptive:
+        parser.error("--cache cannot be combined with --adaptive")
+    if args.backend == "numba" and (args.workers or args.deferred or args.adaptive):
+        parser.error("--backend numba cannot be combined with --workers, --deferred or --adaptive")
+
+    backend = get_backend(args.backend)
+    module = sys.modules[__name__]
+    tiles = None
+    if args.workers:
+        from parallel import TileRenderer
+        # Started before pygame so the workers do not inherit SDL state.
+        tiles = TileRenderer("deepseek", width, height, args.workers, args.tile_size)
+        render = lambda time, w, h: tiles.render(time)
+    elif args.incremental:
+        ray_dirs = make_ray_dirs(width, height)
+        tracker = DirtyRegionTracker(ray_dirs)
+        frame = np.empty((height, width, 3))
+
+        def render(time, w, h):
+            sphere_center, _ = scene_state(time)
+            # The light only shades the sphere itself, so moving it cannot
+            # change anything outside the sphere's region.
+            region = tracker.dirty_region(sphere_center, sphere_radius)
+            if region is not None:
+                y0, y1, x0, x1 = region
+                frame[y0:y1, x0:x1] = backend.deepseek_frame(
+                    module, time, ray_dirs[y0:y1, x0:x1], aspect_ratio=width / height)
+            return frame
+    elif args.deferred:
+        deferred = {}
+
+        def render(time, w, h):
+            if (w, h) not in deferred:
+                deferred[(w, h)] = DeferredRenderer(surface_order(make_ray_dirs(w, h)))
+            return deferred[(w, h)].render(time)
+    elif args.adaptive:
+        from adaptive import AdaptiveSampler
+        # Frames come out in Surface memory order, see present.py.
+        sampler = AdaptiveSampler(surface_order(make_ray_dirs(width, height)), samples=args.samples)
+
+        def render(time, w, h):
+            trace = lambda dirs: trace_frame(time, dirs, aspect_ratio=width / height)
+            image = sampler.render(trace, scene_state(time))
+            return sampler.heatmap() if show_heatmap else image
+    else:
+        ray_grids = {}
+
+        def render(time, w, h):
+            if (w, h) not in ray_grids:
+                # Frames come out in Surface memory order, see present.py.
+                ray_grids[(w, h)] = surface_order(make_ray_dirs(w, h))
+            return backend.deepseek_frame(module, time, ray_grids[(w, h)])
+
+    cache = None
+    if args.cache:
+        from framecache import FrameCache
+        cache = FrameCache(int(args.cache * 2**20), quantum=(args.cache_quantum, 1), spill=args.cache_spill)
+        uncached = render
+
+        def render(time, w, h):
+            # Cached frames are the quantized framebuffers. Keyed on the
+            # phase, a time step that does not divide PERIOD still lands on
+            # the same keys every period.
+            return cache.get((time % PERIOD, (w, h)), lambda: presenter.quantize(uncached(time, w, h)))
+
+    governor = None
+    if args.governor:
+        import logging
+        from governor import ResolutionGovernor
+        logging.basicConfig(level=logging.INFO, format="%(name)s: %(message)s")
+        governor = ResolutionGovernor((orig_width, orig_height), target_fps=args.target_fps, scale=ss_factor)
+
+    pygame.init()
+    pygame.display.set_caption("Deepseek-R1")
+    screen = pygame.display.set_mode((orig_width, orig_height))
+    clock = pygame.time.Clock()
+    presenter = SurfacePresenter()
+    if args.profile or args.hud:
+        profiler.enable()
+    time = 0.0
+    paused = show_heatmap = False
+    pipeline = None
+    if args.pipelined:
+        from pipeline import FramePipeline
+        # The worker renders as fast as it can, so the animation follows the
+        # wall clock: one 0.02 step per frame at the target frame rate. One
+        # assignment swaps the time reached and when it last resumed (None
+        # while paused), so the worker never sees half an update.
+        animation = (0.0, perf_counter())
+
+        def animation_time():
+            base, resumed = animation
+            return base if resumed is None else base + (perf_counter() - resumed) * 0.02 * args.target_fps
+
+        pipeline = FramePipeline(lambda: render(animation_time(), width, height))
+
+    running = True
+    while running:
+        frame_start = perf_counter()
+        profiler.begin_frame()
+        with profiler.stage("events"):
+            for event in pygame.event.get():
+                if event.type == QUIT:
+                    running = False
+                elif event.type == KEYDOWN and event.key == K_SPACE:
+                    paused = not paused
+                    if pipeline:
+                        animation = (animation_time(), None if paused else perf_counter())
+                elif event.type == KEYDOWN and event.key == K_h:
+                    show_heatmap = not show_heatmap
+
+        if pipeline:
+            final_pixels = pipeline.latest()
+            if final_pixels is None:
+                clock.tick(args.target_fps)
+                continue
+        else:
+            render_width, render_height = governor.render_size if governor else (width, height)
+            with profiler.stage("render"):
+                final_pixels = render(time, render_width, render_height)
+            if not paused:
+                time += 0.02
+
+        # The image's first axis is the Surface's x, as with make_surface().
+        with profiler.stage("write_surface"):
+            surf, pixels = presenter.pixels(*final_pixels.shape[:2])
+            write_pixels(pixels, final_pixels if cache else presenter.quantize(final_pixels))
+            del pixels
+        with profiler.stage("present"):
+            presenter.present(surf, screen)
+        if args.hud:
+            profiler.active().draw_hud(screen)
+        with profiler.stage("flip"):
+            pygame.display.flip()
+        profiler.end_frame()
+        if governor:
+            governor.record(perf_counter() - frame_start)
+        clock.tick(args.target_fps)
+
+    if pipeline:
+        pipeline.close()
+        print(pipeline.report())
+    if tiles is not None:
+        tiles.close()
+    if args.incremental:
+        print("incremental: skipped %.1f%% of pixels" % (100 * tracker.skipped_fraction))
+    if cache:
+        print(cache.report())
+    if profiler.active():
+        print(profiler.active().report())
+        if args.profile:
+            profiler.active().export_chrome_trace(args.profile)
+    pygame.quit()
+
+if __name__ == "__main__":
+    main()
@@ -3,13 +3,15 @@ import numpy as np
 from OpenGL.GL import *
 from OpenGL.GLU import *
 
+import profiler
+from framecache import FrameCache, quantize
+
 width, height = 320, 320
 sphere_radius = 0.5
 sphere_center = np.array([0.0, 0.0, 0.0])
 light_position = np.array([5.0, 5.0, 5.0])
 light_intensity = np.array([1.0, 1.0, 1.0])
 background_color = np.array([0.1, 0.1, 0.1, 1.0])
-pygame.display.set_caption("Gemini-2")
 
 sphere_color = np.array([0.8, 0.2, 0.2]) 
 sphere_specular = np.array([0.5, 0.5, 0.5])
@@ -18,6 +20,12 @@ camera_position = np.array([0.0, 0.0, 2.0])
 camera_direction = np.array([0.0, 0.0, -1.0])
 camera_up = np.array([0.0, 1.0, 0.0])
 
+# When True the whole frame is traced with array operations and uploaded
+# with a single glDrawPixels; press B to switch to the per-pixel GL_POINTS path.
+batched_mode = True
+# Press C to serve frames of sphere positions seen before from a FrameCache.
+frame_cache = None
+
 def ray_trace(ray_origin, ray_direction):
     oc = ray_origin - sphere_center
     a = np.dot(ray_direction, ray_direction)
@@ -44,7 +52,67 @@ def ray_trace(ray_origin, ray_direction):
 
     return background_color
 
+def ray_directions():
+    x_ndc = (np.arange(width) + 0.5) / width * 2.0 - 1.0
+    y_ndc = (np.arange(height) + 0.5) / height * 2.0 - 1.0
+    ray_directions = np.empty((height, width, 3))
+    ray_directions[..., 0] = x_ndc[np.newaxis, :]
+    ray_directions[..., 1] = -y_ndc[:, np.newaxis]
+    ray_directions[..., 2] = -1.0
+    return ray_directions / np.linalg.norm(ray_directions, axis=-1, keepdims=True)
+
+def ray_trace_frame(ray_origin, ray_directions):
+    """Vectorized ray_trace: returns a (height, width, 4) RGBA frame."""
+    oc = ray_origin - sphere_center
+    a = np.sum(ray_directions * ray_directions, axis=-1)
+    b = 2.0 * (ray_directions @ oc)
+    c = np.dot(oc, oc) - sphere_radius * sphere_radius
+    discriminant = b * b - 4 * a * c
+    sqrt_disc = np.sqrt(np.maximum(discriminant, 0.0))
+    t = np.minimum((-b - sqrt_disc) / (2.0 * a), (-b + sqrt_disc) / (2.0 * a))
+    hit = (discriminant > 0) & (t > 0)
+
+    frame = np.empty(ray_directions.shape[:2] + (4,))
+    frame[:] = background_color
+    if not np.any(hit):
+        return frame
+
+    d = ray_directions[hit]
+    intersection_point = ray_origin + t[hit, np.newaxis] * d
+    normal = (intersection_point - sphere_center) / sphere_radius
+    light_direction = light_position - intersection_point
+    light_direction /= np.linalg.norm(light_direction, axis=-1, keepdims=True)
+    n_dot_l = np.sum(normal * light_direction, axis=-1, keepdims=True)
+    diffuse_intensity = np.maximum(0.0, n_dot_l) * sphere_color * light_intensity
+    reflection_direction = 2.0 * n_dot_l * normal - light_direction
+    r_dot_v = np.sum(reflection_direction * -d, axis=-1, keepdims=True)
+    specular_intensity = np.power(np.maximum(0.0, r_dot_v), sphere_shininess) * sphere_specular * light_intensity
+    frame[hit, :3] = diffuse_intensity + specular_intensity
+    frame[hit, 3] = 1.0
+    return frame
+
+def render_frame_batched(sphere_y):
+    sphere_center[1] = sphere_y
+    with profiler.stage("trace"):
+        if frame_cache is not None:
+            frame = frame_cache.get((sphere_center, (width, height)),
+                                    lambda: quantize(ray_trace_frame(camera_position, ray_directions())))
+        else:
+            frame = ray_trace_frame(camera_position, ray_directions())
+    with profiler.stage("glDrawPixels"):
+        glRasterPos2f(-1.0, -1.0)
+        if frame.dtype == np.uint8:
+            glDrawPixels(width, height, GL_RGBA, GL_UNSIGNED_BYTE, frame)
+        else:
+            glDrawPixels(width, height, GL_RGBA, GL_FLOAT, frame.astype(np.float32))
+
 def render_frame(sphere_y):
+    if batched_mode:
+        render_frame_batched(sphere_y)
+    else:
+        render_frame_points(sphere_y)
+
+def render_frame_points(sphere_y):
     glBegin(GL_POINTS)
     for x in range(width):
         for y in range(height):
@@ -61,33 +129,50 @@ def render_frame(sphere_y):
             glVertex2f(x / width * 2 -1 , y / height * 2 - 1)
     glEnd()
 
-pygame.init()
-screen = pygame.display.set_mode((width, height), pygame.OPENGL | pygame.DOUBLEBUF)
-glViewport(0, 0, width, height)
-glClearColor(*background_color)
-glMatrixMode(GL_PROJECTION)
-glLoadIdentity()
-glOrtho(-1, 1, -1, 1, -1, 1)
-glMatrixMode(GL_MODELVIEW)
-glLoadIdentity()
-running = True
-sphere_y = 0.0
-sphere_y_speed = 0.01
-
-while running:
-    for event in pygame.event.get():
-        if event.type == pygame.QUIT:
-            running = False
-
-    glClear(GL_COLOR_BUFFER_BIT)
-
-    sphere_y += sphere_y_speed
-    if sphere_y > 0.8 or sphere_y < -0.8:
-        sphere_y_speed *= -1
-
-    render_frame(sphere_y)
-
-    pygame.display.flip()
-    pygame.time.Clock().tick(60)
-
-pygame.quit()
\ No newline at end of file
+def main():
+    global batched_mode, frame_cache
+    profiler.enable_from_env()
+    pygame.init()
+    pygame.display.set_caption("Gemini-2")
+    pygame.display.set_mode((width, height), pygame.OPENGL | pygame.DOUBLEBUF)
+    glViewport(0, 0, width, height)
+    glClearColor(*background_color)
+    glMatrixMode(GL_PROJECTION)
+    glLoadIdentity()
+    glOrtho(-1, 1, -1, 1, -1, 1)
+    glMatrixMode(GL_MODELVIEW)
+    glLoadIdentity()
+    running = True
+    sphere_y = 0.0
+    sphere_y_speed = 0.01
+
+    while running:
+        profiler.begin_frame()
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                running = False
+            elif event.type == pygame.KEYDOWN and event.key == pygame.K_b:
+                batched_mode = not batched_mode
+            elif event.type == pygame.KEYDOWN and event.key == pygame.K_c:
+                # sphere_y only drifts by rounding errors between bounces.
+                frame_cache = FrameCache(quantum=1e-4) if frame_cache is None else None
+
+        glClear(GL_COLOR_BUFFER_BIT)
+
+        sphere_y += sphere_y_speed
+        if sphere_y > 0.8 or sphere_y < -0.8:
+            sphere_y_speed *= -1
+
+        render_frame(sphere_y)
+
+        with profiler.stage("flip"):
+            pygame.display.flip()
+        profiler.end_frame()
+        pygame.time.Clock().tick(60)
+
+    if frame_cache is not None:
+        print(frame_cache.report())
+    pygame.quit()
+
+if __name__ == "__main__":
+    main()
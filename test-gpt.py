@@ -1,10 +1,22 @@
 import pygame
 import numpy as np
+import argparse
 import sys
 import time
 
-def normalize(v):
-    norm = np.linalg.norm(v, axis=-1, keepdims=True)
+import profiler
+import soa
+from backends import get_backend
+from bvh import SphereBVH
+from dirty import DirtyRegionTracker
+from gbuffer import GBuffer, union, window
+from scene import AMBIENT, COLOR, DIFFUSE, REFLECTIVITY, SHININESS, SPECULAR, MaterialTable, load_scene
+from present import SurfacePresenter, write_pixels
+
+# normalize() and reflect() take the vector axis: -1/2 for (h, w, 3) rays,
+# 0 for the float32 (3, h, w) planes of soa.py.
+def normalize(v, axis=-1):
+    norm = np.linalg.norm(v, axis=axis, keepdims=True)
     return v / (norm + 1e-8)
 
 def intersect_sphere(ray_origin, ray_dir, sphere_center, sphere_radius):
@@ -37,32 +49,52 @@ def intersect_plane(ray_origin, ray_dir, plane_point, plane_normal):
     t[valid] = np.where(t_val[valid] > 1e-3, t_val[valid], np.inf)
     return t
 
-def reflect(I, N):
-    return I - 2 * np.expand_dims(np.sum(I * N, axis=2), axis=2) * N
+def reflect(I, N, axis=2):
+    return I - 2 * np.expand_dims(np.sum(I * N, axis=axis), axis=axis) * N
 
-def render_scene(time_elapsed, width, height):
-    camera = np.array([0.0, 0.0, 0.0])
-    sphere_center = np.array([0.0, 1.0 + 0.5 * np.sin(time_elapsed * 2), 5.0])
-    sphere_radius = 1.0
-    plane_point = np.array([0.0, -1.0, 0.0])
-    plane_normal = np.array([0.0, 1.0, 0.0])
-    light_pos = np.array([5.0 * np.cos(time_elapsed), 5.0, 5.0 * np.sin(time_elapsed)])
-    material_sphere = {
-        "color": np.array([1.0, 0.0, 0.0]),
-        "ambient": 0.1,
-        "diffuse": 0.6,
-        "specular": 0.3,
-        "shininess": 50,
-    }
-    material_plane = {
-        "color": np.array([0.5, 0.5, 0.5]),
-        "ambient": 0.1,
-        "diffuse": 0.9,
-        "specular": 0.0,
-        "shininess": 1,
-    }
+CAMERA = np.array([0.0, 0.0, 0.0])
+SPHERE_RADIUS = 1.0
+PLANE_POINT = np.array([0.0, -1.0, 0.0])
+PLANE_NORMAL = np.array([0.0, 1.0, 0.0])
+MATERIAL_SPHERE = {
+    "color": np.array([1.0, 0.0, 0.0]),
+    "ambient": 0.1,
+    "diffuse": 0.6,
+    "specular": 0.3,
+    "shininess": 50,
+    "reflectivity": 0.4,
+}
+MATERIAL_PLANE = {
+    "color": np.array([0.5, 0.5, 0.5]),
+    "ambient": 0.1,
+    "diffuse": 0.9,
+    "specular": 0.0,
+    "shininess": 1,
+    "reflectivity": 0.25,
+}
+BACKGROUND_COLOR = np.array([0.2, 0.2, 0.2])
+# Row i is the material of object id i (0 = nothing hit).
+MATERIALS = MaterialTable({
+    "none": {"color": (0.0, 0.0, 0.0), "ambient": 0.0, "diffuse": 0.0, "shininess": 0},
+    "sphere": MATERIAL_SPHERE,
+    "plane": MATERIAL_PLANE,
+})
+FOV = np.pi / 3
+
+def scene_at(time_elapsed):
+    sphere_center, light_pos = scenes_at([time_elapsed])
+    return sphere_center.reshape(3), light_pos.reshape(3)
+
+def scenes_at(times):
+    """scene_at() for an array of T times, as (3, T, 1) planes (see soa.py)."""
+    times = np.asarray(times, dtype=float).reshape(1, -1, 1)
+    zeros = np.zeros_like(times)
+    sphere_center = np.concatenate([zeros, 1.0 + 0.5 * np.sin(times * 2), zeros + 5.0])
+    light_pos = np.concatenate([5.0 * np.cos(times), zeros + 5.0, 5.0 * np.sin(times)])
+    return sphere_center, light_pos
+
+def camera_rays(width, height, fov=FOV):
     aspect = width / height
-    fov = np.pi / 3
     i = np.arange(width)
     j = np.arange(height)
     px, py = np.meshgrid(i, j)
@@ -70,87 +102,795 @@ def render_scene(time_elapsed, width, height):
     y = (1 - 2 * (py + 0.5) / height) * np.tan(fov / 2)
     z = np.ones_like(x)
     ray_dir = np.stack((x, y, z), axis=2)
-    ray_dir = normalize(ray_dir)
-    ray_origin = camera
-    t_sphere = intersect_sphere(ray_origin, ray_dir, sphere_center, sphere_radius)
-    t_plane = intersect_plane(ray_origin, ray_dir, plane_point, plane_normal)
-    t = np.minimum(t_sphere, t_plane)
-    object_hit = np.zeros((height, width), dtype=np.int32)
-    object_hit[t_sphere < t_plane] = 1
-    object_hit[t_plane < t_sphere] = 2
-    image = np.zeros((height, width, 3))
-    hit_mask = t < np.inf
-    p = ray_dir * t[..., np.newaxis]
-    normal = np.zeros_like(p)
-    mask_sphere = object_hit == 1
-    if np.any(mask_sphere):
-        normal[mask_sphere] = normalize(p[mask_sphere] - sphere_center)
-    mask_plane = object_hit == 2
-    if np.any(mask_plane):
-        normal[mask_plane] = plane_normal
-    view_dir = normalize(camera - p)
-    L = normalize(light_pos - p)
+    return normalize(ray_dir)
+
+def render_scene(time_elapsed, width, height):
+    return trace_rays(time_elapsed, camera_rays(width, height))
+
+# Peak bytes trace_batch() allocates per ray and frame, measured with
+# tracemalloc; render_scenes() sizes its chunks with it.
+BATCH_BYTES_PER_RAY = 300
+
+def render_scenes(times, width, height, max_bytes=16 * 2**20):
+    """render_scene() for every time in `times`, with time as an extra leading axis.
+
+    Frames are traced together, as many per chunk as keep the temporaries
+    under max_bytes (at least one), and yielded chunk by chunk as
+    (T, height, width, 3) uint8 arrays.
+    """
+    times = np.asarray(times, dtype=float).ravel()
+    ray_dir = soa.from_aos(camera_rays(width, height).reshape(1, -1, 3), np.float64)
+    # The plane does not move: its hits are shared by every frame.
+    t_plane = soa.intersect_plane(CAMERA, ray_dir, PLANE_POINT, PLANE_NORMAL)
+    chunk = max(1, int(max_bytes // (BATCH_BYTES_PER_RAY * width * height)))
+    for start in range(0, len(times), chunk):
+        sphere_center, light_pos = scenes_at(times[start:start + chunk])
+        yield trace_batch(ray_dir, t_plane, sphere_center, light_pos).reshape(-1, height, width, 3)
+
+def trace_batch(ray_dir, t_plane, sphere_center, light_pos):
+    """trace_rays() for (3, 1, n) float64 ray planes in T scenes at once.
+
+    sphere_center and light_pos are (3, T, 1) as scenes_at() returns them,
+    t_plane the (1, n) plane distances. Only rays that hit something are
+    shaded, gathered into (3, hits) planes; plane-wise sums add the
+    components in the same order as trace_rays(), so each (n, 3) image of
+    the (T, n, 3) result matches it exactly.
+    """
+    with profiler.stage("primary"):
+        t_sphere = soa.intersect_sphere(CAMERA, ray_dir, sphere_center, SPHERE_RADIUS)
+        t = np.minimum(t_sphere, t_plane)
+        frame, ray = np.nonzero(t < np.inf)
+        object_hit = np.where(t_sphere < t_plane, 1, np.where(t_plane < t_sphere, 2, 0))[frame, ray]
+    with profiler.stage("surface"):
+        p = ray_dir[:, 0, ray] * t[frame, ray]
+        center, light = sphere_center[:, frame, 0], light_pos[:, frame, 0]
+        normal = np.where(object_hit == 1, normalize(p - center, axis=0),
+                          np.where(object_hit == 2, soa.vec(PLANE_NORMAL, 2, np.float64), 0.0))
+        view_dir = normalize(soa.vec(CAMERA, 2, np.float64) - p, axis=0)
+        to_light = light - p
+        L = normalize(to_light, axis=0)
+    with profiler.stage("shadow"):
+        shadow_origin = p + normal * 1e-3
+        t_shadow = np.minimum(soa.intersect_sphere(shadow_origin, L, center, SPHERE_RADIUS),
+                              soa.intersect_plane(shadow_origin, L, PLANE_POINT, PLANE_NORMAL))
+        in_shadow = t_shadow < np.linalg.norm(to_light, axis=0)
+    with profiler.stage("shading"):
+        material = soa.from_aos(MATERIALS.gather(object_hit), np.float64)
+        shading = shade_soa(normal, L, view_dir, material, material[AMBIENT] * material[COLOR], in_shadow)
+    with profiler.stage("quantize"):
+        image = np.empty(t.shape + (3,), dtype=np.uint8)
+        image[...] = (np.clip(BACKGROUND_COLOR, 0, 1) * 255).astype(np.uint8)
+        image[frame, ray] = (np.clip(shading, 0, 1) * 255).astype(np.uint8).T
+    return image
+
+def shade_soa(normal, L, view_dir, material, ambient_term, in_shadow):
+    """The shading step of trace_rays() on SoA planes.
+
+    material holds the material table's columns as planes, ambient_term
+    its ambient times color. Plane-wise sums add the components in the
+    same order as trace_rays(), so float64 planes give its exact colors.
+    """
+    mat_color = material[COLOR]
+    dot_nl = np.maximum(soa.dot(normal, L), 0)
+    diffuse_term = material[DIFFUSE] * mat_color * dot_nl
+    R = normalize(reflect(-L, normal, axis=0), axis=0)
+    dot_rv = np.maximum(soa.dot(R, view_dir), 0)
+    specular_term = material[SPECULAR] * dot_rv ** material[SHININESS]
+    return ambient_term + np.where(in_shadow, 0, diffuse_term + specular_term)
+
+def trace_rays(time_elapsed, ray_dir, packets=None):
+    """Shade an (h, w, 3) grid of camera rays, e.g. the whole frame or one tile.
+
+    With `packets` (a packets.RayPackets built from ray_dir) sphere tests
+    are skipped for tiles of primary and shadow rays that cannot hit it.
+    """
+    height, width = ray_dir.shape[:2]
+    sphere_center, light_pos = scene_at(time_elapsed)
+    ray_origin = CAMERA
+    with profiler.stage("primary"):
+        if packets is None:
+            t_sphere = intersect_sphere(ray_origin, ray_dir, sphere_center, SPHERE_RADIUS)
+        else:
+            live = packets.live_tiles(sphere_center, SPHERE_RADIUS)
+            t_sphere = packets.scatter(
+                intersect_sphere(ray_origin, packets.gather(live), sphere_center, SPHERE_RADIUS), live, np.inf)
+        t_plane = intersect_plane(ray_origin, ray_dir, PLANE_POINT, PLANE_NORMAL)
+        t = np.minimum(t_sphere, t_plane)
+        object_hit = np.zeros((height, width), dtype=np.int32)
+        object_hit[t_sphere < t_plane] = 1
+        object_hit[t_plane < t_sphere] = 2
+    with profiler.stage("surface"):
+        image = np.zeros((height, width, 3))
+        hit_mask = t < np.inf
+        p = ray_dir * t[..., np.newaxis]
+        normal = np.zeros_like(p)
+        mask_sphere = object_hit == 1
+        if np.any(mask_sphere):
+            normal[mask_sphere] = normalize(p[mask_sphere] - sphere_center)
+        mask_plane = object_hit == 2
+        if np.any(mask_plane):
+            normal[mask_plane] = PLANE_NORMAL
+        view_dir = normalize(CAMERA - p)
+        L = normalize(light_pos - p)
+    with profiler.stage("shadow"):
+        epsilon = 1e-3
+        shadow_origin = p + normal * epsilon
+        if packets is None:
+            t_shadow_sphere = intersect_sphere(shadow_origin, L, sphere_center, SPHERE_RADIUS)
+        else:
+            live = packets.shadow_live_tiles(shadow_origin, light_pos, sphere_center, SPHERE_RADIUS)
+            t_shadow_sphere = packets.scatter(intersect_sphere(
+                packets.gather(live, shadow_origin), packets.gather(live, L), sphere_center, SPHERE_RADIUS), live, np.inf)
+        t_shadow_plane = intersect_plane(shadow_origin, L, PLANE_POINT, PLANE_NORMAL)
+        t_shadow = np.minimum(t_shadow_sphere, t_shadow_plane)
+        dist_to_light = np.linalg.norm(light_pos - p, axis=2)
+        in_shadow = t_shadow < dist_to_light
+    with profiler.stage("shading"):
+        material = MATERIALS.gather(object_hit)
+        mat_color = material[..., COLOR]
+        mat_ambient, mat_diffuse, mat_specular, mat_shininess = (
+            material[..., column] for column in (AMBIENT, DIFFUSE, SPECULAR, SHININESS))
+        dot_nl = np.sum(normal * L, axis=2)
+        dot_nl = np.maximum(dot_nl, 0)
+        diffuse_term = mat_diffuse[..., np.newaxis] * mat_color * dot_nl[..., np.newaxis]
+        R = reflect(-L, normal)
+        R = normalize(R)
+        dot_rv = np.sum(R * view_dir, axis=2)
+        dot_rv = np.maximum(dot_rv, 0)
+        specular_term = mat_specular[..., np.newaxis] * (
+            dot_rv[..., np.newaxis] ** mat_shininess[..., np.newaxis]
+        )
+        ambient_term = mat_ambient[..., np.newaxis] * mat_color
+        shading = ambient_term + np.where(in_shadow[..., np.newaxis], 0, diffuse_term + specular_term)
+        image[hit_mask] = shading[hit_mask]
+        image[~hit_mask] = BACKGROUND_COLOR
+    with profiler.stage("quantize"):
+        image = np.clip(image, 0, 1)
+        image = (image * 255).astype(np.uint8)
+    return image
+
+def trace_rays_soa(time_elapsed, ray_dir):
+    """trace_rays() for float32 (3, h, w) ray planes (soa.from_aos(camera_rays(...))).
+
+    Every intermediate stays float32 and planar; only the final uint8
+    image is interleaved back to (h, w, 3).
+    """
+    dtype = ray_dir.dtype
+    ndim = ray_dir.ndim
+    sphere_center, light_pos = scene_at(time_elapsed)
+    t_sphere = soa.intersect_sphere(CAMERA, ray_dir, sphere_center, SPHERE_RADIUS)
+    t_plane = soa.intersect_plane(CAMERA, ray_dir, PLANE_POINT, PLANE_NORMAL)
+    mask_sphere = t_sphere < t_plane
+    mask_plane = t_plane < t_sphere
+    hit_mask = mask_sphere | mask_plane
+    t = np.where(hit_mask, np.minimum(t_sphere, t_plane), 0)
+    p = ray_dir * t
+    normal = np.where(mask_sphere, normalize(p - soa.vec(sphere_center, ndim, dtype), axis=0),
+                      soa.vec(PLANE_NORMAL, ndim, dtype))
+    view_dir = normalize(soa.vec(CAMERA, ndim, dtype) - p, axis=0)
+    to_light = soa.vec(light_pos, ndim, dtype) - p
+    L = normalize(to_light, axis=0)
     epsilon = 1e-3
     shadow_origin = p + normal * epsilon
-    t_shadow_sphere = intersect_sphere(shadow_origin, L, sphere_center, sphere_radius)
-    t_shadow_plane = intersect_plane(shadow_origin, L, plane_point, plane_normal)
-    t_shadow = np.minimum(t_shadow_sphere, t_shadow_plane)
-    dist_to_light = np.linalg.norm(light_pos - p, axis=2)
-    in_shadow = t_shadow < dist_to_light
-    mat_ambient = np.zeros((height, width))
-    mat_diffuse = np.zeros((height, width))
-    mat_specular = np.zeros((height, width))
-    mat_shininess = np.zeros((height, width))
-    mat_color = np.zeros((height, width, 3))
-    mat_ambient[mask_sphere] = material_sphere["ambient"]
-    mat_diffuse[mask_sphere] = material_sphere["diffuse"]
-    mat_specular[mask_sphere] = material_sphere["specular"]
-    mat_shininess[mask_sphere] = material_sphere["shininess"]
-    mat_color[mask_sphere] = material_sphere["color"]
-    mat_ambient[mask_plane] = material_plane["ambient"]
-    mat_diffuse[mask_plane] = material_plane["diffuse"]
-    mat_specular[mask_plane] = material_plane["specular"]
-    mat_shininess[mask_plane] = material_plane["shininess"]
-    mat_color[mask_plane] = material_plane["color"]
-    dot_nl = np.sum(normal * L, axis=2)
-    dot_nl = np.maximum(dot_nl, 0)
-    diffuse_term = mat_diffuse[..., np.newaxis] * mat_color * dot_nl[..., np.newaxis]
-    R = reflect(-L, normal)
-    R = normalize(R)
-    dot_rv = np.sum(R * view_dir, axis=2)
-    dot_rv = np.maximum(dot_rv, 0)
-    specular_term = mat_specular[..., np.newaxis] * (
-        dot_rv[..., np.newaxis] ** mat_shininess[..., np.newaxis]
-    )
-    ambient_term = mat_ambient[..., np.newaxis] * mat_color
-    shading = ambient_term + np.where(in_shadow[..., np.newaxis], 0, diffuse_term + specular_term)
-    image[hit_mask] = shading[hit_mask]
-    solid_color = np.array([0.2, 0.2, 0.2])
-    image[~hit_mask] = solid_color
+    t_shadow = np.minimum(soa.intersect_sphere(shadow_origin, L, sphere_center, SPHERE_RADIUS),
+                          soa.intersect_plane(shadow_origin, L, PLANE_POINT, PLANE_NORMAL))
+    in_shadow = t_shadow < np.sqrt(soa.dot(to_light, to_light))
+    # One gather from the transposed table gives (8, h, w) material planes.
+    material = MATERIALS.rows.T.astype(dtype)[:, np.where(mask_sphere, 1, 2)]
+    image = shade_soa(normal, L, view_dir, material, material[AMBIENT] * material[COLOR], in_shadow)
+    image = np.where(hit_mask, image, soa.vec(BACKGROUND_COLOR, ndim, dtype))
     image = np.clip(image, 0, 1)
-    image = (image * 255).astype(np.uint8)
-    return image
+    return np.ascontiguousarray(soa.to_aos((image * 255).astype(np.uint8)))
+
+def trace_reflections(time_elapsed, ray_dir, max_depth=2, active_counts=None):
+    """trace_rays() plus mirror bounces up to max_depth for reflective materials.
+
+    Rays are kept as a compacted (n, 3) stream: after every bounce only the
+    rays that hit a surface with nonzero reflectivity are carried on, and
+    shadow rays are cast only for hits whose diffuse or specular term is
+    nonzero. A hit contributes (1 - reflectivity) of its local shading and
+    passes the rest to the next bounce; the last bounce keeps it all, so
+    max_depth=0 matches trace_rays(). The number of rays traced at each
+    depth is added to `active_counts`, a (max_depth + 1,) array of totals.
+    """
+    height, width = ray_dir.shape[:2]
+    sphere_center, light_pos = scene_at(time_elapsed)
+    pixel = np.arange(height * width)
+    directions = ray_dir.reshape(-1, 3)
+    origins = np.broadcast_to(CAMERA, directions.shape)
+    weight = np.ones(len(pixel))
+    image = np.zeros((height * width, 3))
+    for depth in range(max_depth + 1):
+        if active_counts is not None:
+            active_counts[depth] += len(pixel)
+        if not len(pixel):
+            continue
+        # The (h, w, 3) intersection helpers take the stream as an (n, 1, 3) grid.
+        t_sphere = intersect_sphere(origins[:, np.newaxis], directions[:, np.newaxis], sphere_center, SPHERE_RADIUS)[:, 0]
+        t_plane = intersect_plane(origins[:, np.newaxis], directions[:, np.newaxis], PLANE_POINT, PLANE_NORMAL)[:, 0]
+        miss = ~((t_sphere < t_plane) | (t_plane < t_sphere))
+        image[pixel[miss]] += weight[miss, np.newaxis] * BACKGROUND_COLOR
+
+        hit = np.flatnonzero(~miss)
+        pixel, weight, origins, directions = pixel[hit], weight[hit], origins[hit], directions[hit]
+        on_sphere = (t_sphere < t_plane)[hit]
+        p = origins + directions * np.minimum(t_sphere, t_plane)[hit, np.newaxis]
+        normal = np.where(on_sphere[:, np.newaxis], normalize(p - sphere_center), PLANE_NORMAL)
+        material = MATERIALS.gather(np.where(on_sphere, 1, 2))
+        view_dir = normalize(origins - p)
+        L = normalize(light_pos - p)
+        dot_nl = np.maximum(np.sum(normal * L, axis=-1), 0)
+        R = normalize(reflect(-L, normal, axis=-1))
+        dot_rv = np.maximum(np.sum(R * view_dir, axis=-1), 0)
+        lit_term = (material[:, DIFFUSE, np.newaxis] * material[:, COLOR] * dot_nl[:, np.newaxis]
+                    + (material[:, SPECULAR] * dot_rv ** material[:, SHININESS])[:, np.newaxis])
+
+        # Shadow rays only where being lit changes the result.
+        needs_shadow = np.flatnonzero(np.any(lit_term != 0, axis=-1))
+        shadow_p = p[needs_shadow]
+        shadow_origin = shadow_p + normal[needs_shadow] * 1e-3
+        shadow_L = L[needs_shadow]
+        t_shadow = np.minimum(
+            intersect_sphere(shadow_origin[:, np.newaxis], shadow_L[:, np.newaxis], sphere_center, SPHERE_RADIUS),
+            intersect_plane(shadow_origin[:, np.newaxis], shadow_L[:, np.newaxis], PLANE_POINT, PLANE_NORMAL))[:, 0]
+        in_shadow = np.zeros(len(pixel), dtype=bool)
+        in_shadow[needs_shadow] = t_shadow < np.linalg.norm(light_pos - shadow_p, axis=-1)
+        lit_term[in_shadow] = 0
+
+        reflectivity = material[:, REFLECTIVITY] if depth < max_depth else np.zeros(len(pixel))
+        local = material[:, AMBIENT, np.newaxis] * material[:, COLOR] + lit_term
+        image[pixel] += (weight * (1 - reflectivity))[:, np.newaxis] * local
+
+        bounce = np.flatnonzero(reflectivity > 0)
+        pixel, on_sphere = pixel[bounce], on_sphere[bounce]
+        weight = weight[bounce] * reflectivity[bounce]
+        normal = normal[bounce]
+        origins = p[bounce] + normal * 1e-3
+        directions = normalize(reflect(directions[bounce], normal, axis=-1))
+    image = np.clip(image.reshape(height, width, 3), 0, 1)
+    return (image * 255).astype(np.uint8)
+
+class SphereScene:
+    """Spheres bobbing over a plane, traced through a SphereBVH.
+
+    Positions and radii are (N, 3)/(N,) arrays and material_ids index the
+    rows of a scene.MaterialTable; every sphere moves like the one in
+    render_scene, offset by its own phase. Plane, light and background
+    default to render_scene's; light=None keeps its light animated.
+    """
+
+    def __init__(self, centers, radii, material_ids, materials, phases=None, plane_material=None,
+                 plane_point=PLANE_POINT, plane_normal=PLANE_NORMAL, light=None, background=BACKGROUND_COLOR):
+        self.base_centers = np.asarray(centers, dtype=float)
+        self.radii = np.asarray(radii, dtype=float)
+        self.material_ids = np.asarray(material_ids, dtype=np.intp)
+        self.materials = materials
+        self.phases = np.zeros(len(self.radii)) if phases is None else np.asarray(phases, dtype=float)
+        self.plane_material = materials.index("plane") if plane_material is None else plane_material
+        self.plane_point = plane_point
+        self.plane_normal = plane_normal
+        self.light = light
+        self.background = background
+        self.bvh = SphereBVH(self.base_centers, self.radii)
+
+    @classmethod
+    def from_file(cls, path):
+        """Load a JSON scene file (see scene.py)."""
+        scene = load_scene(path)
+        return cls(scene.centers, scene.radii, scene.material_ids, scene.materials, scene.phases,
+                   scene.plane_material, scene.plane_point, scene.plane_normal, scene.light, scene.background)
+
+    def centers_at(self, time_elapsed):
+        centers = self.base_centers.copy()
+        centers[:, 1] += 0.5 * np.sin(time_elapsed * 2 + self.phases)
+        return centers
+
+def random_sphere_scene(count, seed=0):
+    if count < 1:
+        raise ValueError("a random scene needs at least one sphere, got %d" % count)
+    rng = np.random.default_rng(seed)
+    radius = min(1.0, 2.5 / count ** (1 / 3))
+    centers = np.column_stack((
+        rng.uniform(-8.0, 8.0, count),
+        rng.uniform(0.0, 4.0, count),
+        rng.uniform(6.0, 30.0, count),
+    ))
+    radii = rng.uniform(0.5, 1.0, count) * radius
+    colors = rng.uniform(0.2, 1.0, (count, 3))
+    phases = rng.uniform(0.0, 2 * np.pi, count)
+    # Sphere i gets material i + 1: MATERIAL_SPHERE in its own color.
+    materials = MaterialTable(dict(
+        [("plane", MATERIAL_PLANE)]
+        + [("sphere%d" % i, dict(MATERIAL_SPHERE, color=color)) for i, color in enumerate(colors)]))
+    return SphereScene(centers, radii, np.arange(1, count + 1), materials, phases)
+
+def render_sphere_scene(scene, time_elapsed, width, height):
+    """render_scene for a SphereScene: primary and shadow rays go through the BVH."""
+    centers = scene.centers_at(time_elapsed)
+    scene.bvh.refit(centers, scene.radii)
+    light_pos = scene_at(time_elapsed)[1] if scene.light is None else scene.light
+    plane_point, plane_normal = scene.plane_point, scene.plane_normal
+    ray_dir = camera_rays(width, height)
+    rays = ray_dir.reshape(-1, 3)
+    # Spheres behind the plane can never win, so the plane distance bounds
+    # the traversal of every primary ray.
+    t_plane = intersect_plane(CAMERA, ray_dir, plane_point, plane_normal).ravel()
+    t_sphere, sphere_id = scene.bvh.intersect(CAMERA, rays, t_max=t_plane)
+    image = np.empty((len(rays), 3))
+    image[:] = scene.background
+
+    # Shade only the rays that hit something.
+    hit = np.flatnonzero(np.minimum(t_sphere, t_plane) < np.inf)
+    on_sphere = t_sphere[hit] < t_plane[hit]
+    sphere_id = sphere_id[hit][on_sphere]
+    p = rays[hit] * np.minimum(t_sphere, t_plane)[hit, np.newaxis]
+    normal = np.empty_like(p)
+    normal[:] = plane_normal
+    normal[on_sphere] = normalize(p[on_sphere] - centers[sphere_id])
+    view_dir = normalize(CAMERA - p)
+    L = light_pos - p
+    dist_to_light = np.linalg.norm(L, axis=-1)
+    L /= dist_to_light[:, np.newaxis] + 1e-8
+
+    shadow_origin = p + normal * 1e-3
+    in_shadow = scene.bvh.intersect(shadow_origin, L, t_max=dist_to_light, any_hit=True)[1] >= 0
+    denom = L @ plane_normal
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t_shadow_plane = ((plane_point - shadow_origin) @ plane_normal) / denom
+    in_shadow |= (np.abs(denom) > 1e-6) & (t_shadow_plane > 1e-3) & (t_shadow_plane < dist_to_light)
+
+    material_id = np.full(len(hit), scene.plane_material)
+    material_id[on_sphere] = scene.material_ids[sphere_id]
+    material = scene.materials.gather(material_id)
+    color = material[:, COLOR]
+    ambient, diffuse, specular, shininess = (
+        material[:, column] for column in (AMBIENT, DIFFUSE, SPECULAR, SHININESS))
+    dot_nl = np.sum(normal * L, axis=-1)
+    R = normalize(2 * dot_nl[:, np.newaxis] * normal - L)
+    dot_rv = np.maximum(np.sum(R * view_dir, axis=-1), 0)
+    diffuse_term = (diffuse * np.maximum(dot_nl, 0))[:, np.newaxis] * color
+    specular_term = (specular * dot_rv ** shininess)[:, np.newaxis]
+    shading = ambient[:, np.newaxis] * color + np.where(in_shadow[:, np.newaxis], 0, diffuse_term + specular_term)
+    image[hit] = shading
+    image = np.clip(image, 0, 1)
+    return (image * 255).astype(np.uint8).reshape(height, width, 3)
+
+class BufferPool:
+    """Named scratch arrays reused from frame to frame.
+
+    `allocations` counts the arrays actually created; once every buffer
+    has been requested at the current resolution it stops growing.
+    """
+
+    def __init__(self):
+        self.buffers = {}
+        self.allocations = 0
+
+    def get(self, name, shape, dtype=np.float64):
+        buf = self.buffers.get(name)
+        if buf is None or buf.shape != shape or buf.dtype != dtype:
+            buf = np.empty(shape, dtype)
+            self.buffers[name] = buf
+            self.allocations += 1
+        return buf
+
+class Renderer:
+    """render_scene with its frame-invariant work hoisted out of the frame.
+
+    Camera rays and the primary intersection with the static plane are
+    computed once per (width, height, fov); every other per-frame array
+    lives in a BufferPool and is written with out=/in-place NumPy calls.
+    render() returns a view of the pool, valid until the next call.
+    """
+
+    def __init__(self, width, height, fov=FOV):
+        self.pool = BufferPool()
+        self.key = None
+        self.resize(width, height, fov)
+
+    def resize(self, width, height, fov=FOV):
+        if self.key == (width, height, fov):
+            return
+        self.key = (width, height, fov)
+        self.width, self.height = width, height
+        self.ray_dir = camera_rays(width, height, fov)
+        # Rays start at the camera, so the view vector is the reversed ray.
+        self.view_dir = -self.ray_dir
+        self.t_plane = intersect_plane(CAMERA, self.ray_dir, PLANE_POINT, PLANE_NORMAL)
+
+    def intersect_sphere(self, origin, direction, center, out, name):
+        """Same result as intersect_sphere, written into `out`."""
+        get = self.pool.get
+        shape = out.shape
+        oc = get(name + "_oc", origin.shape)
+        tmp3 = get(name + "_tmp3", direction.shape)
+        b = get(name + "_b", shape)
+        c = get(name + "_c", shape)
+        mask = get(name + "_mask", shape, bool)
+        cond = get(name + "_cond", shape, bool)
+        np.subtract(origin, center, out=oc)
+        if oc.ndim == 1:
+            np.matmul(direction, oc, out=b)
+            c.fill(np.dot(oc, oc) - SPHERE_RADIUS ** 2)
+        else:
+            np.multiply(direction, oc, out=tmp3)
+            np.sum(tmp3, axis=2, out=b)
+            np.multiply(oc, oc, out=tmp3)
+            np.sum(tmp3, axis=2, out=c)
+            c -= SPHERE_RADIUS ** 2
+        b *= 2.0
+        # c becomes the discriminant, then its clamped square root.
+        t0 = get(name + "_t0", shape)
+        np.multiply(c, -4, out=c)
+        c += np.multiply(b, b, out=t0)
+        np.greater_equal(c, 0, out=mask)
+        np.maximum(c, 0, out=c)
+        np.sqrt(c, out=c)
+        np.negative(b, out=t0)
+        t0 -= c
+        t0 /= 2.0
+        np.negative(b, out=b)
+        b += c
+        b /= 2.0
+        t1 = b
+        out.fill(np.inf)
+        np.greater(t0, 1e-3, out=cond)
+        cond &= mask
+        np.copyto(out, t0, where=cond)
+        np.greater(t1, 1e-3, out=cond)
+        cond &= mask
+        cond &= np.less(t1, out, out=mask)
+        np.copyto(out, t1, where=cond)
+        return out
+
+    def intersect_plane(self, origin, direction, out, name):
+        """Same result as intersect_plane for non-camera origins, into `out`."""
+        get = self.pool.get
+        shape = out.shape
+        denom = get(name + "_denom", shape)
+        num = get(name + "_num", shape)
+        valid = get(name + "_valid", shape, bool)
+        ahead = get(name + "_ahead", shape, bool)
+        diff = get(name + "_diff", origin.shape)
+        np.matmul(direction, PLANE_NORMAL, out=denom)
+        np.subtract(PLANE_POINT, origin, out=diff)
+        np.matmul(diff, PLANE_NORMAL, out=num)
+        np.greater(np.abs(denom, out=out), 1e-6, out=valid)
+        np.divide(num, denom, out=num, where=valid)
+        out.fill(np.inf)
+        valid &= np.greater(num, 1e-3, out=ahead)
+        np.copyto(out, num, where=valid)
+        return out
+
+    def render(self, time_elapsed, out=None):
+        """Render a frame; with `out` the uint8 pixels are written there instead.
+
+        `out` may be any (height, width, 3) view, e.g. a flipped, transposed
+        pixels3d view of a Surface.
+        """
+        get = self.pool.get
+        shape2 = (self.height, self.width)
+        shape3 = shape2 + (3,)
+        sphere_center, light_pos = scene_at(time_elapsed)
+        ray_dir, t_plane = self.ray_dir, self.t_plane
+
+        with profiler.stage("primary"):
+            t_sphere = self.intersect_sphere(CAMERA, ray_dir, sphere_center, get("t_sphere", shape2), "primary")
+            mask_sphere = np.less(t_sphere, t_plane, out=get("mask_sphere", shape2, bool))
+            mask_plane = np.less(t_plane, t_sphere, out=get("mask_plane", shape2, bool))
+            miss_mask = np.logical_or(mask_sphere, mask_plane, out=get("miss_mask", shape2, bool))
+            np.logical_not(miss_mask, out=miss_mask)
+            t = np.minimum(t_sphere, t_plane, out=get("t", shape2))
+            # Missed rays get t = 0 so every array below stays finite; they are
+            # painted with the background at the end.
+            np.copyto(t, 0.0, where=miss_mask)
+            p = np.multiply(ray_dir, t[..., np.newaxis], out=get("p", shape3))
+
+        with profiler.stage("surface"):
+            normal = get("normal", shape3)
+            norm = get("norm", shape2 + (1,))
+            np.subtract(p, sphere_center, out=normal)
+            np.sqrt(np.sum(np.square(normal, out=get("tmp3", shape3)), axis=2, keepdims=True, out=norm), out=norm)
+            norm += 1e-8
+            normal /= norm
+            np.copyto(normal, PLANE_NORMAL, where=mask_plane[..., np.newaxis])
+
+            L = np.subtract(light_pos, p, out=get("L", shape3))
+            dist_to_light = get("dist_to_light", shape2)
+            np.sqrt(np.sum(np.square(L, out=get("tmp3", shape3)), axis=2, out=dist_to_light), out=dist_to_light)
+            np.add(dist_to_light, 1e-8, out=norm[..., 0])
+            L /= norm
+
+        with profiler.stage("shadow"):
+            shadow_origin = np.multiply(normal, 1e-3, out=get("shadow_origin", shape3))
+            shadow_origin += p
+            t_shadow = self.intersect_sphere(shadow_origin, L, sphere_center, get("t_shadow", shape2), "shadow")
+            t_shadow_plane = self.intersect_plane(shadow_origin, L, get("t_shadow_plane", shape2), "shadow")
+            np.minimum(t_shadow, t_shadow_plane, out=t_shadow)
+            lit = np.greater_equal(t_shadow, dist_to_light, out=get("lit", shape2, bool))
+
+        with profiler.stage("shading"):
+            # Object ids 0/1/2 (nothing/sphere/plane), then one gather from MATERIALS.
+            material_id = np.multiply(mask_plane, 2, out=get("material_id", shape2, np.intp))
+            material_id += mask_sphere
+            material = MATERIALS.gather(material_id, out=get("material", shape2 + (len(MATERIALS.rows[0]),)))
+            mat_color = material[..., COLOR]
+            mat_ambient, mat_diffuse, mat_specular, mat_shininess = (
+                material[..., column] for column in (AMBIENT, DIFFUSE, SPECULAR, SHININESS))
+
+            dot_nl = get("dot_nl", shape2)
+            np.sum(np.multiply(normal, L, out=get("tmp3", shape3)), axis=2, out=dot_nl)
+            # R = reflect(-L, normal) = 2 (N.L) N - L, normalized.
+            R = get("R", shape3)
+            np.multiply(dot_nl, 2, out=norm[..., 0])
+            np.multiply(normal, norm, out=R)
+            R -= L
+            np.sqrt(np.sum(np.square(R, out=get("tmp3", shape3)), axis=2, keepdims=True, out=norm), out=norm)
+            norm += 1e-8
+            R /= norm
+            np.maximum(dot_nl, 0, out=dot_nl)
+
+            dot_rv = get("dot_rv", shape2)
+            np.sum(np.multiply(R, self.view_dir, out=get("tmp3", shape3)), axis=2, out=dot_rv)
+            np.maximum(dot_rv, 0, out=dot_rv)
+            np.power(dot_rv, mat_shininess, out=dot_rv)
+            dot_rv *= mat_specular
+
+            # Lit pixels get diffuse + specular on top of ambient.
+            image = get("image", shape3)
+            np.multiply(dot_nl, mat_diffuse, out=dot_nl)
+            dot_nl *= lit
+            dot_rv *= lit
+            dot_nl += mat_ambient
+            np.multiply(mat_color, dot_nl[..., np.newaxis], out=image)
+            image += dot_rv[..., np.newaxis]
+            np.copyto(image, BACKGROUND_COLOR, where=miss_mask[..., np.newaxis])
+        with profiler.stage("quantize"):
+            np.clip(image, 0, 1, out=image)
+            image *= 255
+            pixels = get("pixels", shape3, np.uint8)
+            np.copyto(pixels, image, casting="unsafe")
+        with profiler.stage("write_surface"):
+            if out is not None:
+                write_pixels(out, pixels)
+                return out
+        return pixels
+
+class DeferredRenderer:
+    """trace_rays() for a fixed grid of camera rays, shaded from a G-buffer.
+
+    Primary hits are kept in a gbuffer.GBuffer with a layer per object: the
+    sphere's is re-intersected only inside the rectangle it covered before
+    and after it moved, the static plane's only on the first frame. Shadow
+    rays and shading run every frame on the pixels that hit something, from
+    per-pixel terms cached with the G-buffer, so a frame in which only the
+    light moves skips the primary and surface passes. The image is the one
+    trace_rays() returns.
+    """
+
+    def __init__(self, width, height, fov=FOV):
+        self.ray_dir = camera_rays(width, height, fov)
+        self.gbuffer = GBuffer((height, width), objects=2)
+        self.bounds = DirtyRegionTracker(self.ray_dir, axes=(1, 0), forward=1)
+        self.image = np.empty((height, width, 3), dtype=np.uint8)
+        self.background = (np.clip(BACKGROUND_COLOR, 0, 1) * 255).astype(np.uint8)
+        self.hits = None
+        self.surface = None
+
+    def render(self, time_elapsed):
+        return self.render_state(*scene_at(time_elapsed))
+
+    def render_state(self, sphere_center, light_pos):
+        gbuffer = self.gbuffer
+        with profiler.stage("primary"):
+            sphere = gbuffer.stale(0, [sphere_center], self.bounds.sphere_bounds(sphere_center, SPHERE_RADIUS))
+            if sphere is not None:
+                area = window(sphere)
+                gbuffer.layers[0][area] = intersect_sphere(CAMERA, self.ray_dir[area], sphere_center, SPHERE_RADIUS)
+            plane = gbuffer.stale(1, [PLANE_POINT, PLANE_NORMAL])
+            if plane is not None:
+                area = window(plane)
+                gbuffer.layers[1][area] = intersect_plane(CAMERA, self.ray_dir[area], PLANE_POINT, PLANE_NORMAL)
+            changed = union(sphere, plane)
+        if changed is not None:
+            with profiler.stage("surface"):
+                self.update_surface(gbuffer.resolve(changed), sphere_center)
+        p, normal, view_dir, shadow_origin, material, ambient_term = self.surface
+        with profiler.stage("shadow"):
+            to_light = soa.vec(light_pos, 2, p.dtype) - p
+            dist_to_light = np.linalg.norm(to_light, axis=0)
+            L = to_light / (dist_to_light + 1e-8)
+            t_shadow_sphere = soa.intersect_sphere(shadow_origin, L, sphere_center, SPHERE_RADIUS)
+            t_shadow_plane = soa.intersect_plane(shadow_origin, L, PLANE_POINT, PLANE_NORMAL)
+            in_shadow = np.minimum(t_shadow_sphere, t_shadow_plane) < dist_to_light
+        with profiler.stage("shading"):
+            shading = shade_soa(normal, L, view_dir, material, ambient_term, in_shadow)
+        with profiler.stage("quantize"):
+            self.image.reshape(-1, 3)[self.hits] = (np.clip(shading, 0, 1) * 255).astype(np.uint8).T
+        return self.image
+
+    def update_surface(self, area, sphere_center):
+        """Refresh the G-buffer inside `area` and the per-hit terms shading reads."""
+        gbuffer = self.gbuffer
+        object_id = gbuffer.object_id[area]
+        p = self.ray_dir[area] * gbuffer.depth[area][..., np.newaxis]
+        normal = np.zeros_like(p)
+        on_sphere = object_id == 1
+        normal[on_sphere] = normalize(p[on_sphere] - sphere_center)
+        normal[object_id == 2] = PLANE_NORMAL
+        gbuffer.position[area] = p
+        gbuffer.normal[area] = normal
+        # Object id i shades with material row i.
+        gbuffer.material_id[area] = object_id
+
+        # Everything below depends only on the G-buffer, not on the light:
+        # gathered once into SoA planes (see soa.py) of the pixels that hit
+        # something. Plane-wise sums add the components in the same order
+        # as trace_rays(), so the shading matches it exactly.
+        self.hits = np.flatnonzero(gbuffer.depth < np.inf)
+        p = soa.from_aos(gbuffer.position.reshape(-1, 3)[self.hits], np.float64)
+        normal = soa.from_aos(gbuffer.normal.reshape(-1, 3)[self.hits], np.float64)
+        material = soa.from_aos(MATERIALS.gather(gbuffer.material_id.ravel()[self.hits]), np.float64)
+        ambient_term = material[AMBIENT] * material[COLOR]
+        view_dir = normalize(soa.vec(CAMERA, 2, np.float64) - p, axis=0)
+        self.surface = (p, normal, view_dir, p + normal * 1e-3, material, ambient_term)
+        self.image[area][gbuffer.depth[area] == np.inf] = self.background
 
 def main():
-    pygame.init()
+    parser = argparse.ArgumentParser(description="GPT o3-mini-high ray tracer")
+    parser.add_argument("--spheres", type=int, default=0,
+                        help="render a random scene of this many spheres through a BVH")
+    parser.add_argument("--scene", metavar="FILE",
+                        help="render a JSON scene file (see scene.py) through a BVH")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="render tiles in this many processes into a shared framebuffer")
+    parser.add_argument("--tile-size", type=int, default=64)
+    parser.add_argument("--governor", action="store_true",
+                        help="adapt the render resolution to hold --target-fps")
+    parser.add_argument("--target-fps", type=float, default=60)
+    parser.add_argument("--backend", choices=("auto", "numpy", "numba"), default="auto",
+                        help="compute backend; auto uses numba when it is installed")
+    parser.add_argument("--reflections", type=int, default=0, metavar="DEPTH",
+                        help="trace mirror bounces up to this depth on compacted ray streams")
+    parser.add_argument("--pipelined", action="store_true",
+                        help="trace on a worker thread while the main loop presents the latest frame")
+    parser.add_argument("--deferred", action="store_true",
+                        help="shade from a G-buffer, re-intersecting only the part of the frame the sphere moved in")
+    parser.add_argument("--profile", metavar="TRACE.json",
+                        help="time each frame stage and write a Chrome trace here at exit")
+    parser.add_argument("--hud", action="store_true",
+                        help="overlay fps and the per-stage breakdown on the window")
+    args = parser.parse_args()
+    if args.spheres < 0:
+        parser.error("--spheres cannot be negative (0 turns the sphere scene off)")
+    if args.governor and args.workers:
+        parser.error("--governor cannot be combined with --workers")
+    if args.pipelined and args.governor:
+        parser.error("--pipelined cannot be combined with --governor")
+    if args.reflections and (args.spheres or args.scene or args.workers):
+        parser.error("--reflections cannot be combined with --spheres, --scene or --workers")
+    if args.deferred and (args.spheres or args.scene or args.workers or args.reflections):
+        parser.error("--deferred cannot be combined with --spheres, --scene, --workers or --reflections")
+    if args.backend == "numba" and (args.spheres or args.scene or args.workers or args.reflections or args.deferred):
+        parser.error("--backend numba cannot be combined with --spheres, --scene, --workers, --reflections or --deferred")
+
     width, height = 320, 320
+    backend = get_backend(args.backend)
+    tiles = None
+    if args.spheres or args.scene:
+        scene = SphereScene.from_file(args.scene) if args.scene else random_sphere_scene(args.spheres)
+        render = lambda t, w, h, out=None: render_sphere_scene(scene, t, w, h)
+    elif args.workers:
+        from parallel import TileRenderer
+        # Started before pygame so the workers do not inherit SDL state.
+        tiles = TileRenderer("gpt", width, height, args.workers, args.tile_size)
+        render = lambda t, w, h, out=None: tiles.render(t)
+    elif args.reflections:
+        ray_grids = {}
+        # Rays traced per depth, summed over the frames rendered.
+        active = {"frames": 0, "rays": np.zeros(args.reflections + 1, dtype=np.int64)}
+
+        def render(t, w, h, out=None):
+            if (w, h) not in ray_grids:
+                ray_grids[(w, h)] = camera_rays(w, h)
+            active["frames"] += 1
+            return trace_reflections(t, ray_grids[(w, h)], args.reflections, active["rays"])
+    elif args.deferred:
+        deferred = {}
+
+        def render(t, w, h, out=None):
+            if (w, h) not in deferred:
+                deferred[(w, h)] = DeferredRenderer(w, h)
+            return deferred[(w, h)].render(t)
+    elif backend.name != "numpy":
+        module = sys.modules[__name__]
+        ray_grids = {}
+
+        def render(t, w, h, out=None):
+            if (w, h) not in ray_grids:
+                ray_grids[(w, h)] = camera_rays(w, h)
+            return backend.gpt_frame(module, t, ray_grids[(w, h)])
+    else:
+        renderer = Renderer(width, height)
+
+        # Only this renderer can quantize straight into `out`; the others
+        # return their own image, which the main loop copies.
+        def render(t, w, h, out=None):
+            renderer.resize(w, h)
+            return renderer.render(t, out)
+
+    governor = None
+    if args.governor:
+        import logging
+        from governor import ResolutionGovernor
+        logging.basicConfig(level=logging.INFO, format="%(name)s: %(message)s")
+        governor = ResolutionGovernor((width, height), target_fps=args.target_fps)
+
+    pygame.init()
     screen = pygame.display.set_mode((width, height))
     pygame.display.set_caption("GPT o3-mini-high")
     clock = pygame.time.Clock()
+    presenter = SurfacePresenter()
+    if args.profile or args.hud:
+        profiler.enable()
     start_time = time.time()
+    pipeline = None
+    if args.pipelined:
+        from pipeline import FramePipeline
+        pipeline = FramePipeline(lambda: render(time.time() - start_time, width, height))
     running = True
     while running:
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                running = False
-        current_time = time.time() - start_time
-        image = render_scene(current_time, width, height)
-        surface = pygame.surfarray.make_surface(np.flipud(np.transpose(image, (1, 0, 2))))
-        screen.blit(surface, (0, 0))
-        pygame.display.flip()
-        clock.tick(60)
+        frame_start = time.perf_counter()
+        profiler.begin_frame()
+        with profiler.stage("events"):
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    running = False
+        if pipeline:
+            image = pipeline.latest()
+            if image is None:
+                clock.tick(args.target_fps)
+                continue
+            render_width, render_height = width, height
+        else:
+            current_time = time.time() - start_time
+            render_width, render_height = governor.render_size if governor else (width, height)
+        surface, pixels = presenter.pixels(render_width, render_height)
+        # pixels is indexed (x, y): this view of it is the (row, column)
+        # image mirrored left to right, as make_surface(flipud(transpose(...))) showed it.
+        target = pixels[::-1].transpose(1, 0, 2)
+        if not pipeline:
+            with profiler.stage("render"):
+                image = render(current_time, render_width, render_height, target)
+        if image is not target:
+            with profiler.stage("write_surface"):
+                write_pixels(target, image)
+        # Every reference to the view must go before the Surface is blitted.
+        del pixels, target, image
+        with profiler.stage("present"):
+            presenter.present(surface, screen)
+        if args.hud:
+            profiler.active().draw_hud(screen)
+        with profiler.stage("flip"):
+            pygame.display.flip()
+        profiler.end_frame()
+        if governor:
+            governor.record(time.perf_counter() - frame_start)
+        clock.tick(args.target_fps)
+    if pipeline:
+        pipeline.close()
+        print(pipeline.report())
+    if args.reflections and active["frames"]:
+        counts = active["rays"] / active["frames"]
+        print("active rays per bounce: " + ", ".join("%d" % count for count in counts))
+    if tiles is not None:
+        tiles.close()
+    if profiler.active():
+        print(profiler.active().report())
+        if args.profile:
+            profiler.active().export_chrome_trace(args.profile)
     pygame.quit()
     sys.exit()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
\ No newline at end of file
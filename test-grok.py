@@ -3,6 +3,10 @@ from OpenGL.GL import *
 from OpenGL.GLUT import *
 from OpenGL.GLU import *
 
+import profiler
+from dirty import DirtyRegionTracker
+from framecache import FrameCache, quantize
+
 WIDTH, HEIGHT = 320, 320
 
 sphere_center = np.array([0.0, 0.0, -5.0])
@@ -16,6 +20,16 @@ shininess = 32.0
 time = 0.0
 bounce_height = 2.0
 
+# When True display() traces the whole frame with array operations and
+# uploads it with one glDrawPixels; press B to switch to the per-pixel path.
+batched_mode = True
+# With incremental_mode on (press I) the batched path re-traces only the
+# rectangle the bouncing sphere covers and keeps the rest of the last frame.
+incremental_mode = False
+incremental_state = {}
+# Press C to serve frames of sphere positions seen before from a FrameCache.
+frame_cache = None
+
 def ray_sphere_intersection(ray_origin, ray_direction, center, radius):
     """
     Calculate if a ray intersects with a sphere and return the intersection point if it does.
@@ -39,7 +53,7 @@ def compute_lighting(point, normal):
     view_dir = normalize(camera_position - point)
     half_vector = normalize(light_dir + view_dir)
     
-    color = ambient_color
+    color = ambient_color.copy()
     
     diffuse = max(0.0, np.dot(normal, light_dir))
     color += diffuse * diffuse_color
@@ -63,27 +77,120 @@ def trace_ray(ray_origin, ray_direction):
         return compute_lighting(intersection, normal)
     return np.zeros(3)
 
+def ray_directions():
+    """
+    Normalized camera rays for every pixel as a (HEIGHT, WIDTH, 3) array.
+    """
+    screen_x = (np.arange(WIDTH) - WIDTH / 2) / (WIDTH / 2)
+    screen_y = (np.arange(HEIGHT) - HEIGHT / 2) / (HEIGHT / 2) * -1
+    directions = np.empty((HEIGHT, WIDTH, 3))
+    directions[..., 0] = screen_x[np.newaxis, :]
+    directions[..., 1] = screen_y[:, np.newaxis]
+    directions[..., 2] = -1.0
+    directions -= camera_position
+    return directions / np.linalg.norm(directions, axis=-1, keepdims=True)
+
+def compute_lighting_batch(points, normals):
+    """
+    Vectorized compute_lighting for (N, 3) arrays of points and normals.
+    """
+    light_dir = light_position - points
+    light_dir /= np.linalg.norm(light_dir, axis=-1, keepdims=True)
+    view_dir = camera_position - points
+    view_dir /= np.linalg.norm(view_dir, axis=-1, keepdims=True)
+    half_vector = light_dir + view_dir
+    half_vector /= np.linalg.norm(half_vector, axis=-1, keepdims=True)
+
+    diffuse = np.maximum(0.0, np.sum(normals * light_dir, axis=-1, keepdims=True))
+    specular = np.maximum(0.0, np.sum(normals * half_vector, axis=-1, keepdims=True)) ** shininess
+    color = ambient_color + diffuse * diffuse_color + specular * specular_color
+    return np.clip(color, 0, 1)
+
+def trace_frame(ray_origin, ray_directions):
+    """
+    Vectorized trace_ray over a (HEIGHT, WIDTH, 3) grid of ray directions.
+    """
+    oc = ray_origin - sphere_center
+    a = np.sum(ray_directions * ray_directions, axis=-1)
+    b = 2.0 * (ray_directions @ oc)
+    c = np.dot(oc, oc) - sphere_radius * sphere_radius
+    discriminant = b * b - 4 * a * c
+    t = (-b - np.sqrt(np.maximum(discriminant, 0.0))) / (2.0 * a)
+    hit = (discriminant > 0) & (t > 0)
+
+    image = np.zeros(ray_directions.shape)
+    if np.any(hit):
+        intersection = ray_origin + t[hit, np.newaxis] * ray_directions[hit]
+        normal = intersection - sphere_center
+        normal /= np.linalg.norm(normal, axis=-1, keepdims=True)
+        image[hit] = compute_lighting_batch(intersection, normal)
+    return image
+
+def trace_frame_incremental():
+    """
+    trace_frame for the current scene, re-tracing only the dirty region.
+    """
+    key = (WIDTH, HEIGHT, tuple(camera_position))
+    if incremental_state.get("key") != key:
+        rays = ray_directions()
+        incremental_state.update(key=key, rays=rays, tracker=DirtyRegionTracker(rays),
+                                 image=np.zeros(rays.shape, dtype=np.float32))
+    rays, image = incremental_state["rays"], incremental_state["image"]
+    region = incremental_state["tracker"].dirty_region(
+        sphere_center - camera_position, sphere_radius, (light_position,))
+    if region is not None:
+        y0, y1, x0, x1 = region
+        image[y0:y1, x0:x1] = trace_frame(camera_position, rays[y0:y1, x0:x1])
+    return image
+
 def display():
     global time
+    profiler.begin_frame()
     glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
     
     sphere_center[1] = bounce_height * np.sin(time)
+    phase = time % (2 * np.pi)
     time += 0.05
 
-    for x in range(WIDTH):
-        for y in range(HEIGHT):
-            screen_x = (x - WIDTH / 2) / (WIDTH / 2)
-            screen_y = (y - HEIGHT / 2) / (HEIGHT / 2) * -1
-            ray_direction = normalize(np.array([screen_x, screen_y, -1.0]) - camera_position)
+    if batched_mode:
+        with profiler.stage("trace"):
+            if incremental_mode:
+                image = trace_frame_incremental()
+            elif frame_cache is not None:
+                # Keyed on the phase of the bounce: 2*pi is not a multiple of
+                # the time step, so sphere positions never repeat exactly.
+                image = frame_cache.get((phase, light_position, (WIDTH, HEIGHT)),
+                                        lambda: quantize(trace_frame(camera_position, ray_directions())))
+            else:
+                image = trace_frame(camera_position, ray_directions())
+        with profiler.stage("glDrawPixels"):
+            glRasterPos2i(0, 0)
+            if image.dtype == np.uint8:
+                glDrawPixels(WIDTH, HEIGHT, GL_RGB, GL_UNSIGNED_BYTE, image)
+            else:
+                glDrawPixels(WIDTH, HEIGHT, GL_RGB, GL_FLOAT, image.astype(np.float32))
+        with profiler.stage("swap"):
+            glutSwapBuffers()
+        profiler.end_frame()
+        return
+
+    with profiler.stage("points"):
+        for x in range(WIDTH):
+            for y in range(HEIGHT):
+                screen_x = (x - WIDTH / 2) / (WIDTH / 2)
+                screen_y = (y - HEIGHT / 2) / (HEIGHT / 2) * -1
+                ray_direction = normalize(np.array([screen_x, screen_y, -1.0]) - camera_position)
             
-            color = trace_ray(camera_position, ray_direction)
+                color = trace_ray(camera_position, ray_direction)
             
-            glColor3f(*color)
-            glBegin(GL_POINTS)
-            glVertex2i(x, y)
-            glEnd()
+                glColor3f(*color)
+                glBegin(GL_POINTS)
+                glVertex2i(x, y)
+                glEnd()
 
-    glutSwapBuffers()
+    with profiler.stage("swap"):
+        glutSwapBuffers()
+    profiler.end_frame()
 
 def reshape(width, height):
     glViewport(0, 0, width, height)
@@ -92,7 +199,23 @@ def reshape(width, height):
     gluOrtho2D(0, width, 0, height)
     glMatrixMode(GL_MODELVIEW)
 
+def keyboard(key, x, y):
+    global batched_mode, incremental_mode, frame_cache
+    if key in (b"b", b"B"):
+        batched_mode = not batched_mode
+    elif key in (b"i", b"I"):
+        incremental_mode = not incremental_mode
+    elif key in (b"c", b"C"):
+        if frame_cache is None:
+            # One time step of phase: every bucket is filled in the first
+            # bounce, and a cached frame is at most half a step off.
+            frame_cache = FrameCache(quantum=(0.05, 0.01, 1))
+        else:
+            print(frame_cache.report())
+            frame_cache = None
+
 def main():
+    profiler.enable_from_env()
     glutInit()
     glutInitDisplayMode(GLUT_RGBA | GLUT_DOUBLE | GLUT_DEPTH)
     glutInitWindowSize(WIDTH, HEIGHT)
@@ -101,7 +224,8 @@ def main():
     glutDisplayFunc(display)
     glutIdleFunc(display)
     glutReshapeFunc(reshape)
+    glutKeyboardFunc(keyboard)
     glutMainLoop()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
\ No newline at end of file
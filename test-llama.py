@@ -1,5 +1,8 @@
 import pygame
 import numpy as np
+import argparse
+import time
+from functools import lru_cache
 
 WIDTH, HEIGHT = 320, 320
 WHITE = (255, 255, 255)
@@ -11,11 +14,15 @@ MATERIAL_SPECULAR = 0.5
 MATERIAL_SHININESS = 32.0
 
 class Sphere:
+    __slots__ = ("center", "radius")
+
     def __init__(self, center, radius):
         self.center = center
         self.radius = radius
 
     def intersect(self, ray_origin, ray_direction):
+        if np.ndim(ray_direction) == 2:
+            return self.intersect_bundle(ray_origin, ray_direction)
         L = self.center - ray_origin
         tca = np.dot(L, ray_direction)
         if tca < 0:
@@ -28,37 +35,86 @@ class Sphere:
         t1 = tca + thc
         return t0, t1
 
+    def intersect_bundle(self, ray_origin, ray_directions):
+        """Intersect one origin with an (N, 3) bundle of directions.
+
+        Returns arrays t0, t1 and a hit mask; t0/t1 are only meaningful
+        where the mask is True.
+        """
+        L = self.center - ray_origin
+        tca = ray_directions @ L
+        d2 = np.dot(L, L) - tca * tca
+        hit = (tca >= 0) & (d2 <= self.radius * self.radius)
+        thc = np.sqrt(np.maximum(self.radius * self.radius - d2, 0))
+        return tca - thc, tca + thc, hit
+
 class Ray:
     def __init__(self, origin, direction):
         self.origin = origin
         self.direction = direction
 
 def calculate_lighting(normal, view_direction, light_direction):
+    if np.ndim(normal) == 2:
+        n_dot_l = np.maximum(0, np.sum(normal * light_direction, axis=-1))
+        return n_dot_l * MATERIAL_DIFFUSE + n_dot_l ** MATERIAL_SHININESS * MATERIAL_SPECULAR
     diffuse = max(0, np.dot(normal, light_direction)) * MATERIAL_DIFFUSE
     specular = max(0, np.dot(normal, light_direction)) ** MATERIAL_SHININESS * MATERIAL_SPECULAR
     return diffuse + specular
 
-def render(sphere, screen):
-    for x in range(WIDTH):
-        for y in range(HEIGHT):
-            ray_origin = np.array([0.0, 0.0, 0.0])
-            ray_direction = np.array([(x - WIDTH // 2) / WIDTH, (y - HEIGHT // 2) / HEIGHT, 1.0])
-            ray_direction = ray_direction / np.linalg.norm(ray_direction)
-            ray = Ray(ray_origin, ray_direction)
-
-            intersection = sphere.intersect(ray.origin, ray.direction)
-            if intersection is not None:
-                intersection_point = ray.origin + ray.direction * intersection[0]
-                normal = (intersection_point - sphere.center) / sphere.radius
-                view_direction = -ray.direction
-                light_direction = (LIGHT_SOURCE - intersection_point) / np.linalg.norm(LIGHT_SOURCE - intersection_point)
-                lighting = calculate_lighting(normal, view_direction, light_direction)
-                color = int(lighting * 255)
-                screen.set_at((x, y), (color, color, color))
-            else:
-                screen.set_at((x, y), BLACK)
+@lru_cache(maxsize=4)
+def ray_grid(width, height):
+    """Normalized camera rays laid out x-major, like the pixels3d view."""
+    ray_directions = np.empty((width, height, 3))
+    ray_directions[..., 0] = ((np.arange(width) - width // 2) / width)[:, np.newaxis]
+    ray_directions[..., 1] = ((np.arange(height) - height // 2) / height)[np.newaxis, :]
+    ray_directions[..., 2] = 1.0
+    ray_directions /= np.linalg.norm(ray_directions, axis=-1, keepdims=True)
+    return ray_directions
+
+def render(sphere, screen, region=None):
+    # region is (x0, x1, y0, y1); only those pixels are traced and written.
+    width, height = screen.get_size()
+    x0, x1, y0, y1 = region or (0, width, 0, height)
+    ray_origin = np.array([0.0, 0.0, 0.0])
+    ray_directions = ray_grid(width, height)[x0:x1, y0:y1].reshape(-1, 3)
+
+    t0, t1, hit = sphere.intersect(ray_origin, ray_directions)
+    color = np.zeros(len(ray_directions), dtype=np.uint8)
+    if np.any(hit):
+        directions = ray_directions[hit]
+        intersection_points = ray_origin + directions * t0[hit, np.newaxis]
+        normals = (intersection_points - sphere.center) / sphere.radius
+        light_directions = LIGHT_SOURCE - intersection_points
+        light_directions /= np.linalg.norm(light_directions, axis=-1, keepdims=True)
+        lighting = calculate_lighting(normals, -directions, light_directions)
+        color[hit] = (lighting * 255).astype(np.uint8)
+
+    pixels = pygame.surfarray.pixels3d(screen)
+    pixels[x0:x1, y0:y1] = color.reshape(x1 - x0, y1 - y0, 1)
+    del pixels
 
 def main():
+    parser = argparse.ArgumentParser(description="Llama-3.3-70B ray tracer")
+    parser.add_argument("--governor", action="store_true",
+                        help="adapt the render resolution to hold --target-fps")
+    parser.add_argument("--target-fps", type=float, default=60)
+    parser.add_argument("--incremental", action="store_true",
+                        help="re-trace only the region the moving sphere covers")
+    parser.add_argument("--cache", type=float, metavar="MB",
+                        help="serve frames of sphere positions seen before from a frame cache of this many MB")
+    args = parser.parse_args()
+    if args.incremental and args.governor:
+        parser.error("--incremental cannot be combined with --governor")
+    if args.cache and (args.governor or args.incremental):
+        parser.error("--cache cannot be combined with --governor or --incremental")
+
+    governor = None
+    if args.governor:
+        import logging
+        from governor import ResolutionGovernor
+        logging.basicConfig(level=logging.INFO, format="%(name)s: %(message)s")
+        governor = ResolutionGovernor((WIDTH, HEIGHT), target_fps=args.target_fps)
+
     pygame.init()
     pygame.display.set_caption("Llama-3.3-70B")
     screen = pygame.display.set_mode((WIDTH, HEIGHT))
@@ -67,8 +123,23 @@ def main():
     sphere = Sphere(np.array([0.0, 0.0, -5.0]), 1.0)
     velocity = 0.01
 
+    frames = {}
+    if args.incremental:
+        from dirty import DirtyRegionTracker
+        tracker = DirtyRegionTracker(ray_grid(WIDTH, HEIGHT), axes=(0, 1), forward=1)
+    cache = None
+    if args.cache:
+        from framecache import FrameCache
+        # The position only drifts by rounding errors between bounces.
+        cache = FrameCache(int(args.cache * 2**20), quantum=1e-4)
+
+    def render_cached():
+        render(sphere, screen)
+        return pygame.surfarray.array3d(screen)
+
     running = True
     while running:
+        frame_start = time.perf_counter()
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 running = False
@@ -77,11 +148,30 @@ def main():
         if sphere.center[1] > 2.0 or sphere.center[1] < -2.0:
             velocity = -velocity
 
-        render(sphere, screen)
+        if governor:
+            size = governor.render_size
+            if size not in frames:
+                frames[size] = pygame.Surface(size)
+            render(sphere, frames[size])
+            governor.present(frames[size], screen)
+        elif args.incremental:
+            region = tracker.dirty_region(sphere.center, sphere.radius)
+            if region is not None:
+                render(sphere, screen, region)
+        elif cache:
+            pygame.surfarray.blit_array(screen, cache.get((sphere.center, (WIDTH, HEIGHT)), render_cached))
+        else:
+            render(sphere, screen)
         pygame.display.flip()
-        clock.tick(60)
+        if governor:
+            governor.record(time.perf_counter() - frame_start)
+        clock.tick(args.target_fps)
 
+    if args.incremental:
+        print("incremental: skipped %.1f%% of pixels" % (100 * tracker.skipped_fraction))
+    if cache:
+        print(cache.report())
     pygame.quit()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
\ No newline at end of file
@@ -1,24 +1,28 @@
+import time
+from collections import OrderedDict
+
 import numpy as np
 from OpenGL.GL import *
 from OpenGL.GLUT import *
 from OpenGL.GLU import *
 
+import profiler
+from framecache import FrameCache, quantize
+from physics import SphereSimulation
+
 WIDTH, HEIGHT = 320, 320
 SPHERE_RADIUS = 32
 LIGHT_POSITION = np.array([0, 0, -500])
 
 class Sphere:
+    __slots__ = ("center", "radius", "color", "velocity")
+
     def __init__(self, center, radius, color, velocity):
         self.center = np.array(center, dtype=float)
         self.radius = radius
         self.color = np.array(color, dtype=float)
         self.velocity = np.array(velocity, dtype=float)
 
-    def update(self):
-        self.center[1] += self.velocity[1]
-        if self.center[1] > HEIGHT / 2 - self.radius or self.center[1] < -HEIGHT / 2 + self.radius:
-            self.velocity[1] = -self.velocity[1]
-
 def ray_trace(sphere, light_pos, ray_origin, ray_direction):
     oc = ray_origin - sphere.center
     b = np.dot(oc, ray_direction)
@@ -42,7 +46,73 @@ def ray_trace(sphere, light_pos, ray_origin, ray_direction):
             return diffuse + specular
     return np.array([0, 0, 0])
 
-sphere = Sphere(center=[0, 0, -300], radius=SPHERE_RADIUS, color=[1, 0, 0], velocity=[0, 5, 0])
+class RayGridCache:
+    """Normalized camera rays and a float32 frame buffer per window size.
+
+    Grids are built lazily the first time a size is drawn, i.e. right after
+    reshape reports it. Only the most recent sizes are kept so dragging a
+    window edge through many sizes does not pile up full-frame arrays.
+    """
+
+    def __init__(self, max_sizes=2):
+        self.max_sizes = max_sizes
+        self.grids = OrderedDict()
+
+    def get(self, width, height):
+        key = (width, height)
+        if key in self.grids:
+            self.grids.move_to_end(key)
+            return self.grids[key]
+        while len(self.grids) >= self.max_sizes:
+            self.grids.popitem(last=False)
+        self.grids[key] = (self.build(width, height), np.zeros((height, width, 3), dtype=np.float32))
+        return self.grids[key]
+
+    @staticmethod
+    def build(width, height):
+        # Filled component by component and normalized in place so the only
+        # full-frame allocations are the grid itself and its norm.
+        directions = np.empty((height, width, 3), dtype=np.float32)
+        directions[..., 0] = ((np.arange(width) - width / 2) / (width / 2))[np.newaxis, :]
+        directions[..., 1] = ((np.arange(height) - height / 2) / (height / 2))[:, np.newaxis]
+        directions[..., 2] = -1
+        directions /= np.linalg.norm(directions, axis=-1, keepdims=True)
+        return directions.reshape(-1, 3)
+
+def ray_trace_frame(sphere, light_pos, ray_directions, image):
+    """Vectorized ray_trace for rays from the origin; writes into image."""
+    oc = -sphere.center
+    b = ray_directions @ oc
+    c = np.dot(oc, oc) - sphere.radius ** 2
+    discriminant = b ** 2 - c
+    t = -b - np.sqrt(np.maximum(discriminant, 0))
+    hit = (discriminant >= 0) & (t > 0)
+
+    pixels = image.reshape(-1, 3)
+    pixels.fill(0)
+    if not np.any(hit):
+        return image
+    ray_direction = ray_directions[hit]
+    intersection = t[hit, np.newaxis] * ray_direction
+    normal = (intersection - sphere.center) / sphere.radius
+    light_dir = light_pos - intersection
+    light_dir /= np.linalg.norm(light_dir, axis=-1, keepdims=True)
+    n_dot_l = np.sum(normal * light_dir, axis=-1, keepdims=True)
+    diffuse = np.maximum(n_dot_l, 0) * sphere.color
+    reflect_dir = 2 * n_dot_l * normal - light_dir
+    specular = np.maximum(np.sum(-ray_direction * reflect_dir, axis=-1, keepdims=True), 0) ** 32
+    pixels[hit] = diffuse + specular
+    return image
+
+ray_grids = RayGridCache()
+
+# 5 units a frame at 60 fps, bouncing between the top and bottom of the window.
+sphere = Sphere(center=[0, 0, -300], radius=SPHERE_RADIUS, color=[1, 0, 0], velocity=[0, 300, 0])
+simulation = SphereSimulation(sphere.center, sphere.velocity, sphere.radius, gravity=(0, 0, 0),
+                              floor=-HEIGHT / 2, ceiling=HEIGHT / 2, restitution=1.0, dt=1 / 60)
+last_frame = None
+# Press C to serve frames of sphere positions seen before from a FrameCache.
+frame_cache = None
 
 def init():
     glClearColor(0.0, 0.0, 0.0, 1.0)
@@ -53,32 +123,52 @@ def init():
     glMatrixMode(GL_MODELVIEW)
 
 def display():
+    global last_frame
     glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
     glLoadIdentity()
     gluLookAt(0, 0, 0, 0, 0, -1, 0, 1, 0)
-    sphere.update()
-    image = np.zeros((HEIGHT, WIDTH, 3))
-    for y in range(HEIGHT):
-        for x in range(WIDTH):
-            ray_origin = np.array([0, 0, 0])
-            ray_direction = np.array([(x - WIDTH / 2) / (WIDTH / 2), (y - HEIGHT / 2) / (HEIGHT / 2), -1])
-            ray_direction = ray_direction / np.linalg.norm(ray_direction)
-            color = ray_trace(sphere, LIGHT_POSITION, ray_origin, ray_direction)
-            image[y, x] = color
-
-    glDrawPixels(WIDTH, HEIGHT, GL_RGB, GL_FLOAT, image)
-    glutSwapBuffers()
+    profiler.begin_frame()
+    now = time.perf_counter()
+    with profiler.stage("physics"):
+        simulation.advance(0.0 if last_frame is None else now - last_frame)
+        simulation.interpolated(sphere.center[np.newaxis])
+    last_frame = now
+    ray_directions, image = ray_grids.get(WIDTH, HEIGHT)
+    with profiler.stage("trace"):
+        if frame_cache is not None:
+            # A unit is about half a pixel at the sphere's depth.
+            image = frame_cache.get((sphere.center, LIGHT_POSITION, (WIDTH, HEIGHT)),
+                                    lambda: quantize(ray_trace_frame(sphere, LIGHT_POSITION, ray_directions, image)))
+        else:
+            ray_trace_frame(sphere, LIGHT_POSITION, ray_directions, image)
+
+    with profiler.stage("glDrawPixels"):
+        glDrawPixels(WIDTH, HEIGHT, GL_RGB, GL_UNSIGNED_BYTE if image.dtype == np.uint8 else GL_FLOAT, image)
+    with profiler.stage("swap"):
+        glutSwapBuffers()
+    profiler.end_frame()
 
 def reshape(w, h):
     global WIDTH, HEIGHT
     WIDTH, HEIGHT = w, h
+    simulation.set_bounds(-h / 2, h / 2)
     glViewport(0, 0, w, h)
     glMatrixMode(GL_PROJECTION)
     glLoadIdentity()
     gluPerspective(45.0, float(w) / float(h), 0.1, 2000.0)
     glMatrixMode(GL_MODELVIEW)
 
+def keyboard(key, x, y):
+    global frame_cache
+    if key in (b"c", b"C"):
+        if frame_cache is None:
+            frame_cache = FrameCache(quantum=1.0)
+        else:
+            print(frame_cache.report())
+            frame_cache = None
+
 def main():
+    profiler.enable_from_env()
     glutInit()
     glutInitDisplayMode(GLUT_DOUBLE | GLUT_RGB | GLUT_DEPTH)
     glutInitWindowSize(WIDTH, HEIGHT)
@@ -87,7 +177,8 @@ def main():
     glutDisplayFunc(display)
     glutIdleFunc(display)
     glutReshapeFunc(reshape)
+    glutKeyboardFunc(keyboard)
     glutMainLoop()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
\ No newline at end of file
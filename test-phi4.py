@@ -1,3 +1,5 @@
+import argparse
+
 import numpy as np
 import pygame
 from pygame.locals import *
@@ -5,38 +7,43 @@ from OpenGL.GL import *
 from OpenGL.GLU import *
 from OpenGL.GLUT import *
 
+import profiler
+from physics import SphereSimulation
+
 WIDTH, HEIGHT = 320, 320
 SPHERE_RADIUS = 0.5
 SPHERE_POSITION = np.array([0.0, 0.0, -5.0])
 SPHERE_VELOCITY = np.array([0.0, 0.1, 0.0])
 GRAVITY = np.array([0.0, -0.01, 0.0])
+FLOOR = -2.0
 TIME_STEP = 0.05
 
-pygame.init()
-pygame.display.set_mode((WIDTH, HEIGHT), DOUBLEBUF | OPENGL)
+def make_simulation(positions, velocities, radii):
+    # SPHERE_VELOCITY and GRAVITY are per TIME_STEP; the simulation wants seconds.
+    return SphereSimulation(positions, velocities / TIME_STEP, radii, gravity=GRAVITY / TIME_STEP**2,
+                            floor=FLOOR, restitution=0.9, dt=TIME_STEP)
 
-glutInit()
+def drop_spheres(count, seed=0):
+    """`count` smaller spheres at rest at random places in view."""
+    rng = np.random.default_rng(seed)
+    positions = np.column_stack([rng.uniform(-2.5, 2.5, count), rng.uniform(-1.0, 2.5, count),
+                                 rng.uniform(-8.0, -3.0, count)])
+    return make_simulation(positions, np.zeros((count, 3)), SPHERE_RADIUS * rng.uniform(0.2, 0.6, count))
 
-gluPerspective(45, (WIDTH / HEIGHT), 0.1, 50.0)
-glTranslatef(0.0, 0.0, -5)
+simulation = make_simulation(SPHERE_POSITION, SPHERE_VELOCITY, SPHERE_RADIUS)
+positions = simulation.interpolated()
 
-pygame.display.set_caption("Phi-4")
-
-def draw_sphere(position):
+def draw_sphere(position, radius=SPHERE_RADIUS):
     """Draw a sphere at the given position."""
     glPushMatrix()
     glTranslatef(*position)
-    glutSolidSphere(SPHERE_RADIUS, 32, 32)
+    glutSolidSphere(radius, 32, 32)
     glPopMatrix()
 
-def update_sphere_position():
-    """Update the sphere's position based on velocity and gravity."""
-    global SPHERE_POSITION, SPHERE_VELOCITY
-    SPHERE_POSITION += SPHERE_VELOCITY
-    SPHERE_VELOCITY += GRAVITY
-    if SPHERE_POSITION[1] - SPHERE_RADIUS < -2.0:
-        SPHERE_POSITION[1] = 2.0 + SPHERE_RADIUS
-        SPHERE_VELOCITY[1] = -SPHERE_VELOCITY[1] * 0.9
+def update_sphere_position(elapsed=TIME_STEP):
+    """Advance the physics by `elapsed` seconds and interpolate the positions to draw."""
+    simulation.advance(elapsed)
+    simulation.interpolated(positions)
 
 def render_scene():
     """Render the scene with basic lighting."""
@@ -65,11 +72,34 @@ def render_scene():
     glMaterialfv(GL_FRONT, GL_SPECULAR, material_specular)
     glMaterialf(GL_FRONT, GL_SHININESS, material_shininess)
 
-    draw_sphere(SPHERE_POSITION)
+    with profiler.stage("draw"):
+        for position, radius in zip(positions, simulation.radii):
+            draw_sphere(position, radius)
 
-    pygame.display.flip()
+    with profiler.stage("flip"):
+        pygame.display.flip()
 
 def main():
+    global simulation, positions
+    parser = argparse.ArgumentParser(description="Phi-4 bouncing sphere")
+    parser.add_argument("--spheres", type=int, default=0,
+                        help="drop this many spheres instead of the single bouncing one")
+    args = parser.parse_args()
+    if args.spheres:
+        simulation = drop_spheres(args.spheres)
+        positions = simulation.interpolated()
+
+    profiler.enable_from_env()
+    pygame.init()
+    pygame.display.set_mode((WIDTH, HEIGHT), DOUBLEBUF | OPENGL)
+
+    glutInit()
+
+    gluPerspective(45, (WIDTH / HEIGHT), 0.1, 50.0)
+    glTranslatef(0.0, 0.0, -5)
+
+    pygame.display.set_caption("Phi-4")
+
     clock = pygame.time.Clock()
     while True:
         for event in pygame.event.get():
@@ -77,9 +107,13 @@ def main():
                 pygame.quit()
                 return
 
-        update_sphere_position()
+        # The physics keeps its own TIME_STEP; frames only sample it.
+        elapsed = clock.tick(60) / 1000
+        profiler.begin_frame()
+        with profiler.stage("physics"):
+            update_sphere_position(elapsed)
         render_scene()
-        clock.tick(1 / TIME_STEP)
+        profiler.end_frame()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
\ No newline at end of file